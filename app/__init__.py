@@ -5,6 +5,10 @@ from flask_cors import CORS
 from config import config
 from app.socket import socketio
 from app.extensions import db, migrate
+from app.services.socket_queue import socketio_queue_options
+from app.services.message_writer import message_writer
+from app.services.geocoding import geocoding_queue
+from app.services.outbox import outbox_dispatcher
 import logging
 
 def create_app(config_name='default'):
@@ -26,18 +30,36 @@ def create_app(config_name='default'):
     # Inicializar extensiones con la app
     db.init_app(app)
     migrate.init_app(app, db)
+    message_writer.init_app(app)
+    geocoding_queue.init_app(app)
+    outbox_dispatcher.init_app(app)
     CORS(app, resources={r"/*": {"origins": app.config['CORS_ORIGINS']}})
-    socketio.init_app(app, cors_allowed_origins="*")
+    socketio.init_app(app, cors_allowed_origins="*", **socketio_queue_options(app.config))
 
     # Importar modelos para que Alembic los vea y crear tablas si no existen
     with app.app_context():
-        from .models import user, event, indicativo, incident, incident_assignment, message
+        from .models import user, event, indicativo, incident, incident_assignment, message, indicativo_position, counter, geocode_cache, geocode_search_cache, outbox, presence_session
         db.create_all()
+        # Columnas opcionales del esquema: se inspeccionan una vez aquí y no en cada petición
+        from app.services import schema
+        schema.load()
     
     # Registrar blueprints
     from app.routes import main, auth, events
     app.register_blueprint(main.bp)
     app.register_blueprint(auth.bp)
     app.register_blueprint(events.bp)
-    
-    return app 
\ No newline at end of file
+
+    return app
+
+def start_background_tasks(app):
+    """
+    Arranca las tareas de fondo que entregan lo que quedó pendiente (outbox, geocodificación)
+    sin esperar a otra petición. Solo la llaman los puntos de entrada del servidor (run.py y
+    gunicorn.conf.py), no create_app: así los comandos de la CLI (flask db upgrade...) no las arrancan.
+    """
+    if not app.config['BACKGROUND_TASKS_ON_STARTUP']:
+        return
+    with app.app_context():
+        outbox_dispatcher.start()
+        geocoding_queue.start() 
\ No newline at end of file
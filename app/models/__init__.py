@@ -4,6 +4,12 @@ from .indicativo import Indicativo
 from .message import Message
 from .incident import Incident
 from .incident_assignment import IncidentAssignment
+from .indicativo_position import IndicativoPosition
+from .counter import Counter
+from .geocode_cache import GeocodeCacheEntry
+from .geocode_search_cache import GeocodeSearchCacheEntry
+from .outbox import OutboxEntry
+from .presence_session import PresenceSession
 
 __all__ = [
     'User',
@@ -11,5 +17,11 @@ __all__ = [
     'Indicativo',
     'Message',
     'Incident',
-    'IncidentAssignment'
+    'IncidentAssignment',
+    'IndicativoPosition',
+    'Counter',
+    'GeocodeCacheEntry',
+    'GeocodeSearchCacheEntry',
+    'OutboxEntry',
+    'PresenceSession'
 ] 
\ No newline at end of file
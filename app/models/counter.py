@@ -0,0 +1,7 @@
+from app.extensions import db
+
+class Counter(db.Model):
+    """Contadores con nombre que se incrementan de forma atómica (reservas de ids, numeraciones...)"""
+    __tablename__ = 'counters'
+    name = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
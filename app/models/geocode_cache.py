@@ -0,0 +1,9 @@
+from app.extensions import db
+from datetime import datetime
+
+class GeocodeCacheEntry(db.Model):
+    """Resultado de geocodificación inversa para unas coordenadas redondeadas (address NULL = sin dirección)"""
+    __tablename__ = 'geocode_cache'
+    key = db.Column(db.String(64), primary_key=True)  # 'lat,lng' redondeadas a GEOCODING_CACHE_PRECISION decimales
+    address = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
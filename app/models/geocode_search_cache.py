@@ -0,0 +1,10 @@
+from app.extensions import db
+from datetime import datetime
+
+class GeocodeSearchCacheEntry(db.Model):
+    """Resultados de una búsqueda de direcciones (JSON con la lista de {lat, lng, display_name})"""
+    __tablename__ = 'geocode_search_cache'
+    key = db.Column(db.String(64), primary_key=True)  # SHA-1 de proveedor, consulta normalizada, zona y límite
+    query = db.Column(db.String(500), nullable=False)
+    results = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
@@ -26,8 +26,14 @@ class Incident(db.Model):
     is_deleted = db.Column(db.Boolean, default=False, nullable=False)
     deleted_at = db.Column(db.DateTime, nullable=True)
 
+    # Seguimiento de cambios para el listado incremental (?since=): versión del evento en la
+    # que cambió por última vez el incidente o alguna de sus asignaciones, y cuándo
+    change_seq = db.Column(db.BigInteger, default=0, server_default=db.text('0'), nullable=False)
+    modified_at = db.Column(db.DateTime, nullable=True)
+
     __table_args__ = (
         db.UniqueConstraint('event_id', 'incident_number', name='uq_event_incident_number'),
+        db.Index('ix_incidents_event_id_change_seq', 'event_id', 'change_seq'),
     )
 
     assignments = db.relationship('IncidentAssignment', backref='incident', lazy=True) 
\ No newline at end of file
@@ -17,6 +17,10 @@ class IncidentAssignment(db.Model):
     fecha_en_lugar_asig = db.Column(db.DateTime, nullable=True)
     fecha_finalizado_asig = db.Column(db.DateTime, nullable=True)
 
+    # Versión del evento en la que cambió por última vez la asignación, y cuándo
+    change_seq = db.Column(db.BigInteger, default=0, server_default=db.text('0'), nullable=False)
+    modified_at = db.Column(db.DateTime, nullable=True)
+
     # Relación para acceder al objeto Indicativo desde la asignación
     # El backref en Indicativo se podría llamar 'incident_assignments'
     indicativo = db.relationship('Indicativo', backref=db.backref('incident_assignments', lazy='dynamic'))
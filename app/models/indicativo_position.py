@@ -0,0 +1,32 @@
+from app.extensions import db
+from datetime import datetime
+
+class IndicativoPosition(db.Model):
+    """Última posición conocida de cada indicativo en un evento (una fila por indicativo)"""
+    __tablename__ = 'indicativo_positions'
+    id = db.Column(db.Integer, primary_key=True)
+    event_id = db.Column(db.Integer, db.ForeignKey('events.id'), nullable=False)
+    indicativo_id = db.Column(db.Integer, db.ForeignKey('indicativos.id'), nullable=False)
+    lat = db.Column(db.Float, nullable=False)
+    lng = db.Column(db.Float, nullable=False)
+    message_id = db.Column(db.Integer, nullable=True)  # Mensaje de localización que originó la posición
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('event_id', 'indicativo_id', name='uq_event_indicativo_position'),
+    )
+
+    indicativo = db.relationship('Indicativo')
+
+    def to_dict(self):
+        return {
+            'event_id': self.event_id,
+            'indicativo_id': self.indicativo_id,
+            'indicativo': self.indicativo.indicativo if self.indicativo else None,
+            'nombre': self.indicativo.nombre if self.indicativo else None,
+            'indicativo_color': self.indicativo.color if self.indicativo and self.indicativo.color else None,
+            'lat': self.lat,
+            'lng': self.lng,
+            'message_id': self.message_id,
+            'timestamp': self.timestamp.strftime('%Y-%m-%d %H:%M:%S') if self.timestamp else None
+        }
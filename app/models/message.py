@@ -23,6 +23,10 @@ class JSONEncodedDict(TypeDecorator):
 
 class Message(db.Model):
     __tablename__ = 'messages'
+    __table_args__ = (
+        # Historial por evento paginado por id (ventana reciente y load_older_messages)
+        db.Index('ix_messages_event_id_id', 'event_id', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('events.id'), nullable=False)
@@ -36,15 +40,18 @@ class Message(db.Model):
     indicativo = db.relationship('Indicativo', backref=db.backref('messages', lazy=True), foreign_keys=[indicativo_id])
     to_indicativo = db.relationship('Indicativo', backref=db.backref('received_messages', lazy=True), foreign_keys=[to_indicativo_id])
     
-    def to_dict(self):
+    def to_dict(self, sender=None):
+        # sender: Indicativo.to_dict() del emisor, si ya se tiene, para no cargar la relación
+        if sender is None and self.indicativo:
+            sender = {'indicativo': self.indicativo.indicativo, 'nombre': self.indicativo.nombre, 'color': self.indicativo.color}
         return {
             'id': self.id,
             'event_id': self.event_id,
             'indicativo_id': self.indicativo_id,
             'to_indicativo_id': self.to_indicativo_id,
-            'indicativo': self.indicativo.indicativo if self.indicativo else None,
-            'nombre': self.indicativo.nombre if self.indicativo else None,
-            'indicativo_color': self.indicativo.color if self.indicativo and self.indicativo.color else None,
+            'indicativo': sender['indicativo'] if sender else None,
+            'nombre': sender['nombre'] if sender else None,
+            'indicativo_color': sender['color'] if sender and sender.get('color') else None,
             'content': self.content if isinstance(self.content, dict) else {},
             'timestamp': self.timestamp.strftime('%Y-%m-%d %H:%M:%S')
         } 
\ No newline at end of file
@@ -0,0 +1,23 @@
+from app.extensions import db
+from datetime import datetime
+
+class OutboxEntry(db.Model):
+    """
+    Efecto secundario pendiente (p. ej. mensajes automáticos de asignación), guardado en la misma
+    transacción que el cambio que lo origina y entregado por app/services/outbox.py
+    """
+    __tablename__ = 'outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # Tipo de entrega (manejador registrado)
+    event_id = db.Column(db.Integer, nullable=True)
+    payload = db.Column(db.Text, nullable=False)  # JSON con los datos que necesita el manejador
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending | failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # No antes de (reintentos)
+    locked_until = db.Column(db.DateTime, nullable=True)  # Reservada por un worker hasta
+    last_error = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_outbox_status_available_at', 'status', 'available_at'),
+    )
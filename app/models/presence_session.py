@@ -0,0 +1,21 @@
+from app.extensions import db
+from datetime import datetime
+
+class PresenceSession(db.Model):
+    """
+    Conexión Socket.IO de un indicativo a un evento (una fila por sesión), compartida por todos los
+    workers. El worker que tiene la conexión refresca seen_at; si deja de hacerlo, la sesión caduca.
+    """
+    __tablename__ = 'presence_sessions'
+    id = db.Column(db.Integer, primary_key=True)
+    sid = db.Column(db.String(64), nullable=False, unique=True)  # Sesión Socket.IO
+    worker = db.Column(db.String(100), nullable=False)  # host:pid del worker con la conexión
+    event_id = db.Column(db.Integer, nullable=False)
+    indicativo_id = db.Column(db.Integer, nullable=False)
+    encoding = db.Column(db.String(16), default='json', server_default='json', nullable=False)  # Codificación del chat (wire)
+    since = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    seen_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_presence_sessions_event_indicativo', 'event_id', 'indicativo_id'),
+    )
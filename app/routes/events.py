@@ -7,8 +7,13 @@ from app.routes.auth import token_required
 from app.models.indicativo import Indicativo
 from app.models.incident import Incident
 from app.models.incident_assignment import IncidentAssignment
+from app.services import event_versions, incident_numbers, model_cache, outbox, positions, presence, schema, wire
+from app.services import geocoding
+from app.services.geocoding import GeocodingError, geocoding_queue, get_address_from_coords
+from app.services.offline_geocoder import get_offline_geocoder
+from app.services.message_writer import message_writer
 from sqlalchemy import func
-import requests
+from sqlalchemy.exc import IntegrityError
 
 bp = Blueprint('events', __name__, url_prefix='/events')
 
@@ -66,6 +71,9 @@ def create_event():
         )
         db.session.add(evento)
         db.session.commit()
+        # Por si el id es el de un evento borrado que aún estuviera en la caché
+        model_cache.invalidate_event(evento.id)
+        model_cache.invalidate_indicativos(evento.id)
         return jsonify({'status': 'success', 'message': 'Evento creado exitosamente', 'event': evento.to_dict()}), 201
     except ValueError:
         return jsonify({'status': 'error', 'message': 'Formato de fecha inválido. Use: YYYY-MM-DD HH:MM:SS'}), 400
@@ -93,6 +101,7 @@ def update_event(event_id):
             event.zona_evento = data['zona_evento']
         
         db.session.commit()
+        model_cache.invalidate_event(event_id)
         
         return jsonify({
             'status': 'success',
@@ -110,8 +119,12 @@ def update_event(event_id):
 def delete_event(event_id):
     try:
         event = Event.query.get_or_404(event_id)
+        positions.delete_positions(event_id)
         db.session.delete(event)
         db.session.commit()
+        positions.invalidate_event(event_id)
+        model_cache.invalidate_event(event_id)
+        model_cache.invalidate_indicativos(event_id)
         
         return jsonify({
             'status': 'success',
@@ -128,6 +141,7 @@ def toggle_event(event_id):
         event = Event.query.get_or_404(event_id)
         event.activo = not event.activo
         db.session.commit()
+        model_cache.invalidate_event(event_id)
         return jsonify({
             'status': 'success',
             'message': 'Evento ' + ('activado' if event.activo else 'desactivado') + ' exitosamente',
@@ -137,11 +151,34 @@ def toggle_event(event_id):
         db.session.rollback()
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+def versioned_json(event_id, variant, build):
+    """
+    Respuesta JSON de un listado del evento con ETag según su versión (event_versions).
+    Si el cliente ya tiene esa versión (If-None-Match) se responde 304 sin consultar las tablas;
+    si no, se sirve la respuesta cacheada para esa versión o se construye con build(version).
+    """
+    version = event_versions.current(event_id)
+    tag = event_versions.etag(event_id, version, variant)
+    if request.if_none_match.contains(tag):
+        response = current_app.response_class(status=304)
+    else:
+        body = event_versions.get_response(event_id, version, variant)
+        if body is None:
+            body = jsonify(build(version)).get_data()
+            event_versions.store_response(event_id, version, variant, body)
+        response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(tag)
+    # Que el navegador revalide siempre: con la misma versión recibe un 304 sin cuerpo
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 # --- API de Indicativos ---
 @bp.route('/<int:event_id>/indicativos/api', methods=['GET'])
 def get_indicativos(event_id):
-    indicativos = Indicativo.query.filter_by(event_id=event_id).all()
-    return jsonify({'status': 'success', 'indicativos': [i.to_dict() for i in indicativos]})
+    def build(version):
+        indicativos = Indicativo.query.filter_by(event_id=event_id).all()
+        return {'status': 'success', 'version': version, 'indicativos': [i.to_dict() for i in indicativos]}
+    return versioned_json(event_id, 'indicativos', build)
 
 @bp.route('/<int:event_id>/indicativos/api', methods=['POST'])
 def create_indicativo(event_id):
@@ -157,7 +194,9 @@ def create_indicativo(event_id):
         event_id=event_id
     )
     db.session.add(indicativo)
+    event_versions.bump(event_id)
     db.session.commit()
+    model_cache.invalidate_indicativos(event_id)
     return jsonify({'status': 'success', 'indicativo': indicativo.to_dict()}), 201
 
 @bp.route('/<int:event_id>/indicativos/api/<int:indicativo_id>', methods=['PUT'])
@@ -176,16 +215,99 @@ def update_indicativo(event_id, indicativo_id):
         indicativo.fecha_fin = datetime.strptime(data['fecha_fin'], '%Y-%m-%d %H:%M:%S') if data['fecha_fin'] else None
     if 'color' in data:
         indicativo.color = data['color']
+    event_versions.bump(event_id)
     db.session.commit()
+    model_cache.invalidate_indicativos(event_id)
+    # El índice de posiciones guarda nombre y color del indicativo
+    positions.invalidate_event(event_id)
     return jsonify({'status': 'success', 'indicativo': indicativo.to_dict()})
 
 @bp.route('/<int:event_id>/indicativos/api/<int:indicativo_id>', methods=['DELETE'])
 def delete_indicativo(event_id, indicativo_id):
     indicativo = Indicativo.query.filter_by(id=indicativo_id, event_id=event_id).first_or_404()
+    positions.delete_positions(event_id, indicativo_id)
     db.session.delete(indicativo)
+    event_versions.bump(event_id)
     db.session.commit()
+    positions.invalidate_event(event_id)
+    model_cache.invalidate_indicativos(event_id)
     return jsonify({'status': 'success', 'message': 'Indicativo eliminado'})
 
+# --- Últimas posiciones conocidas ---
+@bp.route('/<int:event_id>/positions', methods=['GET'])
+def get_positions(event_id):
+    """Última posición conocida de cada indicativo del evento (para pintar el mapa)"""
+    Event.query.get_or_404(event_id)
+    return jsonify({'status': 'success', 'positions': positions.get_event_positions(event_id)})
+
+# --- Búsqueda de direcciones ---
+@bp.route('/<int:event_id>/geocode/search', methods=['GET'])
+def geocode_search(event_id):
+    """Coordenadas de una dirección (parámetro q), con caché compartida y priorizando la zona del evento"""
+    event = Event.query.get_or_404(event_id)
+    query = (request.args.get('q') or '').strip()
+    if not query:
+        return jsonify({'status': 'error', 'message': 'Falta la dirección a buscar (q)'}), 400
+    limit = request.args.get('limit', 5, type=int) or 5
+    limit = max(1, min(limit, current_app.config['GEOCODING_SEARCH_MAX_RESULTS']))
+    try:
+        results = geocoding.search(query, zona=event.zona_evento, limit=limit)
+    except GeocodingError as e:
+        current_app.logger.error(f"[GEOCODING] Error en la búsqueda de '{query}': {e}")
+        return jsonify({'status': 'error', 'message': 'Servicio de geocodificación no disponible'}), 502
+    return jsonify({'status': 'success', 'results': results})
+
+NEAREST_UNITS_MAX_K = 50
+
+def open_assignment_counts(event_id):
+    """Asignaciones abiertas (no finalizadas, de incidentes no eliminados) de cada indicativo del evento: {indicativo_id: n}"""
+    from sqlalchemy import text
+    rows = db.session.execute(
+        text("SELECT a.indicativo_id, COUNT(*) AS total FROM incident_assignments a "
+             "JOIN incidents i ON i.id = a.incident_id "
+             "WHERE i.event_id = :event_id AND i.is_deleted = :is_deleted AND a.indicativo_id > 0 "
+             "AND (a.estado_asignacion IS NULL OR a.estado_asignacion != 'finalizado') "
+             "GROUP BY a.indicativo_id"),
+        {'event_id': event_id, 'is_deleted': False}
+    ).fetchall()
+    return {row.indicativo_id: row.total for row in rows}
+
+@bp.route('/<int:event_id>/nearest_units', methods=['GET'])
+def get_nearest_units(event_id):
+    """
+    Indicativos más cercanos a (lat, lng) según su última posición conocida, de menor a mayor
+    distancia (hasta k, y a menos de max_distance metros si se indica), con sus asignaciones
+    abiertas y si están en línea. Con available=true solo los que no tienen asignaciones abiertas.
+    """
+    if not model_cache.get_event(event_id):
+        return jsonify({'status': 'error', 'message': 'Evento no encontrado'}), 404
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    if lat is None or lng is None:
+        return jsonify({'status': 'error', 'message': 'lat y lng son requeridos'}), 400
+    k = max(1, min(request.args.get('k', 5, type=int) or 5, NEAREST_UNITS_MAX_K))
+    max_distance = request.args.get('max_distance', type=float)
+    available_only = request.args.get('available', '').lower() in ('1', 'true')
+
+    open_counts = open_assignment_counts(event_id)
+    online = presence.get_online(event_id)
+    accept = (lambda position: not open_counts.get(position['indicativo_id'])) if available_only else None
+    units = []
+    for position, distance in positions.nearest(event_id, lat, lng, k, max_distance, accept):
+        unit = dict(position)
+        unit['distance_m'] = round(distance, 1)
+        unit['open_assignments'] = open_counts.get(position['indicativo_id'], 0)
+        unit['online'] = position['indicativo_id'] in online
+        units.append(unit)
+    return jsonify({'status': 'success', 'units': units})
+
+# --- Presencia ---
+@bp.route('/<int:event_id>/online', methods=['GET'])
+def get_online(event_id):
+    """Indicativos con una conexión Socket.IO abierta en el evento"""
+    Event.query.get_or_404(event_id)
+    return jsonify({'status': 'success', 'indicativos': presence.describe_online(event_id)})
+
 @bp.route('/<int:event_id>/control')
 def event_control(event_id):
     event = Event.query.get_or_404(event_id)
@@ -201,45 +323,106 @@ def event_callsigns(event_id):
 
 # --- INCIDENTES ---
 
-def get_address_from_coords(lat, lng):
-    if lat is None or lng is None:
-        return None
-    try:
-        # Usar el user-agent es una buena práctica y a veces requerido por Nominatim
-        headers = {
-            'User-Agent': 'RCQEventsServer/1.0 (contacto@tuemail.com)' # Cambia esto por tu app y email
-        }
-        url = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={lat}&lon={lng}&zoom=18&addressdetails=1"
-        response = requests.get(url, headers=headers, timeout=5) # Timeout de 5 segundos
-        response.raise_for_status() # Lanza error para respuestas 4xx/5xx
-        data = response.json()
-        address = data.get('address')
-        if address:
-            road = address.get('road', '')
-            house_number = address.get('house_number', '')
-            city = address.get('city', address.get('town', address.get('village', '')))
-            
-            display_address = road
-            if house_number:
-                display_address += f", {house_number}"
-            # if city:
-            #     display_address += f" - {city}" # Opcional: añadir ciudad
-            return display_address if display_address else data.get('display_name')
-        return data.get('display_name') # Fallback al display_name completo
-    except requests.exceptions.RequestException as e:
-        current_app.logger.error(f"Error en geocodificación inversa: {e}")
-        return None
-    except Exception as e:
-        current_app.logger.error(f"Error inesperado en geocodificación inversa: {e}")
-        return None
-
 def update_incident_address(incident):
-    """Actualiza la dirección formateada del incidente basándose en sus coordenadas"""
+    """
+    Actualiza la dirección formateada del incidente basándose en sus coordenadas. Con
+    geocodificación asíncrona la deja vacía y devuelve True: tras el commit hay que llamar a
+    schedule_incident_address() para que se rellene en segundo plano. Con extracto local la
+    dirección se calcula al momento (sin llamada remota).
+    """
     if incident.lat is not None and incident.lng is not None:
+        if geocoding_queue.enabled() and get_offline_geocoder() is None:
+            incident.direccion_formateada = None
+            return True
         address = get_address_from_coords(incident.lat, incident.lng)
         incident.direccion_formateada = address
     else:
         incident.direccion_formateada = None
+    return False
+
+def schedule_incident_address(incident):
+    """Encola la geocodificación de un incidente ya guardado"""
+    geocoding_queue.enqueue(incident.id, incident.lat, incident.lng)
+
+def apply_incident_address(incident_id, lat, lng, address):
+    """
+    Guarda la dirección obtenida en segundo plano y la notifica con incident_updated. Si las
+    coordenadas del incidente han cambiado desde que se encoló, el resultado ya no vale.
+    """
+    incident = Incident.query.get(incident_id)
+    if incident is None or incident.lat != lat or incident.lng != lng:
+        return
+    if address is None or incident.direccion_formateada == address:
+        return
+    incident.direccion_formateada = address
+    mark_incident_changed(incident)
+    db.session.commit()
+    emit_incident_event(incident.event_id, 'incident_updated', {'incident': incident_to_dict(incident), 'version': incident.change_seq})
+
+def mark_incident_changed(incident):
+    """Sube la versión del evento y la anota en el incidente (el commit lo hace el llamador)"""
+    incident.change_seq = event_versions.bump(incident.event_id)
+    incident.modified_at = datetime.utcnow()
+
+def mark_assignment_changed(event_id, incident_id, assignment_id=None, existing_columns=()):
+    """
+    Sube la versión del evento por un cambio en las asignaciones de un incidente. La anota en el
+    incidente (el listado incremental lo vuelve a enviar con todas sus asignaciones, así que las
+    asignaciones borradas desaparecen) y en la asignación si se indica y tiene esas columnas.
+    """
+    assignment_ids = [assignment_id] if assignment_id is not None else []
+    return mark_assignments_changed(event_id, incident_id, assignment_ids, existing_columns)
+
+def mark_assignments_changed(event_id, incident_id, assignment_ids, existing_columns=()):
+    """Como mark_assignment_changed para varias asignaciones del mismo incidente (una sola versión)"""
+    from sqlalchemy import bindparam, text, update
+    version = event_versions.bump(event_id)
+    now = datetime.utcnow()
+    db.session.execute(
+        update(Incident).where(Incident.id == incident_id).values(change_seq=version, modified_at=now)
+    )
+    if assignment_ids and 'change_seq' in existing_columns:
+        db.session.execute(
+            text("UPDATE incident_assignments SET change_seq = :version, modified_at = :now WHERE id IN :assignment_ids")
+            .bindparams(bindparam('assignment_ids', expanding=True)),
+            {'version': version, 'now': now, 'assignment_ids': list(assignment_ids)}
+        )
+    return version
+
+def emit_incident_event(event_id, name, payload):
+    """Emite un cambio de incidentes/asignaciones a la sala del evento (todas las consolas conectadas)"""
+    from app.socket import socketio
+    socketio.emit(name, payload, room=f'event_{event_id}')
+
+def emit_assignment_changed(event_id, incident_id, action, assignment_id, version, assignment_ids=None):
+    """
+    assignment_changed con el incidente completo (todas sus asignaciones actuales) para sustituirlo
+    en la lista. Un cambio de varias asignaciones a la vez pasa todos sus ids en `assignment_ids`
+    (y assignment_id=None si son más de una).
+    """
+    incident = Incident.query.get(incident_id)
+    if incident is None:
+        return
+    if assignment_ids is None:
+        assignment_ids = [assignment_id] if assignment_id is not None else []
+    emit_incident_event(event_id, 'assignment_changed', {
+        'action': action,
+        'incident_id': incident_id,
+        'assignment_id': assignment_id,
+        'assignment_ids': list(assignment_ids),
+        'incident': incident_to_dict(incident),
+        'version': version
+    })
+
+def incident_tombstone(incident):
+    """Representación mínima de un incidente eliminado (borrado lógico)"""
+    return {
+        'id': incident.id,
+        'incident_number': incident.incident_number,
+        'is_deleted': True,
+        'deleted_at': incident.deleted_at.strftime('%Y-%m-%d %H:%M:%S') if incident.deleted_at else None,
+        'change_seq': incident.change_seq
+    }
 
 # Cache temporal para mantener el texto libre de asignaciones cuando servicio_nombre no está disponible
 # Formato: {assignment_id: texto_libre}
@@ -258,9 +441,8 @@ def load_assignment_text_cache():
     try:
         from sqlalchemy import text
         
-        # Verificar qué columnas existen en la tabla
-        columns_query = db.session.execute(text("PRAGMA table_info(incident_assignments)")).fetchall()
-        existing_columns = [col[1] for col in columns_query]
+        # Columnas de la tabla según el registro de esquema (inspeccionado una vez por proceso)
+        existing_columns = schema.assignment_columns()
         
         # Si la columna servicio_nombre existe, cargar todas las asignaciones de texto libre
         if 'servicio_nombre' in existing_columns:
@@ -278,10 +460,11 @@ def load_assignment_text_cache():
     except Exception as e:
         current_app.logger.error(f"[CACHE] Error al cargar cache inicial: {e}")
 
-def get_assignment_display_name(assignment_data, event_id=None):
+def get_assignment_display_name(assignment_data, event_id=None, indicativos=None):
     """
     Determina el nombre a mostrar para una asignación de manera robusta.
     Maneja casos donde servicio_nombre puede no estar disponible por problemas de esquema.
+    Con `indicativos` ({id: Indicativo} ya cargados, carga por lotes) no se hace ninguna consulta.
     """
     # Cargar cache si no se ha hecho aún
     load_assignment_text_cache()
@@ -297,7 +480,7 @@ def get_assignment_display_name(assignment_data, event_id=None):
     # Si es un indicativo válido del evento (ID > 0), buscar su información
     if indicativo_id and indicativo_id > 0:
         try:
-            indicativo = Indicativo.query.get(indicativo_id)
+            indicativo = indicativos.get(indicativo_id) if indicativos is not None else Indicativo.query.get(indicativo_id)
             if indicativo:
                 return f"{indicativo.indicativo} ({indicativo.nombre})" if indicativo.nombre else indicativo.indicativo
             else:
@@ -310,17 +493,16 @@ def get_assignment_display_name(assignment_data, event_id=None):
         # Primero, verificar si tenemos el texto en el cache
         if assignment_id and assignment_id in assignment_text_cache:
             return assignment_text_cache[assignment_id]
+        if indicativos is not None:
+            # Carga por lotes: la fila ya traía servicio_nombre (vacío), no hay nada más que consultar
+            return f"Asignación personalizada #{assignment_id}" if assignment_id else "Asignación personalizada"
         
         # Intentar recuperar el valor original desde la base de datos
         try:
             from sqlalchemy import text
             if assignment_id:
-                # Verificar qué columnas existen en la tabla
-                columns_query = db.session.execute(text("PRAGMA table_info(incident_assignments)")).fetchall()
-                existing_columns = [col[1] for col in columns_query]
-                
                 # Si la columna servicio_nombre existe, intentar obtenerla
-                if 'servicio_nombre' in existing_columns:
+                if schema.has_column(schema.ASSIGNMENTS_TABLE, 'servicio_nombre'):
                     result = db.session.execute(
                         text("SELECT servicio_nombre FROM incident_assignments WHERE id = :assignment_id"),
                         {"assignment_id": assignment_id}
@@ -345,48 +527,84 @@ def get_assignment_display_name(assignment_data, event_id=None):
     # Caso por defecto
     return "Asignación sin nombre"
 
-def incident_to_dict(incident, fetch_address=False):
-    # Usar SQL directo para cargar asignaciones para evitar problemas de esquema
+def assignment_row_to_dict(assignment):
+    """Diccionario básico de una fila de incident_assignments leída con SQL directo (sin indicativo_nombre)"""
+    # Crear diccionario básico
+    assignment_dict = {
+        'id': assignment.id,
+        'incident_id': assignment.incident_id,
+        'indicativo_id': assignment.indicativo_id,
+        'estado_asignacion': assignment.estado_asignacion,
+        'fecha_creacion_asignacion': assignment.fecha_creacion_asignacion if isinstance(assignment.fecha_creacion_asignacion, str) else (assignment.fecha_creacion_asignacion.strftime('%Y-%m-%d %H:%M:%S') if assignment.fecha_creacion_asignacion else None),
+    }
+    
+    # Intentar obtener servicio_nombre si existe la columna
+    try:
+        assignment_dict['servicio_nombre'] = getattr(assignment, 'servicio_nombre', None)
+    except:
+        assignment_dict['servicio_nombre'] = None
+    
+    # Intentar obtener fechas adicionales si existen
+    for field in ['fecha_pre_avisado_asig', 'fecha_avisado_asig', 'fecha_en_camino_asig', 'fecha_en_lugar_asig', 'fecha_finalizado_asig']:
+        try:
+            value = getattr(assignment, field, None)
+            if value:
+                if isinstance(value, str):
+                    assignment_dict[field] = value
+                else:
+                    assignment_dict[field] = value.strftime('%Y-%m-%d %H:%M:%S')
+            else:
+                assignment_dict[field] = None
+        except:
+            assignment_dict[field] = None
+    return assignment_dict
+
+ASSIGNMENT_LOAD_CHUNK = 900
+
+def load_incident_assignments(incident_ids):
+    """
+    Carga en una sola consulta (por cada 900 incidentes) las asignaciones de varios incidentes y, en otra, los indicativos
+    a los que hacen referencia. Devuelve ({incident_id: [assignment_dict]}, {indicativo_id: Indicativo}).
+    """
+    from sqlalchemy import bindparam, text
+    by_incident = {incident_id: [] for incident_id in incident_ids}
+    if not incident_ids:
+        return by_incident, {}
+    query = text("SELECT * FROM incident_assignments WHERE incident_id IN :incident_ids ORDER BY id").bindparams(
+        bindparam('incident_ids', expanding=True))
+    incident_ids = list(incident_ids)
+    # En tramos para no superar el límite de parámetros de SQLite en eventos muy grandes
+    for start in range(0, len(incident_ids), ASSIGNMENT_LOAD_CHUNK):
+        rows = db.session.execute(query, {"incident_ids": incident_ids[start:start + ASSIGNMENT_LOAD_CHUNK]}).fetchall()
+        for row in rows:
+            by_incident.setdefault(row.incident_id, []).append(assignment_row_to_dict(row))
+    indicativo_ids = {a['indicativo_id'] for assignments in by_incident.values() for a in assignments
+                      if a['indicativo_id'] and a['indicativo_id'] > 0 and not a['servicio_nombre']}
+    indicativos = {}
+    if indicativo_ids:
+        indicativos = {ind.id: ind for ind in Indicativo.query.filter(Indicativo.id.in_(indicativo_ids)).all()}
+    return by_incident, indicativos
+
+def incident_to_dict(incident, fetch_address=False, assignments=None, indicativos=None):
+    """
+    Diccionario del incidente con sus asignaciones. Si se pasan `assignments` (diccionarios de
+    assignment_row_to_dict) e `indicativos` ya cargados por load_incident_assignments, no se
+    hace ninguna consulta; si no, se cargan las asignaciones de este incidente.
+    """
     assignments_data = []
     try:
-        from sqlalchemy import text
-        assignments = db.session.execute(
-            text("SELECT * FROM incident_assignments WHERE incident_id = :incident_id"),
-            {"incident_id": incident.id}
-        ).fetchall()
+        if assignments is None:
+            # Usar SQL directo para cargar asignaciones para evitar problemas de esquema
+            from sqlalchemy import text
+            rows = db.session.execute(
+                text("SELECT * FROM incident_assignments WHERE incident_id = :incident_id"),
+                {"incident_id": incident.id}
+            ).fetchall()
+            assignments = [assignment_row_to_dict(row) for row in rows]
         
-        for assignment in assignments:
-            # Crear diccionario básico
-            assignment_dict = {
-                'id': assignment.id,
-                'incident_id': assignment.incident_id,
-                'indicativo_id': assignment.indicativo_id,
-                'estado_asignacion': assignment.estado_asignacion,
-                'fecha_creacion_asignacion': assignment.fecha_creacion_asignacion if isinstance(assignment.fecha_creacion_asignacion, str) else (assignment.fecha_creacion_asignacion.strftime('%Y-%m-%d %H:%M:%S') if assignment.fecha_creacion_asignacion else None),
-            }
-            
-            # Intentar obtener servicio_nombre si existe la columna
-            try:
-                assignment_dict['servicio_nombre'] = getattr(assignment, 'servicio_nombre', None)
-            except:
-                assignment_dict['servicio_nombre'] = None
-            
-            # Intentar obtener fechas adicionales si existen
-            for field in ['fecha_pre_avisado_asig', 'fecha_avisado_asig', 'fecha_en_camino_asig', 'fecha_en_lugar_asig', 'fecha_finalizado_asig']:
-                try:
-                    value = getattr(assignment, field, None)
-                    if value:
-                        if isinstance(value, str):
-                            assignment_dict[field] = value
-                        else:
-                            assignment_dict[field] = value.strftime('%Y-%m-%d %H:%M:%S')
-                    else:
-                        assignment_dict[field] = None
-                except:
-                    assignment_dict[field] = None
-            
+        for assignment_dict in assignments:
             # Determinar el nombre a mostrar usando función auxiliar
-            assignment_dict['indicativo_nombre'] = get_assignment_display_name(assignment_dict, incident.event_id)
+            assignment_dict['indicativo_nombre'] = get_assignment_display_name(assignment_dict, incident.event_id, indicativos)
             
             assignments_data.append(assignment_dict)
     except Exception as e:
@@ -413,6 +631,8 @@ def incident_to_dict(incident, fetch_address=False):
         'fecha_finalizado': incident.fecha_finalizado.strftime('%Y-%m-%d %H:%M:%S') if incident.fecha_finalizado else None,
         'is_deleted': incident.is_deleted,
         'deleted_at': incident.deleted_at.strftime('%Y-%m-%d %H:%M:%S') if incident.deleted_at else None,
+        'change_seq': incident.change_seq,
+        'modified_at': incident.modified_at.strftime('%Y-%m-%d %H:%M:%S') if incident.modified_at else None,
         'assignments': assignments_data
     }
     return data
@@ -465,29 +685,74 @@ def assignment_to_dict(a, event_id=None):
             'fecha_finalizado_asig': None,
         }
 
+def incidents_to_dicts(incidents):
+    """Lista de incidentes con sus asignaciones en dos consultas en total (asignaciones e indicativos)"""
+    assignments, indicativos = load_incident_assignments([i.id for i in incidents])
+    # No hacemos fetch_address para la lista completa por defecto para evitar muchas llamadas API
+    return [incident_to_dict(i, fetch_address=False, assignments=assignments.get(i.id, []), indicativos=indicativos)
+            for i in incidents]
+
 @bp.route('/<int:event_id>/incidents', methods=['GET'])
 def get_incidents(event_id):
     include_deleted_str = request.args.get('include_deleted', 'false').lower()
     include_deleted = include_deleted_str == 'true'
 
+    since = request.args.get('since')
+    if since and since != '0':
+        return get_incidents_since(event_id, since, include_deleted)
+
+    def build(version):
+        query = Incident.query.filter_by(event_id=event_id)
+        if not include_deleted:
+            query = query.filter_by(is_deleted=False)
+        
+        incidents = query.order_by(Incident.incident_number.asc()).all()
+        return {'status': 'success', 'version': version, 'incidents': incidents_to_dicts(incidents)}
+    return versioned_json(event_id, 'incidents-all' if include_deleted else 'incidents', build)
+
+def get_incidents_since(event_id, since, include_deleted=False):
+    """
+    Listado incremental: incidentes creados o modificados (ellos o sus asignaciones) desde
+    `since`, que puede ser una versión del evento (la 'version' de una respuesta anterior) o una
+    fecha '%Y-%m-%d %H:%M:%S' (UTC). Cada incidente va con todas sus asignaciones actuales; los
+    eliminados (borrado lógico) van en 'tombstones' salvo con include_deleted=true.
+    """
+    version = event_versions.current(event_id)
     query = Incident.query.filter_by(event_id=event_id)
-    if not include_deleted:
-        query = query.filter_by(is_deleted=False)
-    
+    try:
+        since_version = int(since)
+        if since_version >= version:
+            # El cliente ya está al día: no hace falta consultar los incidentes
+            return jsonify({'status': 'success', 'version': version, 'since': since, 'incidents': [], 'tombstones': []})
+        query = query.filter(Incident.change_seq > since_version)
+    except ValueError:
+        try:
+            since_date = datetime.strptime(since, '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'since debe ser una versión o una fecha con formato %Y-%m-%d %H:%M:%S'}), 400
+        # Los incidentes anteriores al seguimiento de cambios no tienen modified_at
+        query = query.filter(func.coalesce(Incident.modified_at, Incident.fecha_creacion) > since_date)
+
     incidents = query.order_by(Incident.incident_number.asc()).all()
-    # No hacemos fetch_address para la lista completa por defecto para evitar muchas llamadas API
-    return jsonify({'status': 'success', 'incidents': [incident_to_dict(i, fetch_address=False) for i in incidents]})
+    tombstones = []
+    if not include_deleted:
+        tombstones = [incident_tombstone(i) for i in incidents if i.is_deleted]
+        incidents = [i for i in incidents if not i.is_deleted]
+    return jsonify({
+        'status': 'success',
+        'version': version,
+        'since': since,
+        'incidents': incidents_to_dicts(incidents),
+        'tombstones': tombstones
+    })
 
 @bp.route('/<int:event_id>/incidents', methods=['POST'])
 def create_incident(event_id):
     data = request.get_json()
-    # Calcular el siguiente incident_number para el evento
-    max_num = db.session.query(func.max(Incident.incident_number)).filter_by(event_id=event_id).scalar() or 0
     now = datetime.utcnow()
     nuevo_estado = data.get('estado', 'activo')
     incident = Incident(
         event_id=event_id,
-        incident_number=max_num + 1,
         estado=nuevo_estado,
         reportado_por=data.get('reportado_por'),
         tipo=data.get('tipo'),
@@ -505,11 +770,28 @@ def create_incident(event_id):
     elif nuevo_estado == 'solucionado': incident.fecha_finalizado = now
 
     # Actualizar dirección si hay coordenadas
-    update_incident_address(incident)
+    geocode_later = update_incident_address(incident)
 
-    db.session.add(incident)
-    db.session.commit()
-    return jsonify({'status': 'success', 'incident': incident_to_dict(incident)})
+    # Número y versión al final, justo antes del commit, para bloquear los contadores lo mínimo
+    for attempt in range(incident_numbers.MAX_ATTEMPTS):
+        incident.incident_number = incident_numbers.allocate(event_id, resync=attempt > 0)
+        mark_incident_changed(incident)
+        db.session.add(incident)
+        try:
+            db.session.commit()
+            break
+        except IntegrityError as e:
+            db.session.rollback()
+            if not incident_numbers.is_conflict(e) or attempt == incident_numbers.MAX_ATTEMPTS - 1:
+                raise
+            current_app.logger.warning(
+                f"[INCIDENTS] Número {incident.incident_number} ya usado en el evento {event_id}, se reintenta"
+            )
+    if geocode_later:
+        schedule_incident_address(incident)
+    incident_dict = incident_to_dict(incident)
+    emit_incident_event(event_id, 'incident_created', {'incident': incident_dict, 'version': incident.change_seq})
+    return jsonify({'status': 'success', 'incident': incident_dict})
 
 @bp.route('/<int:event_id>/incidents/<int:incident_id>', methods=['GET'])
 def get_incident(event_id, incident_id):
@@ -517,13 +799,54 @@ def get_incident(event_id, incident_id):
     # Hacemos fetch_address aquí porque es para un solo incidente (ej. para editar)
     return jsonify({'status': 'success', 'incident': incident_to_dict(incident, fetch_address=True)})
 
+# Estado al que pasan las asignaciones abiertas de un incidente cuando este cambia a cada estado
+INCIDENT_STATUS_CASCADES = {
+    'solucionado': 'finalizado'
+}
+
+def cascade_incident_status(incident, now):
+    """
+    Aplica a las asignaciones del incidente la regla en cascada de su estado actual, si la hay:
+    las que no están ya en el estado destino pasan a él con su fecha. Usa la versión que
+    mark_incident_changed dejó en el incidente (llamar antes). Devuelve los ids cambiados; el
+    commit lo hace el llamador.
+    """
+    from sqlalchemy import bindparam, text
+    estado_asignacion = INCIDENT_STATUS_CASCADES.get(incident.estado)
+    if estado_asignacion is None:
+        return []
+    assignment_ids = [row.id for row in db.session.execute(
+        text("SELECT id FROM incident_assignments WHERE incident_id = :incident_id "
+             "AND (estado_asignacion IS NULL OR estado_asignacion != :estado)"),
+        {'incident_id': incident.id, 'estado': estado_asignacion}
+    ).fetchall()]
+    if not assignment_ids:
+        return []
+    existing_columns = schema.assignment_columns()
+    update_parts = ['estado_asignacion = :estado']
+    params = {'estado': estado_asignacion, 'assignment_ids': assignment_ids}
+    fecha_column = ASSIGNMENT_STATUS_DATE_COLUMNS.get(estado_asignacion)
+    if fecha_column and fecha_column in existing_columns:
+        update_parts.append(f'{fecha_column} = :now')
+        params['now'] = now
+    if 'change_seq' in existing_columns:
+        update_parts.extend(['change_seq = :version', 'modified_at = :now'])
+        params.update(version=incident.change_seq, now=now)
+    db.session.execute(
+        text(f"UPDATE incident_assignments SET {', '.join(update_parts)} WHERE id IN :assignment_ids")
+        .bindparams(bindparam('assignment_ids', expanding=True)),
+        params
+    )
+    return assignment_ids
+
 @bp.route('/<int:event_id>/incidents/<int:incident_id>', methods=['PUT'])
 def update_incident(event_id, incident_id):
     incident = Incident.query.filter_by(event_id=event_id, id=incident_id).first_or_404()
     data = request.get_json()
     now = datetime.utcnow()
 
-    if 'estado' in data and data['estado'] != incident.estado:
+    estado_changed = 'estado' in data and data['estado'] != incident.estado
+    if estado_changed:
         nuevo_estado = data['estado']
         if nuevo_estado == 'pre-incidente': incident.fecha_pre_activado = now
         elif nuevo_estado == 'activo': incident.fecha_activado = now
@@ -546,11 +869,23 @@ def update_incident(event_id, incident_id):
             setattr(incident, field, data[field])
     
     # Actualizar dirección si las coordenadas cambiaron
+    geocode_later = False
     if coords_changed:
-        update_incident_address(incident)
+        geocode_later = update_incident_address(incident)
     
+    mark_incident_changed(incident)
+    # Reglas en cascada del nuevo estado (p. ej. solucionado finaliza las asignaciones abiertas),
+    # en la misma transacción y con la misma versión que el incidente
+    cascaded = []
+    if estado_changed and data.get('cascade', True):
+        cascaded = cascade_incident_status(incident, now)
     db.session.commit()
-    return jsonify({'status': 'success', 'incident': incident_to_dict(incident)})
+    if geocode_later:
+        schedule_incident_address(incident)
+    incident_dict = incident_to_dict(incident)
+    # Un solo aviso: el incidente lleva todas sus asignaciones, también las cambiadas en cascada
+    emit_incident_event(event_id, 'incident_updated', {'incident': incident_dict, 'version': incident.change_seq})
+    return jsonify({'status': 'success', 'incident': incident_dict, 'cascaded_assignments': cascaded})
 
 @bp.route('/<int:event_id>/incidents/<int:incident_id>', methods=['DELETE'])
 def delete_incident(event_id, incident_id):
@@ -558,7 +893,9 @@ def delete_incident(event_id, incident_id):
     # Se marca como eliminado en lugar de borrarlo físicamente
     incident.is_deleted = True
     incident.deleted_at = datetime.utcnow()
+    mark_incident_changed(incident)
     db.session.commit()
+    emit_incident_event(event_id, 'incident_deleted', {'incident': incident_tombstone(incident), 'version': incident.change_seq})
     return jsonify({'status': 'success', 'message': 'Incidente marcado como eliminado'})
 
 @bp.route('/<int:event_id>/incidents/<int:incident_id>/restore', methods=['POST'])
@@ -568,8 +905,11 @@ def restore_incident(event_id, incident_id):
     )
     incident.is_deleted = False
     incident.deleted_at = None
+    mark_incident_changed(incident)
     db.session.commit()
-    return jsonify({'status': 'success', 'message': 'Incidente restaurado', 'incident': incident_to_dict(incident)})
+    incident_dict = incident_to_dict(incident)
+    emit_incident_event(event_id, 'incident_updated', {'incident': incident_dict, 'version': incident.change_seq})
+    return jsonify({'status': 'success', 'message': 'Incidente restaurado', 'incident': incident_dict})
 
 @bp.route('/<int:event_id>/incidents/<int:incident_id>/get_address_only', methods=['GET'])
 def get_incident_address_only(event_id, incident_id):
@@ -652,6 +992,179 @@ def get_incident_assignments(event_id, incident_id):
         current_app.logger.error(f"Error general en get_incident_assignments: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+# Columna con la fecha de cada estado de asignación
+ASSIGNMENT_STATUS_DATE_COLUMNS = {
+    'pre-avisado': 'fecha_pre_avisado_asig',
+    'avisado': 'fecha_avisado_asig',
+    'en camino': 'fecha_en_camino_asig',
+    'en el lugar': 'fecha_en_lugar_asig',
+    'finalizado': 'fecha_finalizado_asig'
+}
+
+def insert_assignment(incident_id, indicativo_id, servicio_nombre, estado_asignacion, now, existing_columns):
+    """
+    Inserta una asignación con SQL directo, solo con las columnas que existen en la tabla, y
+    devuelve su id. El commit lo hace el llamador.
+    """
+    from sqlalchemy import text
+    base_columns = ['incident_id', 'estado_asignacion', 'fecha_creacion_asignacion', 'indicativo_id']
+    base_values = [incident_id, estado_asignacion, now, indicativo_id]
+
+    # Agregar servicio_nombre si la columna existe
+    if 'servicio_nombre' in existing_columns and servicio_nombre:
+        base_columns.append('servicio_nombre')
+        base_values.append(servicio_nombre)
+
+    # Agregar fecha de estado específica si la columna existe
+    fecha_column = ASSIGNMENT_STATUS_DATE_COLUMNS.get(estado_asignacion)
+    if fecha_column and fecha_column in existing_columns:
+        base_columns.append(fecha_column)
+        base_values.append(now)
+
+    columns_str = ', '.join(base_columns)
+    placeholders = ', '.join([':param' + str(i) for i in range(len(base_values))])
+    insert_query = f"INSERT INTO incident_assignments ({columns_str}) VALUES ({placeholders})"
+    params = {f'param{i}': value for i, value in enumerate(base_values)}
+    # lastrowid no da el id en PostgreSQL: RETURNING donde el motor lo admite (SQLite desde 3.35)
+    if db.session.get_bind().dialect.insert_returning:
+        return db.session.execute(text(insert_query + " RETURNING id"), params).scalar_one()
+    return db.session.execute(text(insert_query), params).lastrowid
+
+def created_assignment_to_dict(assignment_id, incident_id, indicativo_id, servicio_nombre, estado_asignacion, now,
+                               existing_columns, event_id, indicativo=None):
+    """
+    Respuesta de una asignación recién creada (sin volver a leerla de la base de datos).
+    `indicativo` es el indicativo del evento asignado (dict de model_cache), si lo es.
+    """
+    assignment_dict = {
+        'id': assignment_id,
+        'incident_id': incident_id,
+        'indicativo_id': indicativo_id,
+        'servicio_nombre': servicio_nombre if 'servicio_nombre' in existing_columns else None,
+        'estado_asignacion': estado_asignacion,
+        'fecha_creacion_asignacion': now.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    # Agregar fechas de estado
+    for estado, fecha_col in ASSIGNMENT_STATUS_DATE_COLUMNS.items():
+        if estado == estado_asignacion and fecha_col in existing_columns:
+            assignment_dict[fecha_col] = now.strftime('%Y-%m-%d %H:%M:%S')
+        else:
+            assignment_dict[fecha_col] = None
+    # Determinar el nombre a mostrar usando función auxiliar
+    if indicativo is not None:
+        assignment_dict['indicativo_nombre'] = model_cache.display_name(indicativo)
+    else:
+        assignment_dict['indicativo_nombre'] = get_assignment_display_name(assignment_dict, event_id)
+    return assignment_dict
+
+def service_message_content(incident):
+    """Contenido del mensaje assign_service que recibe un indicativo al asignarle el incidente"""
+    # Construir la descripción del servicio con información del incidente
+    service_description = f"🚨 INCIDENTE #{incident.incident_number}: {incident.tipo}"
+
+    # Añadir dorsal si es asistencia médica
+    if incident.tipo == '🚑 Asistencia Médica' and incident.dorsal:
+        service_description += f" (Dorsal: {incident.dorsal})"
+
+    # Añadir descripción del incidente si existe
+    if incident.descripcion:
+        service_description += f"\n📝 Descripción: {incident.descripcion}"
+
+    # Añadir información adicional de ubicación si existe
+    if incident.info_ubicacion:
+        service_description += f"\n📍 Ubicación: {incident.info_ubicacion}"
+
+    # Añadir dirección formateada si existe
+    if incident.direccion_formateada:
+        service_description += f"\n🗺️ Dirección: {incident.direccion_formateada}"
+
+    # Añadir patología si es asistencia médica y existe
+    if incident.tipo == '🚑 Asistencia Médica' and incident.patologia:
+        service_description += f"\n🏥 Patología: {incident.patologia}"
+
+    # Añadir reportado por si existe
+    if incident.reportado_por:
+        service_description += f"\n👤 Reportado por: {incident.reportado_por}"
+
+    # Añadir estado del incidente
+    service_description += f"\n📊 Estado: {incident.estado}"
+
+    message_content = {
+        'type': 'assign_service',
+        'text': service_description
+    }
+    # Añadir coordenadas si están disponibles
+    if incident.lat is not None and incident.lng is not None:
+        message_content['lat'] = incident.lat
+        message_content['lng'] = incident.lng
+    else:
+        # Si no hay coordenadas, añadir nota al mensaje
+        message_content['text'] += f"\n⚠️ Sin coordenadas GPS disponibles"
+    return message_content
+
+def find_assigning_indicativo(event_id, assigned_by_indicativo_id):
+    """
+    Emisor de los mensajes automáticos de asignación (dict de model_cache): el indicativo que
+    asigna si se indica y es del evento; si no, CME/CENTRAL o el primer indicativo del evento.
+    None si el evento no tiene indicativos.
+    """
+    if assigned_by_indicativo_id:
+        indicativo = model_cache.get_indicativo(event_id, assigned_by_indicativo_id)
+        if indicativo:
+            return indicativo
+        current_app.logger.warning(f"[DEBUG] No se encontró el indicativo que hace la asignación (ID: {assigned_by_indicativo_id})")
+    indicativos = model_cache.get_event_indicativos(event_id)
+    ordered = [indicativos[indicativo_id] for indicativo_id in sorted(indicativos)]
+    # Intentar encontrar CME primero
+    for ind in ordered:
+        if 'CME' in ind['indicativo'].upper() or 'CENTRAL' in ind['indicativo'].upper():
+            return ind
+    # Si no hay CME, usar el primer indicativo disponible
+    return ordered[0] if ordered else None
+
+def queue_service_messages(event_id, incident, to_indicativo_ids, assigned_by_indicativo_id=None):
+    """
+    Añade a la sesión (sin commit) la entrada de outbox de los mensajes assign_service de una
+    asignación, con su contenido ya calculado: el mensaje describe el incidente tal como estaba
+    al asignarlo, aunque se entregue más tarde.
+    """
+    outbox.add('assign_service', {
+        'incident_id': incident.id,
+        'to_indicativo_ids': list(to_indicativo_ids),
+        'assigned_by_indicativo_id': assigned_by_indicativo_id,
+        'content': service_message_content(incident)
+    }, event_id=event_id)
+
+@outbox.register('assign_service')
+def deliver_service_messages(event_id, payload):
+    """
+    Entrega del outbox: crea los mensajes assign_service (del indicativo que asignó, CME/CENTRAL
+    o el primero del evento) a cada indicativo asignado y devuelve la función que los emite.
+    Los mensajes se insertan en la transacción que borra la entrada, también con escritura
+    agrupada (con ids reservados al writer): o quedan guardados y la entrada entregada, o nada.
+    """
+    from app.models.message import Message
+    message_content = payload.get('content')
+    if message_content is None:
+        # Entradas encoladas antes de guardar el contenido con ellas
+        incident = Incident.query.get(payload['incident_id'])
+        if incident is None:
+            return None
+        message_content = service_message_content(incident)
+    system_indicativo = find_assigning_indicativo(event_id, payload.get('assigned_by_indicativo_id'))
+    if system_indicativo is None:
+        current_app.logger.error(f"[ASSIGNMENTS] No hay ningún indicativo del evento {event_id} para enviar los mensajes de servicio")
+        return None
+    recipient_ids = payload['to_indicativo_ids']
+    message_ids = message_writer.allocate_ids(len(recipient_ids)) if message_writer.enabled() else [None] * len(recipient_ids)
+    messages = [
+        Message(id=message_id, event_id=event_id, indicativo_id=system_indicativo['id'], to_indicativo_id=recipient_id,
+                content=dict(message_content))
+        for message_id, recipient_id in zip(message_ids, recipient_ids)
+    ]
+    db.session.add_all(messages)
+    return lambda: wire.emit_new_messages([message.to_dict() for message in messages])
+
 @bp.route('/<int:event_id>/incidents/<int:incident_id>/assignments', methods=['POST'])
 def create_incident_assignment(event_id, incident_id):
     try:
@@ -665,228 +1178,43 @@ def create_incident_assignment(event_id, incident_id):
         
         # Determinar si es un indicativo del evento o texto libre
         indicativo_value = str(data['indicativo_id']).strip()
-        current_app.logger.info(f"[DEBUG] Asignando incidente #{incident.incident_number} a: '{indicativo_value}'")
-        
-        # Buscar si es un indicativo del evento por nombre (formato: "INDICATIVO (nombre)")
-        indicativo_found = None
-        all_indicativos = Indicativo.query.filter_by(event_id=event_id).all()
-        current_app.logger.info(f"[DEBUG] Indicativos disponibles en el evento {event_id}: {[f'{ind.indicativo} ({ind.nombre})' if ind.nombre else ind.indicativo for ind in all_indicativos]}")
         
-        for indicativo in all_indicativos:
-            indicativo_display = f"{indicativo.indicativo} ({indicativo.nombre})" if indicativo.nombre else indicativo.indicativo
-            current_app.logger.info(f"[DEBUG] Comparando '{indicativo_display}' con '{indicativo_value}'")
-            if indicativo_display == indicativo_value:
-                indicativo_found = indicativo
-                current_app.logger.info(f"[DEBUG] ¡MATCH! Indicativo encontrado: {indicativo.indicativo} (ID: {indicativo.id})")
-                break
-        
-        if not indicativo_found:
-            current_app.logger.info(f"[DEBUG] No se encontró match. Tratando como texto libre: '{indicativo_value}'")
+        # Buscar el indicativo del evento ("INDICATIVO (nombre)", indicativo o id) en el índice por nombre
+        indicativo_found = model_cache.resolve_indicativo(event_id, data['indicativo_id'])
         
         if indicativo_found:
             # Es un indicativo válido del evento
-            indicativo_id = indicativo_found.id
+            indicativo_id = indicativo_found['id']
             servicio_nombre = None
-            current_app.logger.info(f"[DEBUG] Asignación a indicativo del evento: {indicativo_found.indicativo} (ID: {indicativo_id})")
         else:
             # Es texto libre (CME, GUB, nombres, etc.)
             indicativo_id = -1  # Valor especial para texto libre (no podemos usar NULL por restricción NOT NULL)
             servicio_nombre = indicativo_value
-            current_app.logger.info(f"[DEBUG] Asignación a texto libre: '{servicio_nombre}' (indicativo_id: -1)")
+        current_app.logger.debug(f"[ASSIGNMENTS] Incidente #{incident.incident_number} asignado a '{indicativo_value}' (indicativo_id: {indicativo_id})")
 
         # Usar SQL directo para insertar la asignación
         try:
-            from sqlalchemy import text
-            
-            # Verificar qué columnas existen en la tabla
-            columns_query = db.session.execute(text("PRAGMA table_info(incident_assignments)")).fetchall()
-            existing_columns = [col[1] for col in columns_query]
+            # Columnas de la tabla según el registro de esquema (inspeccionado una vez por proceso)
+            existing_columns = schema.assignment_columns()
             
-            # Construir la consulta de inserción basada en las columnas existentes
-            base_columns = ['incident_id', 'estado_asignacion', 'fecha_creacion_asignacion', 'indicativo_id']
-            base_values = [incident.id, nuevo_estado_asignacion, now, indicativo_id]
-            
-            # Agregar servicio_nombre si la columna existe
-            if 'servicio_nombre' in existing_columns and servicio_nombre:
-                base_columns.append('servicio_nombre')
-                base_values.append(servicio_nombre)
-            
-            # Agregar fecha de estado específica si la columna existe
-            estado_fecha_map = {
-                'pre-avisado': 'fecha_pre_avisado_asig',
-                'avisado': 'fecha_avisado_asig',
-                'en camino': 'fecha_en_camino_asig',
-                'en el lugar': 'fecha_en_lugar_asig',
-                'finalizado': 'fecha_finalizado_asig'
-            }
-            
-            if nuevo_estado_asignacion in estado_fecha_map:
-                fecha_column = estado_fecha_map[nuevo_estado_asignacion]
-                if fecha_column in existing_columns:
-                    base_columns.append(fecha_column)
-                    base_values.append(now)
-            
-            # Construir y ejecutar la consulta
-            columns_str = ', '.join(base_columns)
-            placeholders = ', '.join([':param' + str(i) for i in range(len(base_values))])
-            
-            insert_query = f"INSERT INTO incident_assignments ({columns_str}) VALUES ({placeholders})"
-            params = {f'param{i}': value for i, value in enumerate(base_values)}
-            
-            result = db.session.execute(text(insert_query), params)
+            assignment_id = insert_assignment(incident.id, indicativo_id, servicio_nombre, nuevo_estado_asignacion, now, existing_columns)
+            version = mark_assignment_changed(event_id, incident.id, assignment_id, existing_columns)
+            if indicativo_found:
+                # Mensaje de servicio asignado al indicativo: lo entrega el outbox tras el commit
+                queue_service_messages(event_id, incident, [indicativo_found['id']], data.get('assigned_by_indicativo_id'))
             db.session.commit()
-            
-            # Obtener el ID de la asignación creada
-            assignment_id = result.lastrowid
+            emit_assignment_changed(event_id, incident.id, 'created', assignment_id, version)
             
             # Si es texto libre, SIEMPRE agregarlo al cache para preservarlo
             # Esto es especialmente importante cuando la columna servicio_nombre no existe
             if indicativo_id == -1 and servicio_nombre:
                 assignment_text_cache[assignment_id] = servicio_nombre
 
-            # **NUEVA FUNCIONALIDAD: Enviar mensaje de servicio asignado si es un indicativo del evento**
-            if indicativo_found:
-                current_app.logger.info(f"[DEBUG] Iniciando envío de mensaje automático para indicativo {indicativo_found.indicativo}")
-                try:
-                    # Importar socketio para enviar el mensaje
-                    from app.socket import socketio
-                    from app.models.message import Message
-                    
-                    # Construir la descripción del servicio con información del incidente
-                    service_description = f"🚨 INCIDENTE #{incident.incident_number}: {incident.tipo}"
-                    
-                    # Añadir dorsal si es asistencia médica
-                    if incident.tipo == '🚑 Asistencia Médica' and incident.dorsal:
-                        service_description += f" (Dorsal: {incident.dorsal})"
-                    
-                    # Añadir descripción del incidente si existe
-                    if incident.descripcion:
-                        service_description += f"\n📝 Descripción: {incident.descripcion}"
-                    
-                    # Añadir información adicional de ubicación si existe
-                    if incident.info_ubicacion:
-                        service_description += f"\n📍 Ubicación: {incident.info_ubicacion}"
-                    
-                    # Añadir dirección formateada si existe
-                    if incident.direccion_formateada:
-                        service_description += f"\n🗺️ Dirección: {incident.direccion_formateada}"
-                    
-                    # Añadir patología si es asistencia médica y existe
-                    if incident.tipo == '🚑 Asistencia Médica' and incident.patologia:
-                        service_description += f"\n🏥 Patología: {incident.patologia}"
-                    
-                    # Añadir reportado por si existe
-                    if incident.reportado_por:
-                        service_description += f"\n👤 Reportado por: {incident.reportado_por}"
-                    
-                    # Añadir estado del incidente
-                    service_description += f"\n📊 Estado: {incident.estado}"
-                    
-                    current_app.logger.info(f"[DEBUG] Descripción del servicio construida: {service_description}")
-                    
-                    # Crear el mensaje de servicio asignado
-                    # Usar el indicativo que está haciendo la asignación como emisor
-                    assigned_by_indicativo_id = data.get('assigned_by_indicativo_id')
-                    system_indicativo = None
-                    
-                    if assigned_by_indicativo_id:
-                        # Usar el indicativo que está haciendo la asignación
-                        system_indicativo = Indicativo.query.filter_by(id=assigned_by_indicativo_id, event_id=event_id).first()
-                        if system_indicativo:
-                            current_app.logger.info(f"[DEBUG] Usando indicativo que hace la asignación como emisor: {system_indicativo.indicativo}")
-                        else:
-                            current_app.logger.warning(f"[DEBUG] No se encontró el indicativo que hace la asignación (ID: {assigned_by_indicativo_id})")
-                    
-                    # Si no se especificó o no se encontró, buscar CME o el primer indicativo disponible como fallback
-                    if not system_indicativo:
-                        # Intentar encontrar CME primero
-                        for ind in Indicativo.query.filter_by(event_id=event_id).all():
-                            if 'CME' in ind.indicativo.upper() or 'CENTRAL' in ind.indicativo.upper():
-                                system_indicativo = ind
-                                current_app.logger.info(f"[DEBUG] Usando CME/CENTRAL como fallback: {ind.indicativo}")
-                                break
-                        
-                        # Si no hay CME, usar el primer indicativo disponible
-                        if not system_indicativo:
-                            system_indicativo = Indicativo.query.filter_by(event_id=event_id).first()
-                            if system_indicativo:
-                                current_app.logger.info(f"[DEBUG] Usando primer indicativo disponible como fallback: {system_indicativo.indicativo}")
-                    
-                    if system_indicativo:
-                        # Determinar si tenemos coordenadas para el mensaje
-                        message_content = {
-                            'type': 'assign_service',
-                            'text': service_description
-                        }
-                        
-                        # Añadir coordenadas si están disponibles
-                        if incident.lat is not None and incident.lng is not None:
-                            message_content['lat'] = incident.lat
-                            message_content['lng'] = incident.lng
-                            current_app.logger.info(f"[DEBUG] Añadiendo coordenadas al mensaje: {incident.lat}, {incident.lng}")
-                        else:
-                            # Si no hay coordenadas, añadir nota al mensaje
-                            message_content['text'] += f"\n⚠️ Sin coordenadas GPS disponibles"
-                            current_app.logger.info(f"[DEBUG] Sin coordenadas disponibles para el incidente")
-                        
-                        current_app.logger.info(f"[DEBUG] Creando mensaje de {system_indicativo.indicativo} (ID: {system_indicativo.id}) a {indicativo_found.indicativo} (ID: {indicativo_found.id})")
-                        
-                        # Crear y guardar el mensaje en la base de datos
-                        message = Message(
-                            event_id=event_id,
-                            indicativo_id=system_indicativo.id,  # Emisor: CME o primer indicativo del evento
-                            to_indicativo_id=indicativo_found.id,  # Destinatario: indicativo asignado
-                            content=message_content
-                        )
-                        db.session.add(message)
-                        db.session.commit()
-                        
-                        current_app.logger.info(f"[DEBUG] Mensaje guardado en BD con ID: {message.id}")
-                        
-                        # Emitir el mensaje por socket
-                        msg_dict = message.to_dict()
-                        
-                        # Enviar mensaje privado al indicativo asignado
-                        room_dest = f'indicativo_{indicativo_found.id}_event_{event_id}'
-                        socketio.emit('new_message', msg_dict, room=room_dest)
-                        current_app.logger.info(f"[DEBUG] Mensaje enviado a room: {room_dest}")
-                        
-                        # También enviar al emisor (sistema) si es diferente
-                        if system_indicativo.id != indicativo_found.id:
-                            room_emisor = f'indicativo_{system_indicativo.id}_event_{event_id}'
-                            socketio.emit('new_message', msg_dict, room=room_emisor)
-                            current_app.logger.info(f"[DEBUG] Mensaje enviado también a emisor room: {room_emisor}")
-                        
-                        current_app.logger.info(f"[DEBUG] ✅ Mensaje de servicio asignado enviado automáticamente para incidente #{incident.incident_number} a {indicativo_found.indicativo}")
-                    else:
-                        current_app.logger.error(f"[DEBUG] ❌ No se encontró ningún indicativo del sistema para enviar el mensaje")
-                    
-                except Exception as e:
-                    current_app.logger.error(f"[DEBUG] ❌ Error al enviar mensaje de servicio asignado automáticamente: {e}")
-                    # No fallar la asignación si el mensaje no se puede enviar
-                    pass
-            else:
-                current_app.logger.info(f"[DEBUG] No se enviará mensaje automático porque no es un indicativo del evento (es texto libre)")
-                
             # Crear respuesta manual (para ambos casos: indicativo del evento y texto libre)
-            assignment_dict = {
-                'id': assignment_id,
-                'incident_id': incident.id,
-                'indicativo_id': indicativo_id,
-                'servicio_nombre': servicio_nombre if 'servicio_nombre' in existing_columns else None,
-                'estado_asignacion': nuevo_estado_asignacion,
-                'fecha_creacion_asignacion': now.strftime('%Y-%m-%d %H:%M:%S'),
-            }
-            
-            # Agregar fechas de estado
-            for estado, fecha_col in estado_fecha_map.items():
-                if estado == nuevo_estado_asignacion and fecha_col in existing_columns:
-                    assignment_dict[fecha_col] = now.strftime('%Y-%m-%d %H:%M:%S')
-                else:
-                    assignment_dict[fecha_col] = None
-            
-            # Determinar el nombre a mostrar usando función auxiliar
-            assignment_dict['indicativo_nombre'] = get_assignment_display_name(assignment_dict, event_id)
+            assignment_dict = created_assignment_to_dict(
+                assignment_id, incident.id, indicativo_id, servicio_nombre, nuevo_estado_asignacion, now, existing_columns,
+                event_id, indicativo_found
+            )
             
             return jsonify({'status': 'success', 'message': 'Asignación creada', 'assignment': assignment_dict}), 201
             
@@ -899,6 +1227,77 @@ def create_incident_assignment(event_id, incident_id):
         current_app.logger.error(f"Error general en create_incident_assignment: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
+@bp.route('/<int:event_id>/incidents/<int:incident_id>/assignments/bulk', methods=['POST'])
+def create_incident_assignments_bulk(event_id, incident_id):
+    """
+    Asigna varios recursos a la vez. Cuerpo: {'targets': [...], 'estado_asignacion': ...,
+    'assigned_by_indicativo_id': ...}, donde cada destino es el texto de un indicativo
+    ("INDICATIVO (nombre)") o texto libre, o un dict {'indicativo_id': texto, 'estado_asignacion': ...}.
+    Todas las asignaciones y las entradas de outbox de sus mensajes automáticos van en una sola
+    transacción y se notifican con un único assignment_changed.
+    """
+    incident = Incident.query.filter_by(id=incident_id, event_id=event_id).first_or_404()
+    data = request.get_json() or {}
+    targets = data.get('targets')
+    if not isinstance(targets, list) or not targets:
+        return jsonify({'status': 'error', 'message': 'targets debe ser una lista no vacía'}), 400
+    default_estado = data.get('estado_asignacion', 'pre-avisado')
+
+    existing_columns = schema.assignment_columns()
+    now = datetime.utcnow()
+    created = []  # (assignment_id, indicativo_id, servicio_nombre, estado, indicativo del evento o None)
+    try:
+        for target in targets:
+            if isinstance(target, dict):
+                raw_value = target.get('indicativo_id')
+                estado = target.get('estado_asignacion', default_estado)
+            else:
+                raw_value = target
+                estado = default_estado
+            value = str(raw_value if raw_value is not None else '').strip()
+            if not value:
+                db.session.rollback()
+                return jsonify({'status': 'error', 'message': 'Cada destino necesita indicativo_id'}), 400
+            indicativo_found = model_cache.resolve_indicativo(event_id, raw_value)
+            indicativo_id = indicativo_found['id'] if indicativo_found else -1
+            servicio_nombre = None if indicativo_found else value
+            assignment_id = insert_assignment(incident.id, indicativo_id, servicio_nombre, estado, now, existing_columns)
+            created.append((assignment_id, indicativo_id, servicio_nombre, estado, indicativo_found))
+
+        assignment_ids = [assignment_id for assignment_id, *_ in created]
+        version = mark_assignments_changed(event_id, incident.id, assignment_ids, existing_columns)
+
+        # Mensajes automáticos para los indicativos del evento: una entrada de outbox por indicativo,
+        # para que el fallo de una entrega no retenga las demás
+        for *_, indicativo_found in created:
+            if indicativo_found:
+                queue_service_messages(event_id, incident, [indicativo_found['id']], data.get('assigned_by_indicativo_id'))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Error al crear asignaciones en bloque: {e}")
+        return jsonify({'status': 'error', 'message': f'Error al crear asignaciones: {str(e)}'}), 500
+
+    for assignment_id, indicativo_id, servicio_nombre, _, _ in created:
+        if indicativo_id == -1 and servicio_nombre:
+            assignment_text_cache[assignment_id] = servicio_nombre
+
+    # Una notificación para todo el lote a la sala del evento
+    emit_assignment_changed(event_id, incident.id, 'created', assignment_ids[0] if len(assignment_ids) == 1 else None,
+                            version, assignment_ids=assignment_ids)
+
+    assignments = [
+        created_assignment_to_dict(assignment_id, incident.id, indicativo_id, servicio_nombre, estado, now,
+                                   existing_columns, event_id, indicativo_found)
+        for assignment_id, indicativo_id, servicio_nombre, estado, indicativo_found in created
+    ]
+    return jsonify({
+        'status': 'success',
+        'message': f'{len(assignments)} asignaciones creadas',
+        'assignments': assignments,
+        'version': version
+    }), 201
+
 @bp.route('/<int:event_id>/incidents/<int:incident_id>/assignments/<int:assignment_id>', methods=['PUT'])
 def update_incident_assignment(event_id, incident_id, assignment_id):
     try:
@@ -911,32 +1310,27 @@ def update_incident_assignment(event_id, incident_id, assignment_id):
             # Usar SQL directo para actualizar
             from sqlalchemy import text
             
-            # Verificar qué columnas existen
-            columns_query = db.session.execute(text("PRAGMA table_info(incident_assignments)")).fetchall()
-            existing_columns = [col[1] for col in columns_query]
+            # Columnas de la tabla según el registro de esquema (inspeccionado una vez por proceso)
+            existing_columns = schema.assignment_columns()
             
             # Actualizar estado
             update_parts = ['estado_asignacion = :nuevo_estado']
             params = {'nuevo_estado': nuevo_estado, 'assignment_id': assignment_id, 'incident_id': incident_id}
             
             # Agregar fecha de estado específica si la columna existe
-            estado_fecha_map = {
-                'pre-avisado': 'fecha_pre_avisado_asig',
-                'avisado': 'fecha_avisado_asig',
-                'en camino': 'fecha_en_camino_asig',
-                'en el lugar': 'fecha_en_lugar_asig',
-                'finalizado': 'fecha_finalizado_asig'
-            }
-            
-            if nuevo_estado in estado_fecha_map:
-                fecha_column = estado_fecha_map[nuevo_estado]
-                if fecha_column in existing_columns:
-                    update_parts.append(f'{fecha_column} = :fecha_estado')
-                    params['fecha_estado'] = now
+            fecha_column = ASSIGNMENT_STATUS_DATE_COLUMNS.get(nuevo_estado)
+            if fecha_column and fecha_column in existing_columns:
+                update_parts.append(f'{fecha_column} = :fecha_estado')
+                params['fecha_estado'] = now
             
             update_query = f"UPDATE incident_assignments SET {', '.join(update_parts)} WHERE id = :assignment_id AND incident_id = :incident_id"
-            db.session.execute(text(update_query), params)
+            result = db.session.execute(text(update_query), params)
+            version = None
+            if result.rowcount:
+                version = mark_assignment_changed(event_id, incident_id, assignment_id, existing_columns)
             db.session.commit()
+            if version is not None:
+                emit_assignment_changed(event_id, incident_id, 'updated', assignment_id, version)
             
             # Obtener la asignación actualizada usando SQL directo
             assignment_query = db.session.execute(
@@ -961,7 +1355,7 @@ def update_incident_assignment(event_id, incident_id, assignment_id):
                     assignment_dict['servicio_nombre'] = None
                 
                 # Agregar fechas de estado
-                for fecha_col in estado_fecha_map.values():
+                for fecha_col in ASSIGNMENT_STATUS_DATE_COLUMNS.values():
                     try:
                         value = getattr(assignment_query, fecha_col, None)
                         if value:
@@ -1008,7 +1402,9 @@ def delete_incident_assignment(event_id, incident_id, assignment_id):
             text("DELETE FROM incident_assignments WHERE id = :assignment_id AND incident_id = :incident_id"),
             {'assignment_id': assignment_id, 'incident_id': incident_id}
         )
+        version = mark_assignment_changed(event_id, incident_id)
         db.session.commit()
+        emit_assignment_changed(event_id, incident_id, 'deleted', assignment_id, version)
         
         # Limpiar del cache si existe
         if assignment_id in assignment_text_cache:
@@ -1,4 +1,5 @@
 from flask import Blueprint, jsonify
+from app.services import model_cache
 
 bp = Blueprint('main', __name__)
 
@@ -8,4 +9,11 @@ def index():
         'status': 'success',
         'message': 'RCQEvents API is running',
         'version': '1.0.0'
-    }) 
\ No newline at end of file
+    })
+
+@bp.route('/cache/stats')
+def cache_stats():
+    return jsonify({
+        'status': 'success',
+        'model_cache': model_cache.stats()
+    })
@@ -0,0 +1,36 @@
+"""
+Incremento atómico de contadores con nombre (tabla counters).
+
+El UPDATE toma el bloqueo de escritura (SQLite) o de fila (PostgreSQL) hasta el final de la
+transacción, así que el valor leído a continuación es exclusivo de quien lo incrementó.
+`connection` puede ser db.session (el incremento va en la transacción de la petición) o una
+Connection propia (p. ej. db.engine.begin()) para reservas independientes.
+"""
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from app.models.counter import Counter
+
+def advance(connection, name, amount=1, floor=0):
+    """
+    Suma `amount` al contador `name` y devuelve el nuevo valor. Si el contador vale menos que
+    `floor` (o no existe) se parte de `floor`, lo que permite sembrarlo desde datos existentes.
+    """
+    table = Counter.__table__
+    result = connection.execute(
+        update(table)
+        .where(table.c.name == name)
+        .values(value=case((table.c.value > floor, table.c.value), else_=floor) + amount)
+    )
+    if result.rowcount == 0:
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(table).values(name=name, value=floor + amount))
+        except IntegrityError:
+            # Otro proceso creó la fila a la vez: repetir el incremento sobre ella
+            return advance(connection, name, amount, floor)
+    return connection.execute(select(table.c.value).where(table.c.name == name)).scalar_one()
+
+def current(connection, name):
+    """Valor actual del contador o 0 si no existe"""
+    table = Counter.__table__
+    return connection.execute(select(table.c.value).where(table.c.name == name)).scalar() or 0
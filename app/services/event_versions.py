@@ -0,0 +1,49 @@
+"""
+Versión por evento de sus incidentes, asignaciones e indicativos.
+
+Cada ruta que escribe en esas tablas llama a bump() antes de su commit: el contador
+'event_version:<event_id>' de la tabla counters sube en la misma transacción que el cambio,
+así que es común a todos los workers. Los listados usan la versión como ETag; con
+If-None-Match se responde 304 consultando solo el contador, y las respuestas completas se
+guardan por (evento, versión, variante) en una caché LRU pequeña por proceso.
+"""
+import threading
+from collections import OrderedDict
+from flask import current_app
+from app.extensions import db
+from app.services import counters
+
+# Formato: {(event_id, version, variante): cuerpo_json}
+_responses = OrderedDict()
+_lock = threading.Lock()
+
+def _counter_name(event_id):
+    return f'event_version:{int(event_id)}'
+
+def bump(event_id):
+    """Sube la versión del evento en la transacción de la sesión actual (el commit lo hace el llamador)"""
+    return counters.advance(db.session, _counter_name(event_id))
+
+def current(event_id):
+    """Versión actual del evento (0 si nunca se ha modificado)"""
+    return counters.current(db.session, _counter_name(event_id))
+
+def etag(event_id, version, variant=''):
+    return f'{int(event_id)}-{version}{"-" + variant if variant else ""}'
+
+def get_response(event_id, version, variant=''):
+    with _lock:
+        key = (int(event_id), version, variant)
+        body = _responses.get(key)
+        if body is not None:
+            _responses.move_to_end(key)
+        return body
+
+def store_response(event_id, version, variant, body):
+    size = current_app.config['LIST_RESPONSE_CACHE_SIZE']
+    if size <= 0:
+        return
+    with _lock:
+        _responses[(int(event_id), version, variant)] = body
+        while len(_responses) > size:
+            _responses.popitem(last=False)
@@ -0,0 +1,444 @@
+"""
+Geocodificación inversa (coordenadas → dirección) de incidentes.
+
+get_address_from_coords() consulta Nominatim en el momento y es lo que usan las peticiones
+que piden la dirección de forma explícita. Para crear y editar incidentes, con GEOCODING_ASYNC
+la consulta sale de la petición: el incidente se guarda y se devuelve enseguida y
+geocoding_queue rellena direccion_formateada desde tareas de fondo (GEOCODING_WORKERS por
+proceso), que lo notifican a las consolas con incident_updated.
+
+Todas las consultas pasan por lookup(): caché LRU en memoria (GEOCODING_CACHE_SIZE) sobre la
+tabla geocode_cache, con clave en las coordenadas redondeadas a GEOCODING_CACHE_PRECISION
+decimales (también se guarda "sin dirección"); consultas idénticas simultáneas en un proceso
+esperan a la primera en lugar de repetirla; y un límite de ritmo común a todos los workers
+(GEOCODING_RATE_PER_SECOND, con ráfagas de GEOCODING_RATE_BURST) guardado en el contador
+'geocoding_rate' de la tabla counters, como pide la política de uso de Nominatim.
+
+La cola está acotada (GEOCODING_QUEUE_SIZE) y guarda un trabajo por incidente: si cambian las
+coordenadas antes de resolverse, gana la última posición. Si el servicio falla se reintenta con
+espera exponencial (GEOCODING_RETRY_BASE_SECONDS, duplicándose) hasta GEOCODING_MAX_ATTEMPTS.
+Cuando arrancan las tareas (al crear la app, o si no con el primer incidente a geocodificar del
+proceso) se vuelven a encolar los incidentes con coordenadas y sin dirección: lo que quedó
+pendiente en un reinicio o no cupo en la cola.
+
+search() es la búsqueda directa (dirección → coordenadas) que usan las consolas a través de
+/events/<id>/geocode/search. Con GEOCODING_SEARCH_PROVIDER='nominatim' comparte el límite de
+ritmo y la agrupación de consultas con lo anterior y guarda los resultados en la tabla
+geocode_search_cache; con 'local' busca por nombre en el extracto GEOCODING_OFFLINE_FILE, sin red.
+"""
+import hashlib
+import heapq
+import itertools
+import json
+import threading
+import time
+from datetime import datetime
+from collections import OrderedDict
+import requests
+from flask import current_app
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app.models.geocode_cache import GeocodeCacheEntry
+from app.models.geocode_search_cache import GeocodeSearchCacheEntry
+from app.services import counters
+from app.services.offline_geocoder import get_offline_geocoder, reverse_geocode_offline, search_offline
+
+NOMINATIM_REVERSE_URL = 'https://nominatim.openstreetmap.org/reverse'
+NOMINATIM_SEARCH_URL = 'https://nominatim.openstreetmap.org/search'
+RETRY_MAX_SECONDS = 300
+POLL_INTERVAL = 0.1
+RATE_COUNTER = 'geocoding_rate'
+
+# Caché en memoria (LRU): {clave: dirección o None, 'search:<sha1>': lista de resultados}
+_cache = OrderedDict()
+# Consultas en curso en este proceso: {clave: {'done': bool, 'result': ..., 'error': ...}}
+_inflight = {}
+_cache_lock = threading.Lock()
+_MISSING = object()
+
+class GeocodingError(Exception):
+    """El servicio de geocodificación no ha respondido o ha respondido con error"""
+
+def reverse_geocode(lat, lng, user_agent=None):
+    """
+    Dirección legible de unas coordenadas o None si el servicio no conoce ninguna.
+    Lanza GeocodingError si la consulta falla (red, timeout, 4xx/5xx): se puede reintentar.
+    Fuera del contexto de la app (hilos del sistema) hay que pasar user_agent.
+    """
+    # Usar el user-agent es una buena práctica y a veces requerido por Nominatim
+    headers = {'User-Agent': user_agent or current_app.config['GEOCODING_USER_AGENT']}
+    params = {'format': 'json', 'lat': lat, 'lon': lng, 'zoom': 18, 'addressdetails': 1}
+    try:
+        response = requests.get(NOMINATIM_REVERSE_URL, params=params, headers=headers, timeout=5)  # Timeout de 5 segundos
+        response.raise_for_status()  # Lanza error para respuestas 4xx/5xx
+        data = response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        raise GeocodingError(str(e)) from e
+    return format_address(data)
+
+def format_address(data):
+    """Dirección a mostrar a partir de la respuesta de Nominatim (calle y número o display_name)"""
+    address = data.get('address')
+    if address:
+        road = address.get('road', '')
+        house_number = address.get('house_number', '')
+        display_address = road
+        if house_number:
+            display_address += f", {house_number}"
+        return display_address if display_address else data.get('display_name')
+    return data.get('display_name')  # Fallback al display_name completo
+
+def forward_geocode(query, limit, user_agent=None):
+    """
+    Resultados de Nominatim para una dirección como [{'lat', 'lng', 'display_name'}] (lista vacía
+    si no encuentra nada). Lanza GeocodingError si la consulta falla, igual que reverse_geocode().
+    """
+    headers = {'User-Agent': user_agent or current_app.config['GEOCODING_USER_AGENT']}
+    params = {'format': 'json', 'q': query, 'limit': limit}
+    try:
+        response = requests.get(NOMINATIM_SEARCH_URL, params=params, headers=headers, timeout=5)
+        response.raise_for_status()
+        data = response.json()
+        return [
+            {'lat': float(item['lat']), 'lng': float(item['lon']), 'display_name': item.get('display_name')}
+            for item in data
+        ]
+    except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+        raise GeocodingError(str(e)) from e
+
+def cache_key(lat, lng):
+    precision = current_app.config['GEOCODING_CACHE_PRECISION']
+    return f"{float(lat):.{precision}f},{float(lng):.{precision}f}"
+
+def _cache_get(key):
+    with _cache_lock:
+        address = _cache.get(key, _MISSING)
+        if address is not _MISSING:
+            _cache.move_to_end(key)
+        return address
+
+def _cache_put(key, address):
+    size = current_app.config['GEOCODING_CACHE_SIZE']
+    with _cache_lock:
+        _cache[key] = address
+        _cache.move_to_end(key)
+        while len(_cache) > size:
+            _cache.popitem(last=False)
+
+def _load_cached(key):
+    table = GeocodeCacheEntry.__table__
+    with db.engine.connect() as conn:
+        row = conn.execute(select(table.c.address).where(table.c.key == key)).first()
+    return row.address if row is not None else _MISSING
+
+def _store_cached(key, address):
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(insert(GeocodeCacheEntry.__table__).values(key=key, address=address, created_at=datetime.utcnow()))
+    except IntegrityError:
+        # Otro proceso la guardó a la vez
+        pass
+
+def _sleep(seconds):
+    from app.socket import socketio
+    socketio.sleep(seconds)
+
+def _acquire_rate_slot():
+    """
+    Espera al siguiente hueco del límite de ritmo compartido. El contador guarda el instante
+    teórico (ms) de la próxima consulta permitida: cada consulta lo adelanta un intervalo.
+    """
+    rate = current_app.config['GEOCODING_RATE_PER_SECOND']
+    if rate <= 0:
+        return
+    interval = int(1000 / rate)
+    burst = max(1, current_app.config['GEOCODING_RATE_BURST'])
+    now = int(time.time() * 1000)
+    try:
+        with db.engine.begin() as conn:
+            slot = counters.advance(conn, RATE_COUNTER, interval, floor=now - (burst - 1) * interval) - interval
+    except Exception as e:
+        # Sin acceso al contador no se bloquea la geocodificación
+        current_app.logger.warning(f"[GEOCODING] No se pudo reservar hueco en el límite de ritmo: {e}")
+        return
+    if slot > now:
+        _sleep((slot - now) / 1000.0)
+
+def _fetch(function, *args):
+    """Llama a reverse_geocode/forward_geocode (con el user-agent de la app) sin bloquear el bucle de eventos"""
+    from app.socket import socketio
+    user_agent = current_app.config['GEOCODING_USER_AGENT']
+    if socketio.async_mode == 'eventlet':
+        # Sin monkey patching la llamada HTTP bloquearía el bucle de eventlet: hacerla en un hilo del sistema
+        from eventlet import tpool
+        return tpool.execute(function, *args, user_agent)
+    return function(*args, user_agent)
+
+def _coalesced(key, compute):
+    """
+    Devuelve compute() evitando repetirlo: si ya hay una llamada en curso para la misma clave en
+    este proceso, espera su resultado (o su GeocodingError) en lugar de hacer otra.
+    """
+    with _cache_lock:
+        entry = _inflight.get(key)
+        owner = entry is None
+        if owner:
+            entry = _inflight[key] = {'done': False, 'result': None, 'error': None}
+    if not owner:
+        # Misma consulta ya en curso: esperar su resultado
+        while not entry['done']:
+            _sleep(POLL_INTERVAL)
+        if entry['error']:
+            raise GeocodingError(entry['error'])
+        return entry['result']
+
+    try:
+        entry['result'] = compute()
+        return entry['result']
+    except Exception as e:
+        entry['error'] = str(e) or e.__class__.__name__
+        raise
+    finally:
+        entry['done'] = True
+        with _cache_lock:
+            _inflight.pop(key, None)
+
+def lookup(lat, lng):
+    """
+    Dirección de unas coordenadas pasando por la caché, la agrupación de consultas simultáneas
+    y el límite de ritmo. Lanza GeocodingError si hay que consultar el servicio y falla.
+    """
+    key = cache_key(lat, lng)
+    address = _cache_get(key)
+    if address is not _MISSING:
+        return address
+    address = _load_cached(key)
+    if address is not _MISSING:
+        _cache_put(key, address)
+        return address
+
+    def compute():
+        _acquire_rate_slot()
+        # Mientras se esperaba el turno otro worker puede haberla consultado ya
+        address = _load_cached(key)
+        if address is not _MISSING:
+            _cache_put(key, address)
+            return address
+        address = _fetch(reverse_geocode, lat, lng)
+        _store_cached(key, address)
+        _cache_put(key, address)
+        return address
+    return _coalesced(key, compute)
+
+def _normalize_query(text):
+    return ' '.join((text or '').lower().split())
+
+def search_cache_key(query, zona, limit):
+    provider = current_app.config['GEOCODING_SEARCH_PROVIDER']
+    raw = f"{provider}|{_normalize_query(query)}|{_normalize_query(zona)}|{limit}"
+    return 'search:' + hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+def _load_search_cached(key):
+    table = GeocodeSearchCacheEntry.__table__
+    with db.engine.connect() as conn:
+        row = conn.execute(select(table.c.results).where(table.c.key == key)).first()
+    return json.loads(row.results) if row is not None else _MISSING
+
+def _store_search_cached(key, query, results):
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(insert(GeocodeSearchCacheEntry.__table__).values(
+                key=key, query=query[:500], results=json.dumps(results), created_at=datetime.utcnow()
+            ))
+    except IntegrityError:
+        pass
+
+def search(query, zona=None, limit=5):
+    """
+    Coordenadas de una dirección: lista de {'lat', 'lng', 'display_name'}, la mejor primero.
+    Con `zona` (la zona_evento del evento) se busca primero "consulta, zona" y solo si no hay
+    resultados la consulta sola. Lanza GeocodingError si hay que consultar el servicio y falla.
+    """
+    if current_app.config['GEOCODING_SEARCH_PROVIDER'] == 'local':
+        return search_offline(query, limit)
+    key = search_cache_key(query, zona, limit)
+    results = _cache_get(key)
+    if results is not _MISSING:
+        return results
+    results = _load_search_cached(key)
+    if results is not _MISSING:
+        _cache_put(key, results)
+        return results
+
+    def compute():
+        _acquire_rate_slot()
+        # Mientras se esperaba el turno otro worker puede haberla consultado ya
+        results = _load_search_cached(key)
+        if results is not _MISSING:
+            _cache_put(key, results)
+            return results
+        results = []
+        with_zona = zona and _normalize_query(zona) not in _normalize_query(query)
+        if with_zona:
+            results = _fetch(forward_geocode, f"{query}, {zona}", limit)
+        if not results:
+            if with_zona:
+                _acquire_rate_slot()
+            results = _fetch(forward_geocode, query, limit)
+        _store_search_cached(key, query, results)
+        _cache_put(key, results)
+        return results
+    return _coalesced(key, compute)
+
+def get_address_from_coords(lat, lng):
+    """
+    Geocodificación en el momento: dirección o None (también si el servicio falla). Con un
+    extracto local configurado (GEOCODING_OFFLINE_FILE) se usa ese en lugar del servicio.
+    """
+    if lat is None or lng is None:
+        return None
+    if get_offline_geocoder() is not None:
+        return reverse_geocode_offline(lat, lng)
+    try:
+        return lookup(lat, lng)
+    except GeocodingError as e:
+        current_app.logger.error(f"Error en geocodificación inversa: {e}")
+        return None
+    except Exception as e:
+        current_app.logger.error(f"Error inesperado en geocodificación inversa: {e}")
+        return None
+
+class GeocodingQueue:
+    def __init__(self):
+        self.app = None
+        # Trabajos listos: {incident_id: (lat, lng, intento)}, en orden de llegada
+        self._jobs = OrderedDict()
+        # Reintentos programados: [(instante, secuencia, incident_id, lat, lng, intento)]
+        self._retries = []
+        self._sequence = itertools.count()
+        # Incidentes en curso o con reintento programado (el reencolado de pendientes no los repite)
+        self._active = set()
+        self._lock = threading.Lock()
+        self._tasks_started = False
+
+    def init_app(self, app):
+        self.app = app
+
+    def enabled(self):
+        return current_app.config['GEOCODING_ASYNC']
+
+    def start(self):
+        """Arranca las tareas de fondo al iniciar el worker: reencolan los incidentes que quedaron sin dirección"""
+        if self.enabled():
+            self._ensure_tasks()
+
+    def enqueue(self, incident_id, lat, lng, attempt=0):
+        """Encola la geocodificación de un incidente. Devuelve False si la cola está llena."""
+        with self._lock:
+            if incident_id not in self._jobs and len(self._jobs) >= current_app.config['GEOCODING_QUEUE_SIZE']:
+                current_app.logger.warning(f"[GEOCODING] Cola llena: el incidente {incident_id} se geocodificará al reiniciar")
+                return False
+            self._jobs[incident_id] = (lat, lng, attempt)
+            self._jobs.move_to_end(incident_id)
+        self._ensure_tasks()
+        return True
+
+    def pending(self):
+        """Número de incidentes en espera (listos y con reintento programado)"""
+        with self._lock:
+            return len(self._jobs) + len(self._retries)
+
+    def _schedule_retry(self, incident_id, lat, lng, attempt):
+        delay = min(self.app.config['GEOCODING_RETRY_BASE_SECONDS'] * (2 ** (attempt - 1)), RETRY_MAX_SECONDS)
+        with self._lock:
+            heapq.heappush(self._retries, (time.monotonic() + delay, next(self._sequence), incident_id, lat, lng, attempt))
+        return delay
+
+    def _next_job(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._retries and self._retries[0][0] <= now:
+                _, _, incident_id, lat, lng, attempt = heapq.heappop(self._retries)
+                # Si mientras tanto se encoló una posición nueva, esa tiene prioridad
+                self._jobs.setdefault(incident_id, (lat, lng, attempt))
+            if not self._jobs:
+                return None
+            incident_id, (lat, lng, attempt) = self._jobs.popitem(last=False)
+            self._active.add(incident_id)
+            return incident_id, lat, lng, attempt
+
+    def _ensure_tasks(self):
+        if self._tasks_started:
+            return
+        with self._lock:
+            if self._tasks_started:
+                return
+            self._tasks_started = True
+        from app.socket import socketio
+        socketio.start_background_task(self._requeue_pending)
+        for _ in range(max(1, current_app.config['GEOCODING_WORKERS'])):
+            socketio.start_background_task(self._run)
+
+    def _requeue_pending(self):
+        from app.extensions import db
+        from app.models.incident import Incident
+        with self.app.app_context():
+            try:
+                limit = self.app.config['GEOCODING_QUEUE_SIZE']
+                rows = (db.session.query(Incident.id, Incident.lat, Incident.lng)
+                        .filter(Incident.lat.isnot(None), Incident.lng.isnot(None),
+                                Incident.direccion_formateada.is_(None), Incident.is_deleted.is_(False))
+                        .order_by(Incident.id.desc())
+                        .limit(limit)
+                        .all())
+                with self._lock:
+                    for incident_id, lat, lng in rows:
+                        if len(self._jobs) >= limit:
+                            break
+                        if incident_id not in self._active:
+                            self._jobs.setdefault(incident_id, (lat, lng, 0))
+            except Exception as e:
+                current_app.logger.error(f"[GEOCODING] Error al reencolar incidentes pendientes: {e}")
+            finally:
+                db.session.remove()
+
+    def _process(self, incident_id, lat, lng, attempt):
+        """Geocodifica un incidente. Devuelve True si ha quedado programado un reintento."""
+        try:
+            address = lookup(lat, lng)
+        except GeocodingError as e:
+            attempt += 1
+            if attempt >= self.app.config['GEOCODING_MAX_ATTEMPTS']:
+                current_app.logger.error(f"[GEOCODING] Incidente {incident_id}: se abandona tras {attempt} intentos ({e})")
+                return False
+            delay = self._schedule_retry(incident_id, lat, lng, attempt)
+            current_app.logger.warning(f"[GEOCODING] Incidente {incident_id}: error ({e}), reintento en {delay:.0f}s")
+            return True
+        # Guardar y notificar es cosa de las rutas de incidentes (versión del evento, incident_updated)
+        from app.routes.events import apply_incident_address
+        apply_incident_address(incident_id, lat, lng, address)
+        return False
+
+    def _run(self):
+        from app.extensions import db
+        from app.socket import socketio
+        with self.app.app_context():
+            while True:
+                job = self._next_job()
+                if job is None:
+                    socketio.sleep(POLL_INTERVAL)
+                    continue
+                retrying = False
+                try:
+                    retrying = self._process(*job)
+                except Exception as e:
+                    db.session.rollback()
+                    current_app.logger.error(f"[GEOCODING] Error al geocodificar el incidente {job[0]}: {e}")
+                finally:
+                    if not retrying:
+                        with self._lock:
+                            self._active.discard(job[0])
+                    db.session.remove()
+
+geocoding_queue = GeocodingQueue()
@@ -0,0 +1,41 @@
+"""
+Numeración de incidentes por evento (incident_number).
+
+El siguiente número sale del contador 'incident_number:<event_id>' de la tabla counters,
+incrementado en la misma transacción que el alta del incidente: dos altas simultáneas nunca
+reciben el mismo número y, si el alta se deshace, el número vuelve al contador (sin huecos).
+El contador se siembra con el mayor incident_number del evento la primera vez que se usa.
+
+create_incident reserva el número justo antes del commit para que el bloqueo del contador dure
+solo el INSERT. Si aun así choca con uq_event_incident_number (contador por detrás de la tabla,
+p. ej. incidentes creados por otra vía), se reintenta resembrando desde la tabla.
+"""
+from sqlalchemy import func
+from app.extensions import db
+from app.models.incident import Incident
+from app.services import counters
+
+MAX_ATTEMPTS = 5
+
+def _counter_name(event_id):
+    return f'incident_number:{int(event_id)}'
+
+def highest(event_id):
+    """Mayor incident_number guardado del evento (0 si no tiene incidentes)"""
+    return db.session.query(func.max(Incident.incident_number)).filter_by(event_id=event_id).scalar() or 0
+
+def allocate(event_id, resync=False):
+    """
+    Reserva el siguiente número del evento en la transacción de la sesión actual (el commit lo
+    hace el llamador). Con resync=True el contador se pone al menos al mayor número de la tabla.
+    """
+    name = _counter_name(event_id)
+    floor = 0
+    if resync or counters.current(db.session, name) == 0:
+        floor = highest(event_id)
+    return counters.advance(db.session, name, floor=floor)
+
+def is_conflict(error):
+    """True si el IntegrityError es un número de incidente repetido en el evento"""
+    message = str(getattr(error, 'orig', error))
+    return 'uq_event_incident_number' in message or 'incident_number' in message
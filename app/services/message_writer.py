@@ -0,0 +1,260 @@
+"""
+Escritura agrupada (group commit) de mensajes de chat y localización.
+
+Por defecto cada send_message hace su propio commit; en SQLite eso es un fsync por mensaje y
+todas las escrituras de todos los workers quedan en serie. Con MESSAGE_BATCH_ENABLED los
+mensajes reciben id y marca de tiempo al momento, se emiten enseguida y se guardan en lotes:
+cada MESSAGE_BATCH_MAX_DELAY_MS milisegundos o al juntar MESSAGE_BATCH_MAX_SIZE mensajes.
+MESSAGE_BATCH_MAX_PENDING limita cuántos mensajes emitidos puede haber sin persistir: al
+alcanzarlo, quien envía guarda el lote él mismo antes de continuar, y si no puede, el mensaje
+se rechaza con MessageBacklogFull.
+
+Si un lote falla se guarda mensaje a mensaje para que una fila mala (p. ej. de un indicativo
+borrado que la caché aún daba por bueno) no bloquee a las demás: las que fallan por sus datos
+se descartan, se registran en el log con su contenido y se avisa con un 'error' a quien las
+envió. Los errores de la base de datos (bloqueo, conexión) devuelven los mensajes a la cola
+hasta MESSAGE_BATCH_MAX_ATTEMPTS intentos; agotados, se descartan igual.
+
+Los ids se reservan en bloques del contador 'messages' (tabla counters), válidos durante
+MESSAGE_ID_BLOCK_TTL segundos: así no chocan entre workers (en PostgreSQL cada reserva lleva
+además la secuencia de messages.id al final del bloque) y el orden por id sigue el orden
+temporal con esa precisión, que es lo que usan las paginaciones del historial (la
+resincronización por since_message_id la tiene en cuenta: ver socket.load_messages_since).
+Mientras el modo esté activo, todos los mensajes deben crearse a través de este módulo: con
+submit(), o con ids de allocate_ids() si se insertan en la transacción de quien los crea.
+"""
+import atexit
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.exc import DataError, IntegrityError
+from app.extensions import db
+from app.models.message import Message
+from app.services import counters, positions
+
+class MessageBacklogFull(Exception):
+    """Hay MESSAGE_BATCH_MAX_PENDING mensajes sin guardar y el lote no se ha podido guardar"""
+
+class MessageWriter:
+    def __init__(self):
+        self.app = None
+        self._pending = []
+        # Intentos fallidos y sesión Socket.IO del emisor de cada mensaje pendiente: {message_id: ...}
+        self._attempts = {}
+        self._sids = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._next_id = 0
+        self._last_id = -1
+        self._block_expires = 0
+        self._task_started = False
+
+    def init_app(self, app):
+        if self.app is None:
+            atexit.register(self._flush_at_exit)
+        self.app = app
+
+    def _flush_at_exit(self):
+        if not self._pending:
+            return
+        with self.app.app_context():
+            self.flush()
+
+    def enabled(self):
+        return current_app.config['MESSAGE_BATCH_ENABLED']
+
+    def _reserve_block(self):
+        """Reserva un bloque de ids en el contador compartido (transacción propia y corta)"""
+        size = current_app.config['MESSAGE_ID_BLOCK_SIZE']
+        with db.engine.begin() as conn:
+            # El contador nunca queda por debajo de los ids ya insertados por el camino sin lotes
+            max_id = conn.execute(select(func.max(Message.id))).scalar() or 0
+            last = counters.advance(conn, 'messages', size, floor=max_id)
+            if conn.dialect.name == 'postgresql':
+                # Los ids explícitos no avanzan la secuencia de messages.id: llevarla al final del
+                # bloque para que el camino sin lotes (si se desactiva el modo) no choque con ellos
+                conn.execute(
+                    text("SELECT setval(pg_get_serial_sequence('messages', 'id'), :last)"),
+                    {'last': last}
+                )
+        self._next_id = last - size + 1
+        self._last_id = last
+        self._block_expires = time.monotonic() + current_app.config['MESSAGE_ID_BLOCK_TTL']
+
+    def _allocate_id(self):
+        if self._next_id > self._last_id or time.monotonic() > self._block_expires:
+            self._reserve_block()
+        message_id = self._next_id
+        self._next_id += 1
+        return message_id
+
+    def allocate_ids(self, count):
+        """Ids reservados para mensajes que el llamador inserta en su propia transacción"""
+        with self._lock:
+            return [self._allocate_id() for _ in range(count)]
+
+    def submit(self, event_id, sender, content, to_indicativo_id=None, sid=None):
+        """
+        Encola un mensaje de `sender` (Indicativo.to_dict()) y devuelve su diccionario listo para
+        emitir. Las localizaciones públicas actualizan el índice de posiciones en memoria al
+        momento y su fila de indicativo_positions en el mismo commit que el lote. `sid` es la
+        sesión del emisor, a la que se avisa si el mensaje no se llega a guardar.
+        Lanza MessageBacklogFull si hay demasiados mensajes sin guardar.
+        """
+        self._ensure_task()
+        max_pending = current_app.config['MESSAGE_BATCH_MAX_PENDING']
+        if len(self._pending) >= max_pending:
+            # Límite de durabilidad: si los lotes no se están guardando, no aceptar (ni emitir) más mensajes
+            self.flush()
+            if len(self._pending) >= max_pending:
+                raise MessageBacklogFull(f"{len(self._pending)} mensajes pendientes de guardar")
+        with self._lock:
+            message = Message(
+                id=self._allocate_id(),
+                event_id=int(event_id),
+                indicativo_id=int(sender['id']),
+                to_indicativo_id=int(to_indicativo_id) if to_indicativo_id else None,
+                content=content,
+                timestamp=datetime.utcnow()
+            )
+            self._pending.append(message)
+            if sid:
+                self._sids[message.id] = sid
+            pending = len(self._pending)
+        if content.get('type') == 'location' and not to_indicativo_id:
+            positions.record_position(message, sender, persist=False)
+
+        if pending >= current_app.config['MESSAGE_BATCH_MAX_SIZE']:
+            # Lote completo: lo guarda quien lo ha llenado, sin esperar a la tarea de fondo
+            self.flush()
+        return message.to_dict(sender=sender)
+
+    def _insert(self, messages):
+        """Inserta los mensajes en la sesión y la última localización de cada indicativo en la tabla de posiciones"""
+        db.session.execute(insert(Message), [
+            {
+                'id': m.id,
+                'event_id': m.event_id,
+                'indicativo_id': m.indicativo_id,
+                'to_indicativo_id': m.to_indicativo_id,
+                'content': m.content,
+                'timestamp': m.timestamp
+            }
+            for m in messages
+        ])
+        latest = {}
+        for m in messages:
+            if m.content.get('type') == 'location' and not m.to_indicativo_id:
+                latest[(m.event_id, m.indicativo_id)] = m
+        for (event_id, indicativo_id), m in latest.items():
+            coords = positions.parse_coords(m.content)
+            if coords:
+                positions.persist_position(event_id, indicativo_id, coords[0], coords[1], m.id, m.timestamp)
+
+    def _insert_one_by_one(self, batch):
+        """
+        Guarda el lote mensaje a mensaje (un savepoint por mensaje) tras fallar entero.
+        Devuelve (guardados, descartados como [(mensaje, error)], a reintentar).
+        """
+        saved, dropped, retry = [], [], []
+        for index, m in enumerate(batch):
+            try:
+                with db.session.begin_nested():
+                    self._insert([m])
+                saved.append(m)
+            except (IntegrityError, DataError) as e:
+                dropped.append((m, e))
+            except Exception as e:
+                # Fallo de la base de datos, no del mensaje: el resto espera al siguiente intento
+                current_app.logger.error(f"[MESSAGES] Error al guardar el mensaje {m.id}: {e}")
+                retry = batch[index:]
+                break
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"[MESSAGES] Error al confirmar {len(saved)} mensajes guardados uno a uno: {e}")
+            return [], dropped, saved + retry
+        return saved, dropped, retry
+
+    def _drop(self, message, error):
+        """Descarta un mensaje que no se puede guardar: queda en el log y se avisa a su emisor"""
+        current_app.logger.error(
+            f"[MESSAGES] Mensaje {message.id} descartado (evento {message.event_id}, indicativo "
+            f"{message.indicativo_id} → {message.to_indicativo_id}): {error}. Contenido: {message.content!r}"
+        )
+        sid = self._sids.pop(message.id, None)
+        self._attempts.pop(message.id, None)
+        if sid:
+            from app.socket import socketio
+            socketio.emit('error', {
+                'message': 'No se pudo guardar el mensaje',
+                'message_id': message.id
+            }, to=sid)
+
+    def flush(self):
+        """
+        Guarda los mensajes pendientes, en una sola transacción si es posible. Devuelve cuántos se
+        guardaron; los errores se registran en el log y no se propagan.
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                self._insert(batch)
+                db.session.commit()
+                saved, dropped, retry = batch, [], []
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"[MESSAGES] Error al guardar lote de {len(batch)} mensajes, se guardan uno a uno: {e}")
+                saved, dropped, retry = self._insert_one_by_one(batch)
+            for m in saved:
+                self._sids.pop(m.id, None)
+                self._attempts.pop(m.id, None)
+            max_attempts = current_app.config['MESSAGE_BATCH_MAX_ATTEMPTS']
+            requeue = []
+            for m in retry:
+                self._attempts[m.id] = self._attempts.get(m.id, 0) + 1
+                if self._attempts[m.id] >= max_attempts:
+                    dropped.append((m, f"{max_attempts} intentos fallidos"))
+                else:
+                    requeue.append(m)
+            for m, error in dropped:
+                self._drop(m, error)
+            if requeue:
+                # Devolver a la cola para reintentarlos en el siguiente ciclo
+                with self._lock:
+                    self._pending = requeue + self._pending
+            return len(saved)
+
+    def _ensure_task(self):
+        if self._task_started:
+            return
+        with self._lock:
+            if self._task_started:
+                return
+            self._task_started = True
+        from app.socket import socketio
+        socketio.start_background_task(self._run)
+
+    def _run(self):
+        from app.socket import socketio
+        with self.app.app_context():
+            while True:
+                socketio.sleep(self.app.config['MESSAGE_BATCH_MAX_DELAY_MS'] / 1000.0)
+                with self._lock:
+                    pending = len(self._pending)
+                if not pending:
+                    continue
+                try:
+                    self.flush()
+                except Exception as e:
+                    current_app.logger.error(f"[MESSAGES] Error inesperado al guardar mensajes: {e}")
+                finally:
+                    db.session.remove()
+
+message_writer = MessageWriter()
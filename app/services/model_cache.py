@@ -0,0 +1,132 @@
+"""
+Caché por proceso de eventos e indicativos para el camino caliente del socket.
+
+join_event y send_message solo necesitan saber si el evento existe y está activo y si el
+indicativo pertenece al evento; con esta caché de lectura esas comprobaciones dejan de costar
+2-3 consultas por mensaje. Las rutas de escritura de app/routes/events.py invalidan las
+entradas afectadas y MODEL_CACHE_TTL acota cuánto puede tardar en verse un cambio hecho
+desde otro worker. Los eventos que no existen no se cachean: uno recién creado (en este u
+otro worker) se ve en la siguiente consulta.
+
+resolve_indicativo() busca un indicativo del evento a partir del texto que envían las consolas
+("INDICATIVO (nombre)", el indicativo tal cual o el id numérico) con un índice por nombre que
+se construye a partir de los indicativos cacheados y caduca e invalida con ellos.
+"""
+import threading
+import time
+from flask import current_app
+from app.models.event import Event
+from app.models.indicativo import Indicativo
+
+# Formato: {event_id: (expira_en, event_dict)}
+_events = {}
+# Formato: {event_id: (expira_en, {indicativo_id: indicativo_dict})}
+_indicativos = {}
+# Formato: {event_id: (indicativos_dict del que se construyó, {'display': {...}, 'callsign': {...}})}
+_name_indexes = {}
+_stats = {'event_hits': 0, 'event_misses': 0, 'indicativo_hits': 0, 'indicativo_misses': 0}
+_lock = threading.Lock()
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _expiry():
+    return time.monotonic() + current_app.config['MODEL_CACHE_TTL']
+
+def get_event(event_id):
+    """Diccionario del evento (Event.to_dict) o None si no existe"""
+    event_id = _to_int(event_id)
+    if event_id is None:
+        return None
+    with _lock:
+        entry = _events.get(event_id)
+        if entry and entry[0] > time.monotonic():
+            _stats['event_hits'] += 1
+            return entry[1]
+        _stats['event_misses'] += 1
+    event = Event.query.get(event_id)
+    if event is None:
+        return None
+    event_dict = event.to_dict()
+    with _lock:
+        _events[event_id] = (_expiry(), event_dict)
+    return event_dict
+
+def get_event_indicativos(event_id):
+    """Indicativos del evento como {indicativo_id: Indicativo.to_dict()}"""
+    event_id = _to_int(event_id)
+    if event_id is None:
+        return {}
+    with _lock:
+        entry = _indicativos.get(event_id)
+        if entry and entry[0] > time.monotonic():
+            _stats['indicativo_hits'] += 1
+            return entry[1]
+        _stats['indicativo_misses'] += 1
+    indicativos = {ind.id: ind.to_dict() for ind in Indicativo.query.filter_by(event_id=event_id).all()}
+    with _lock:
+        _indicativos[event_id] = (_expiry(), indicativos)
+    return indicativos
+
+def get_indicativo(event_id, indicativo_id):
+    """Diccionario del indicativo si existe y pertenece al evento, o None"""
+    indicativo_id = _to_int(indicativo_id)
+    if indicativo_id is None:
+        return None
+    return get_event_indicativos(event_id).get(indicativo_id)
+
+def display_name(indicativo):
+    """Nombre con el que las consolas muestran un indicativo: "INDICATIVO (nombre)" o solo el indicativo"""
+    return f"{indicativo['indicativo']} ({indicativo['nombre']})" if indicativo['nombre'] else indicativo['indicativo']
+
+def _name_index(event_id):
+    indicativos = get_event_indicativos(event_id)
+    with _lock:
+        entry = _name_indexes.get(event_id)
+        if entry is not None and entry[0] is indicativos:
+            return entry[1]
+    index = {'display': {}, 'callsign': {}}
+    # Con nombres repetidos gana el indicativo más antiguo
+    for indicativo_id in sorted(indicativos):
+        indicativo = indicativos[indicativo_id]
+        index['display'].setdefault(display_name(indicativo), indicativo)
+        if indicativo['indicativo']:
+            index['callsign'].setdefault(indicativo['indicativo'], indicativo)
+    with _lock:
+        _name_indexes[event_id] = (indicativos, index)
+    return index
+
+def resolve_indicativo(event_id, value):
+    """
+    Indicativo del evento (Indicativo.to_dict()) al que se refiere `value`, o None si es texto
+    libre: por nombre a mostrar, si no por indicativo exacto. Un entero (no un texto con cifras,
+    que puede ser texto libre como "112") se busca como id.
+    """
+    event_id = _to_int(event_id)
+    if event_id is None or value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return get_indicativo(event_id, value)
+    value = str(value).strip()
+    index = _name_index(event_id)
+    return index['display'].get(value) or index['callsign'].get(value)
+
+def invalidate_event(event_id):
+    with _lock:
+        _events.pop(int(event_id), None)
+
+def invalidate_indicativos(event_id):
+    with _lock:
+        _indicativos.pop(int(event_id), None)
+        _name_indexes.pop(int(event_id), None)
+
+def stats():
+    """Contadores de aciertos/fallos y número de entradas cacheadas"""
+    with _lock:
+        data = dict(_stats)
+        data['events_cached'] = len(_events)
+        data['indicativo_events_cached'] = len(_indicativos)
+    return data
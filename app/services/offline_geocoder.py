@@ -0,0 +1,170 @@
+"""
+Geocodificador inverso local, sin conexión, a partir de un extracto de OpenStreetMap.
+
+Con GEOCODING_OFFLINE_FILE apuntando a un GeoJSON de la zona del evento (por ejemplo
+`osmium export` de los portales y calles), las direcciones de los incidentes se calculan en el
+propio servidor en lugar de llamar a Nominatim: útil donde la cobertura es mala. Se usan:
+
+- Portales: Point (o Polygon/MultiPolygon, por su centroide) con `addr:street` y
+  `addr:housenumber` → "calle, número".
+- Calles: LineString/MultiLineString con `name` → "calle", si no hay portal cerca.
+
+Ambos van a índices en rejilla (app/services/spatial.GridIndex) y solo cuentan los que están a
+menos de GEOCODING_OFFLINE_MAX_DISTANCE_METERS. El fichero se carga una vez por proceso, la
+primera vez que se necesita.
+
+El mismo extracto sirve para la búsqueda directa con GEOCODING_SEARCH_PROVIDER='local': cada
+portal y cada calle (en su primer punto) queda en una lista de nombres normalizados (minúsculas
+y sin tildes) donde se buscan las palabras de la consulta.
+"""
+import json
+import threading
+import unicodedata
+from flask import current_app
+from app.services.spatial import GridIndex, haversine_m, point_segment_distance_m
+
+GRID_CELL_METERS = 100.0
+
+class OfflineGeocoder:
+    def __init__(self, features, cell_meters=GRID_CELL_METERS):
+        # Latitud de referencia para dimensionar la rejilla: la de la primera coordenada
+        reference_lat = 0.0
+        for feature in features:
+            coords = _first_coordinate((feature.get('geometry') or {}).get('coordinates'))
+            if coords:
+                reference_lat = coords[1]
+                break
+        self.addresses = GridIndex(cell_meters, reference_lat)
+        self.roads = GridIndex(cell_meters, reference_lat)
+        # Nombres para la búsqueda directa: [(nombre normalizado, nombre, lat, lng)]
+        self.places = []
+        self._road_names = set()
+        for feature in features:
+            self._add_feature(feature)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        features = data.get('features', []) if data.get('type') == 'FeatureCollection' else [data]
+        return cls(features)
+
+    def _add_feature(self, feature):
+        geometry = feature.get('geometry') or {}
+        properties = feature.get('properties') or {}
+        kind = geometry.get('type')
+        coordinates = geometry.get('coordinates')
+        if not coordinates:
+            return
+        street = properties.get('addr:street')
+        housenumber = properties.get('addr:housenumber')
+        if street and housenumber:
+            if kind == 'Point':
+                lng, lat = coordinates[:2]
+            elif kind in ('Polygon', 'MultiPolygon'):
+                lat, lng = _centroid(coordinates)
+            else:
+                return
+            label = f"{street}, {housenumber}"
+            self.addresses.insert((lat, lng, label), lat, lng)
+            self.places.append((normalize_name(label), label, lat, lng))
+            return
+        name = properties.get('name')
+        if not name:
+            return
+        if kind == 'LineString':
+            lines = [coordinates]
+        elif kind == 'MultiLineString':
+            lines = coordinates
+        else:
+            return
+        if name not in self._road_names and lines and lines[0]:
+            self._road_names.add(name)
+            lng, lat = lines[0][0][:2]
+            self.places.append((normalize_name(name), name, lat, lng))
+        for line in lines:
+            for (lng1, lat1), (lng2, lat2) in zip((c[:2] for c in line), (c[:2] for c in line[1:])):
+                segment = (lat1, lng1, lat2, lng2, name)
+                self.roads.insert(segment, min(lat1, lat2), min(lng1, lng2), max(lat1, lat2), max(lng1, lng2))
+
+    def reverse(self, lat, lng, max_distance):
+        """Dirección más cercana a (lat, lng): portal, o si no hay ninguno cerca, calle. None si no hay nada."""
+        address, _ = self.addresses.nearest(
+            lat, lng, lambda item: haversine_m(lat, lng, item[0], item[1]), max_distance
+        )
+        if address is not None:
+            return address[2]
+        road, _ = self.roads.nearest(
+            lat, lng, lambda item: point_segment_distance_m(lat, lng, *item[:4]), max_distance
+        )
+        return road[4] if road is not None else None
+
+    def search(self, query, limit):
+        """
+        Portales y calles cuyo nombre contiene todas las palabras de la consulta, primero los que
+        empiezan por ella y después los más cortos, como [{'lat', 'lng', 'display_name'}].
+        """
+        words = normalize_name(query).split()
+        if not words:
+            return []
+        prefix = ' '.join(words)
+        matches = [place for place in self.places if all(word in place[0] for word in words)]
+        matches.sort(key=lambda place: (not place[0].startswith(prefix), len(place[0]), place[0]))
+        return [{'lat': lat, 'lng': lng, 'display_name': label} for _, label, lat, lng in matches[:limit]]
+
+def normalize_name(text):
+    """Minúsculas, sin tildes ni comas y con espacios simples, para comparar nombres de calles"""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    plain = ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+    return ' '.join(plain.replace(',', ' ').split())
+
+def _first_coordinate(coordinates):
+    while isinstance(coordinates, list) and coordinates and isinstance(coordinates[0], list):
+        coordinates = coordinates[0]
+    return coordinates if isinstance(coordinates, list) and len(coordinates) >= 2 else None
+
+def _centroid(coordinates):
+    """(lat, lng) medios del anillo exterior de un polígono (o del primero de un multipolígono)"""
+    ring = coordinates[0]
+    if ring and isinstance(ring[0][0], list):
+        ring = ring[0]
+    lngs = [c[0] for c in ring]
+    lats = [c[1] for c in ring]
+    return sum(lats) / len(lats), sum(lngs) / len(lngs)
+
+# Geocodificador cargado en este proceso: (ruta, OfflineGeocoder o None si no se pudo cargar)
+_loaded = None
+_lock = threading.Lock()
+
+def get_offline_geocoder():
+    """Geocodificador local si GEOCODING_OFFLINE_FILE está configurado y se ha podido cargar, o None"""
+    global _loaded
+    path = current_app.config['GEOCODING_OFFLINE_FILE']
+    if not path:
+        return None
+    with _lock:
+        if _loaded is None or _loaded[0] != path:
+            try:
+                geocoder = OfflineGeocoder.from_file(path)
+                current_app.logger.info(
+                    f"[GEOCODING] Extracto local cargado: {geocoder.addresses.size} portales, {geocoder.roads.size} tramos de calle"
+                )
+            except (OSError, ValueError) as e:
+                current_app.logger.error(f"[GEOCODING] No se pudo cargar el extracto local {path}: {e}")
+                geocoder = None
+            _loaded = (path, geocoder)
+        return _loaded[1]
+
+def reverse_geocode_offline(lat, lng):
+    """Dirección según el extracto local, o None si no hay extracto o nada cerca"""
+    geocoder = get_offline_geocoder()
+    if geocoder is None:
+        return None
+    return geocoder.reverse(float(lat), float(lng), current_app.config['GEOCODING_OFFLINE_MAX_DISTANCE_METERS'])
+
+def search_offline(query, limit):
+    """Búsqueda directa en el extracto local; lista vacía si no hay extracto"""
+    geocoder = get_offline_geocoder()
+    if geocoder is None:
+        return []
+    return geocoder.search(query, limit)
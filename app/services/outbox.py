@@ -0,0 +1,173 @@
+"""
+Outbox transaccional: efectos secundarios que se guardan con el cambio y se entregan aparte.
+
+Una ruta que además de escribir tiene que avisar a alguien (los mensajes assign_service de las
+asignaciones) llama a add() antes de su commit: la entrada de la tabla outbox va en la misma
+transacción, así que existe si y solo si el cambio se guardó, y la petición termina con ese
+commit. outbox_dispatcher entrega las entradas desde una tarea de fondo por proceso (la arranca
+create_app con start(), o si no el primer add()) llamando al manejador registrado para su tipo
+con @register(tipo).
+
+El manejador escribe en db.session lo que necesite y puede devolver una función a ejecutar tras
+el commit (los emits por socket). La entrada se borra en esa misma transacción: si el worker cae
+antes, sigue en la tabla y la entrega cualquier worker cuando caduca su reserva
+(OUTBOX_LEASE_SECONDS); lo que quedó pendiente en un reinicio se entrega en cuanto arranca el
+worker, sin esperar a que se añada otra entrada. Las entradas se reservan con un UPDATE condicional, así que con varios
+workers cada una la entrega uno solo. Si el manejador falla se reintenta con espera exponencial
+(OUTBOX_RETRY_BASE_SECONDS, duplicándose) hasta OUTBOX_MAX_ATTEMPTS; después queda como 'failed'.
+"""
+import json
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, event, or_, select, update
+from app.extensions import db
+from app.models.outbox import OutboxEntry
+
+WAKE_CHECK_SECONDS = 0.05
+RETRY_MAX_SECONDS = 300
+
+# Manejadores por tipo de entrada: {tipo: función(event_id, payload) -> None o función tras el commit}
+_handlers = {}
+
+def register(kind):
+    """Decorador que registra el manejador de las entradas de tipo `kind`"""
+    def decorator(handler):
+        _handlers[kind] = handler
+        return handler
+    return decorator
+
+def add(kind, payload, event_id=None):
+    """Añade una entrada a la sesión actual. El commit lo hace el llamador, junto con el cambio que la origina."""
+    entry = OutboxEntry(
+        kind=kind,
+        event_id=event_id,
+        payload=json.dumps(payload),
+        status='pending',
+        attempts=0,
+        available_at=datetime.utcnow()
+    )
+    db.session.add(entry)
+    # Avisar a la tarea de fondo de este proceso cuando la entrada sea visible
+    event.listen(db.session(), 'after_commit', outbox_dispatcher.notify, once=True)
+    return entry
+
+class OutboxDispatcher:
+    def __init__(self):
+        self.app = None
+        self._wake = False
+        self._lock = threading.Lock()
+        self._task_started = False
+
+    def init_app(self, app):
+        self.app = app
+
+    def start(self):
+        """Arranca la tarea de fondo al iniciar el worker, para entregar lo pendiente de antes del arranque"""
+        self._ensure_task()
+
+    def notify(self, *args):
+        """Hay entradas nuevas: la tarea de fondo (que se arranca si hace falta) consulta sin esperar"""
+        self._wake = True
+        self._ensure_task()
+
+    def _ensure_task(self):
+        if self._task_started:
+            return
+        with self._lock:
+            if self._task_started:
+                return
+            self._task_started = True
+        from app.socket import socketio
+        socketio.start_background_task(self._run)
+
+    def _claim(self, limit):
+        """Reserva hasta `limit` entradas pendientes para este worker y devuelve sus ids"""
+        now = datetime.utcnow()
+        lease_until = now + timedelta(seconds=current_app.config['OUTBOX_LEASE_SECONDS'])
+        free = or_(OutboxEntry.locked_until.is_(None), OutboxEntry.locked_until < now)
+        candidates = db.session.execute(
+            select(OutboxEntry.id)
+            .where(OutboxEntry.status == 'pending', OutboxEntry.available_at <= now, free)
+            .order_by(OutboxEntry.id)
+            .limit(limit)
+        ).scalars().all()
+        claimed = []
+        for entry_id in candidates:
+            # Otro worker puede haberla reservado entre la consulta y aquí
+            result = db.session.execute(
+                update(OutboxEntry).where(OutboxEntry.id == entry_id, free).values(locked_until=lease_until)
+            )
+            if result.rowcount:
+                claimed.append(entry_id)
+        db.session.commit()
+        return claimed
+
+    def _fail(self, entry_id, attempts, error):
+        attempts += 1
+        values = {'attempts': attempts, 'locked_until': None, 'last_error': (str(error) or error.__class__.__name__)[:500]}
+        if attempts >= current_app.config['OUTBOX_MAX_ATTEMPTS']:
+            values['status'] = 'failed'
+            current_app.logger.error(f"[OUTBOX] Entrada {entry_id}: se abandona tras {attempts} intentos ({error})")
+        else:
+            delay = min(current_app.config['OUTBOX_RETRY_BASE_SECONDS'] * (2 ** (attempts - 1)), RETRY_MAX_SECONDS)
+            values['available_at'] = datetime.utcnow() + timedelta(seconds=delay)
+            current_app.logger.warning(f"[OUTBOX] Entrada {entry_id}: error ({error}), reintento en {delay:.0f}s")
+        db.session.execute(update(OutboxEntry).where(OutboxEntry.id == entry_id).values(**values))
+        db.session.commit()
+
+    def _deliver(self, entry):
+        entry_id, kind, attempts = entry.id, entry.kind, entry.attempts
+        try:
+            handler = _handlers.get(kind)
+            if handler is None:
+                raise LookupError(f"No hay manejador para las entradas de tipo '{kind}'")
+            after_commit = handler(entry.event_id, json.loads(entry.payload))
+            db.session.execute(delete(OutboxEntry).where(OutboxEntry.id == entry_id))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            self._fail(entry_id, attempts, e)
+            return False
+        if after_commit is not None:
+            try:
+                after_commit()
+            except Exception as e:
+                # Ya entregada: los avisos en tiempo real no se repiten
+                current_app.logger.error(f"[OUTBOX] Entrada {entry_id} guardada pero no se pudo notificar: {e}")
+        return True
+
+    def dispatch_pending(self, limit=None):
+        """Reserva y entrega un lote de entradas pendientes. Devuelve cuántas se reservaron."""
+        limit = limit or current_app.config['OUTBOX_BATCH_SIZE']
+        claimed = self._claim(limit)
+        if claimed:
+            entries = OutboxEntry.query.filter(OutboxEntry.id.in_(claimed)).order_by(OutboxEntry.id).all()
+            for entry in entries:
+                self._deliver(entry)
+        return len(claimed)
+
+    def _wait(self):
+        from app.socket import socketio
+        waited = 0.0
+        while not self._wake and waited < self.app.config['OUTBOX_POLL_SECONDS']:
+            socketio.sleep(WAKE_CHECK_SECONDS)
+            waited += WAKE_CHECK_SECONDS
+        self._wake = False
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                claimed = 0
+                try:
+                    claimed = self.dispatch_pending()
+                except Exception as e:
+                    db.session.rollback()
+                    current_app.logger.error(f"[OUTBOX] Error al entregar entradas pendientes: {e}")
+                finally:
+                    db.session.remove()
+                # Con un lote completo puede haber más esperando: seguir sin pausa
+                if claimed < self.app.config['OUTBOX_BATCH_SIZE']:
+                    self._wait()
+
+outbox_dispatcher = OutboxDispatcher()
@@ -0,0 +1,289 @@
+"""
+Índice de últimas posiciones conocidas por evento.
+
+Mantiene en memoria, por evento, la última localización pública de cada indicativo
+para que el mapa se pueda dibujar en O(indicativos) sin reproducir el historial del chat.
+La tabla indicativo_positions respalda el índice y es la referencia común a todos los
+workers: cada evento se carga desde la tabla la primera vez que se consulta en el proceso y
+se recarga pasados POSITIONS_RELOAD_SECONDS, para ver las posiciones que han recibido los
+demás workers. Las posiciones de los mensajes se guardan en la tabla con el propio mensaje;
+las de las localizaciones agregadas (que no generan mensaje) quedan en memoria y una tarea de
+fondo por proceso las guarda todas juntas, en una transacción, cada POSITIONS_RELOAD_SECONDS.
+
+Las mismas posiciones están en una rejilla espacial por evento (spatial.GridIndex) que se
+actualiza con cada posición nueva; nearest() la usa para las unidades más cercanas a un punto.
+"""
+import threading
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from app.extensions import db
+from app.models.indicativo_position import IndicativoPosition
+from app.services.spatial import GridIndex, haversine_m
+
+GRID_CELL_METERS = 250.0
+# Cada cuánto se guardan las localizaciones agregadas si POSITIONS_RELOAD_SECONDS es 0
+DEFAULT_SAVE_SECONDS = 5.0
+
+# Formato: {event_id: {indicativo_id: posicion_dict}}
+_positions = {}
+# Rejilla de las posiciones de cada evento (los elementos son los mismos posicion_dict): {event_id: GridIndex}
+_grids = {}
+# Instante (time.monotonic) en que se cargó cada evento desde la tabla: {event_id: instante}
+_loaded_at = {}
+# Última localización difundida a la sala: {(event_id, indicativo_id): (instante, lat, lng)}
+_broadcasts = {}
+# Localizaciones agregadas aún sin guardar en la tabla: {(event_id, indicativo_id): posicion_dict}
+_unsaved = {}
+_lock = threading.Lock()
+_task_started = False
+
+def _load_event(event_id):
+    rows = IndicativoPosition.query.options(joinedload(IndicativoPosition.indicativo)).filter_by(event_id=event_id).all()
+    return {row.indicativo_id: row.to_dict() for row in rows}
+
+def _stale(event_id, reload_seconds):
+    """Con _lock tomado: True si el evento no está cargado o su carga tiene más de reload_seconds"""
+    if event_id not in _positions:
+        return True
+    return bool(reload_seconds) and time.monotonic() - _loaded_at[event_id] >= reload_seconds
+
+def _event_positions(event_id):
+    reload_seconds = current_app.config['POSITIONS_RELOAD_SECONDS']
+    with _lock:
+        if not _stale(event_id, reload_seconds):
+            return _positions[event_id]
+    loaded = _load_event(event_id)
+    with _lock:
+        if _stale(event_id, reload_seconds):
+            # Las posiciones en memoria aún sin guardar o más recientes que la fila se conservan
+            for indicativo_id, position in (_positions.get(event_id) or {}).items():
+                row = loaded.get(indicativo_id)
+                if (event_id, indicativo_id) in _unsaved or (row is not None and position['timestamp'] > row['timestamp']):
+                    loaded[indicativo_id] = position
+            _positions[event_id] = loaded
+            _grids[event_id] = _build_grid(loaded)
+            _loaded_at[event_id] = time.monotonic()
+        return _positions[event_id]
+
+def _build_grid(positions):
+    reference_lat = next(iter(positions.values()))['lat'] if positions else 0.0
+    grid = GridIndex(GRID_CELL_METERS, reference_lat)
+    for position in positions.values():
+        grid.insert(position, position['lat'], position['lng'])
+    return grid
+
+def get_event_positions(event_id):
+    """Lista con la última posición de cada indicativo del evento"""
+    positions = _event_positions(int(event_id))
+    with _lock:
+        return list(positions.values())
+
+def get_position(event_id, indicativo_id):
+    """Última posición conocida de un indicativo o None"""
+    positions = _event_positions(int(event_id))
+    with _lock:
+        return positions.get(int(indicativo_id))
+
+def record_position(message, indicativo, persist=True):
+    """
+    Registra la posición de un mensaje de localización enviado por `indicativo` (Indicativo.to_dict()).
+    Con persist=True actualiza también la fila de indicativo_positions en la sesión actual; el
+    commit queda a cargo del llamador para que vaya en la misma transacción que el mensaje.
+    Devuelve el diccionario de posición o None si el contenido no trae coordenadas válidas.
+    """
+    coords = parse_coords(message.content)
+    if coords is None:
+        return None
+    lat, lng = coords
+    timestamp = message.timestamp or datetime.utcnow()
+    if persist:
+        persist_position(int(message.event_id), int(indicativo['id']), lat, lng, message.id, timestamp)
+    return update_position(message.event_id, indicativo, lat, lng, timestamp, message_id=message.id)
+
+def save_position(event_id, indicativo, lat, lng):
+    """
+    Registra una posición que no va en ningún mensaje (localización agregada) y la devuelve.
+    Solo actualiza la memoria: la tarea de fondo la guarda en indicativo_positions en su
+    siguiente pasada, junto con las demás pendientes (solo la última de cada indicativo).
+    """
+    position = update_position(event_id, indicativo, lat, lng)
+    with _lock:
+        _unsaved[(position['event_id'], position['indicativo_id'])] = position
+    _ensure_task()
+    return position
+
+def save_unsaved():
+    """Guarda en una transacción las localizaciones agregadas pendientes. Devuelve cuántas."""
+    with _lock:
+        pending = list(_unsaved.values())
+        _unsaved.clear()
+    saved = 0
+    for position in pending:
+        timestamp = datetime.strptime(position['timestamp'], '%Y-%m-%d %H:%M:%S')
+        try:
+            with db.session.begin_nested():
+                persist_position(position['event_id'], position['indicativo_id'], position['lat'], position['lng'],
+                                 None, timestamp)
+            saved += 1
+        except IntegrityError as e:
+            # P. ej. el indicativo se ha borrado mientras tanto: esa posición ya no hace falta
+            current_app.logger.warning(
+                f"[POSITIONS] No se guardó la posición del indicativo {position['indicativo_id']}: {e}"
+            )
+    db.session.commit()
+    return saved
+
+def _save_interval(app):
+    return app.config['POSITIONS_RELOAD_SECONDS'] or DEFAULT_SAVE_SECONDS
+
+def _ensure_task():
+    global _task_started
+    with _lock:
+        if _task_started:
+            return
+        _task_started = True
+    from app.socket import socketio
+    socketio.start_background_task(_run, current_app._get_current_object())
+
+def _run(app):
+    from app.socket import socketio
+    with app.app_context():
+        while True:
+            socketio.sleep(_save_interval(app))
+            if not _unsaved:
+                continue
+            try:
+                save_unsaved()
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"[POSITIONS] Error al guardar localizaciones agregadas: {e}")
+            finally:
+                db.session.remove()
+
+def update_position(event_id, indicativo, lat, lng, timestamp=None, message_id=None):
+    """Actualiza solo el índice en memoria con la posición de un indicativo y la devuelve"""
+    event_id = int(event_id)
+    indicativo_id = int(indicativo['id'])
+    timestamp = timestamp or datetime.utcnow()
+    position = {
+        'event_id': event_id,
+        'indicativo_id': indicativo_id,
+        'indicativo': indicativo['indicativo'],
+        'nombre': indicativo['nombre'],
+        'indicativo_color': indicativo['color'] or None,
+        'lat': lat,
+        'lng': lng,
+        'message_id': message_id,
+        'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S')
+    }
+    _event_positions(event_id)
+    with _lock:
+        # El índice del evento puede haberse recargado o invalidado desde que se obtuvo
+        positions = _positions.get(event_id)
+        if positions is None:
+            return position
+        previous = positions.get(indicativo_id)
+        if previous is not None and previous['timestamp'] > position['timestamp']:
+            return position
+        positions[indicativo_id] = position
+        grid = _grids.get(event_id)
+        if grid is not None:
+            if previous is not None:
+                grid.remove(previous, previous['lat'], previous['lng'])
+            elif not grid.size:
+                # Primera posición del evento: dimensionar la rejilla a su latitud
+                grid = _grids[event_id] = GridIndex(GRID_CELL_METERS, lat)
+            grid.insert(position, lat, lng)
+    return position
+
+def nearest(event_id, lat, lng, k, max_distance=None, accept=None):
+    """
+    Las `k` últimas posiciones más cercanas a (lat, lng) como [(posicion_dict, metros)], de
+    menor a mayor distancia; solo las que cumplen `accept(posicion_dict)` si se indica.
+    """
+    event_id = int(event_id)
+    _event_positions(event_id)
+    with _lock:
+        grid = _grids.get(event_id)
+        if grid is None:
+            return []
+        return grid.k_nearest(
+            lat, lng, k, lambda position: haversine_m(lat, lng, position['lat'], position['lng']), max_distance, accept
+        )
+
+def parse_coords(content):
+    """(lat, lng) como floats a partir del contenido de un mensaje de localización, o None"""
+    if not isinstance(content, dict):
+        return None
+    try:
+        return float(content.get('lat')), float(content.get('lng'))
+    except (TypeError, ValueError):
+        return None
+
+def should_coalesce(event_id, indicativo_id, lat, lng):
+    """
+    Política de agregación de localizaciones por indicativo. Devuelve True si la nueva posición
+    está dentro del umbral respecto a la última difundida (llega antes de
+    LOCATION_MIN_INTERVAL_SECONDS o se ha movido menos de LOCATION_MIN_DISTANCE_METERS); en ese
+    caso solo debe refrescarse la última posición, sin crear mensaje ni difundirlo a la sala.
+    Si devuelve False la posición pasa a ser la última difundida.
+    """
+    min_interval = current_app.config['LOCATION_MIN_INTERVAL_SECONDS']
+    min_distance = current_app.config['LOCATION_MIN_DISTANCE_METERS']
+    if not min_interval and not min_distance:
+        return False
+    key = (int(event_id), int(indicativo_id))
+    now = time.monotonic()
+    with _lock:
+        last = _broadcasts.get(key)
+        if last is not None:
+            last_time, last_lat, last_lng = last
+            if min_interval and now - last_time < min_interval:
+                return True
+            if min_distance and haversine_m(last_lat, last_lng, lat, lng) < min_distance:
+                return True
+        _broadcasts[key] = (now, lat, lng)
+    return False
+
+def persist_position(event_id, indicativo_id, lat, lng, message_id, timestamp):
+    """
+    Inserta o actualiza en la sesión la fila de indicativo_positions (sin commit). Una posición
+    más antigua que la guardada (un lote de mensajes que se guarda tarde) no la sustituye.
+    """
+    values = {'lat': lat, 'lng': lng, 'message_id': message_id, 'timestamp': timestamp}
+    update_newer = (
+        update(IndicativoPosition)
+        .where(IndicativoPosition.event_id == event_id, IndicativoPosition.indicativo_id == indicativo_id,
+               IndicativoPosition.timestamp <= timestamp)
+        .values(**values)
+    )
+    if db.session.execute(update_newer).rowcount:
+        return
+    # No hay fila o la guardada es más reciente. En un savepoint, para que si otro worker la
+    # inserta a la vez (o ya existía) no se pierda el resto de la transacción (p. ej. el mensaje)
+    try:
+        with db.session.begin_nested():
+            db.session.add(IndicativoPosition(event_id=event_id, indicativo_id=indicativo_id, **values))
+    except IntegrityError:
+        # La fila existe: solo se sustituye si la nuestra es más reciente
+        db.session.execute(update_newer)
+
+def delete_positions(event_id, indicativo_id=None):
+    """Elimina de la sesión las posiciones del evento (o de un indicativo). El commit lo hace el llamador."""
+    query = IndicativoPosition.query.filter_by(event_id=event_id)
+    if indicativo_id is not None:
+        query = query.filter_by(indicativo_id=indicativo_id)
+    query.delete(synchronize_session=False)
+
+def invalidate_event(event_id):
+    """Descarta el índice en memoria del evento; se recargará desde la tabla en la próxima consulta"""
+    with _lock:
+        _positions.pop(int(event_id), None)
+        _grids.pop(int(event_id), None)
+        _loaded_at.pop(int(event_id), None)
+        for key in [key for key in _unsaved if key[0] == int(event_id)]:
+            del _unsaved[key]
@@ -0,0 +1,168 @@
+"""
+Registro de presencia: qué indicativos tienen ahora mismo una conexión Socket.IO en cada evento.
+
+Cada sesión (sid) que hace join_event queda asociada a (event_id, indicativo_id) hasta que
+hace leave_event o se desconecta. Un indicativo puede tener varias sesiones abiertas (varias
+pestañas o dispositivos): sigue en línea mientras le quede alguna.
+
+Las sesiones se guardan en la tabla presence_sessions, así que con varios workers (cola de
+mensajes de Socket.IO) todos ven las conexiones de todos. Cada proceso recuerda además sus
+propias sesiones y una tarea de fondo refresca su seen_at cada PRESENCE_HEARTBEAT_SECONDS;
+una sesión sin refrescar en PRESENCE_TIMEOUT_SECONDS (su worker ha caído) deja de contar y la
+tarea de cualquier worker la borra y avisa con user_left si el indicativo se queda sin ninguna.
+"""
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import delete, func, select, update
+from app.extensions import db
+from app.models.presence_session import PresenceSession
+from app.services import model_cache
+
+# Sesiones de este proceso. Formato: {sid: (event_id, indicativo_id)}
+_sessions = {}
+_lock = threading.Lock()
+_task_started = False
+
+def _worker():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+def _alive():
+    """Condición de las sesiones que siguen contando (refrescadas dentro de PRESENCE_TIMEOUT_SECONDS)"""
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['PRESENCE_TIMEOUT_SECONDS'])
+    return PresenceSession.seen_at >= cutoff
+
+def _has_sessions(event_id, indicativo_id):
+    return db.session.execute(
+        select(PresenceSession.id)
+        .where(PresenceSession.event_id == event_id, PresenceSession.indicativo_id == indicativo_id, _alive())
+        .limit(1)
+    ).first() is not None
+
+def join(sid, event_id, indicativo_id, encoding='json'):
+    """
+    Asocia la sesión al indicativo en el evento (sustituyendo la asociación anterior de la
+    sesión, si la había) con la codificación de chat negociada (wire). Devuelve True si el
+    indicativo acaba de pasar a estar en línea.
+    """
+    event_id, indicativo_id = int(event_id), int(indicativo_id)
+    with _lock:
+        rejoin = _sessions.get(sid) == (event_id, indicativo_id)
+        _sessions[sid] = (event_id, indicativo_id)
+    if rejoin:
+        # Mismo evento e indicativo: solo puede haber cambiado la codificación
+        db.session.execute(update(PresenceSession).where(PresenceSession.sid == sid).values(encoding=encoding))
+        db.session.commit()
+        return False
+    _ensure_task()
+    db.session.execute(delete(PresenceSession).where(PresenceSession.sid == sid))
+    was_online = _has_sessions(event_id, indicativo_id)
+    now = datetime.utcnow()
+    db.session.add(PresenceSession(
+        sid=sid, worker=_worker(), event_id=event_id, indicativo_id=indicativo_id, encoding=encoding,
+        since=now, seen_at=now
+    ))
+    db.session.commit()
+    return not was_online
+
+def leave(sid):
+    """
+    Elimina la sesión del registro (leave_event o desconexión).
+    Devuelve (event_id, indicativo_id) si con ella el indicativo deja de estar en línea, o None.
+    """
+    with _lock:
+        entry = _sessions.pop(sid, None)
+    if entry is None:
+        return None
+    db.session.execute(delete(PresenceSession).where(PresenceSession.sid == sid))
+    db.session.commit()
+    if _has_sessions(*entry):
+        return None
+    return entry
+
+def session(sid):
+    """(event_id, indicativo_id) de la sesión o None si no está en ningún evento"""
+    with _lock:
+        return _sessions.get(sid)
+
+def is_online(event_id, indicativo_id):
+    return _has_sessions(int(event_id), int(indicativo_id))
+
+def get_online(event_id):
+    """Indicativos en línea del evento como {indicativo_id: {'since': ..., 'sessions': n}}"""
+    rows = db.session.execute(
+        select(PresenceSession.indicativo_id, func.min(PresenceSession.since), func.count(PresenceSession.id))
+        .where(PresenceSession.event_id == int(event_id), _alive())
+        .group_by(PresenceSession.indicativo_id)
+    ).all()
+    return {
+        indicativo_id: {'since': since.strftime('%Y-%m-%d %H:%M:%S'), 'sessions': sessions}
+        for indicativo_id, since, sessions in rows
+    }
+
+def get_encodings(event_id):
+    """Codificaciones de chat que usa alguna sesión en línea del evento (de cualquier worker)"""
+    return set(db.session.execute(
+        select(PresenceSession.encoding).where(PresenceSession.event_id == int(event_id), _alive()).distinct()
+    ).scalars())
+
+def describe_online(event_id):
+    """Lista de indicativos en línea del evento (Indicativo.to_dict() con 'online_since' y 'sessions')"""
+    indicativos = model_cache.get_event_indicativos(event_id)
+    result = []
+    for indicativo_id, presence in get_online(event_id).items():
+        indicativo = indicativos.get(indicativo_id)
+        if indicativo is None:
+            # Indicativo eliminado con la sesión aún abierta
+            continue
+        data = dict(indicativo)
+        data['online_since'] = presence['since']
+        data['sessions'] = presence['sessions']
+        result.append(data)
+    return result
+
+def heartbeat():
+    """
+    Refresca seen_at de las sesiones de este proceso y borra las caducadas de cualquier worker.
+    Devuelve los (event_id, indicativo_id) que se han quedado sin sesiones al borrarlas.
+    """
+    with _lock:
+        sids = list(_sessions)
+    now = datetime.utcnow()
+    if sids:
+        db.session.execute(update(PresenceSession).where(PresenceSession.sid.in_(sids)).values(seen_at=now))
+    expired = db.session.execute(
+        select(PresenceSession.id, PresenceSession.event_id, PresenceSession.indicativo_id).where(~_alive())
+    ).all()
+    removed = set()
+    for session_id, event_id, indicativo_id in expired:
+        # Con varios workers limpiando a la vez, cada sesión la borra (y la avisa) uno solo
+        if db.session.execute(delete(PresenceSession).where(PresenceSession.id == session_id)).rowcount:
+            removed.add((event_id, indicativo_id))
+    db.session.commit()
+    return [entry for entry in removed if not _has_sessions(*entry)]
+
+def _ensure_task():
+    global _task_started
+    with _lock:
+        if _task_started:
+            return
+        _task_started = True
+    from app.socket import socketio
+    socketio.start_background_task(_run, current_app._get_current_object())
+
+def _run(app):
+    from app.socket import notify_user_left, socketio
+    with app.app_context():
+        while True:
+            socketio.sleep(app.config['PRESENCE_HEARTBEAT_SECONDS'])
+            try:
+                for event_id, indicativo_id in heartbeat():
+                    notify_user_left(event_id, indicativo_id)
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.error(f"[PRESENCE] Error al refrescar las sesiones: {e}")
+            finally:
+                db.session.remove()
@@ -0,0 +1,52 @@
+"""
+Registro de capacidades del esquema de la base de datos.
+
+Algunas instalaciones tienen tablas sin todas las columnas del modelo (por ejemplo
+incident_assignments sin servicio_nombre o sin las fechas *_asig) y las rutas de asignaciones
+adaptan sus consultas a lo que exista. En lugar de preguntar a la base de datos en cada petición
+(PRAGMA table_info solo funciona en SQLite), las columnas se leen una vez por proceso con el
+inspector de SQLAlchemy, que funciona con cualquier dialecto. create_app las lee al arrancar
+con load(); nada las vuelve a leer en un worker en marcha, así que después de aplicar
+migraciones (flask db upgrade) hay que reiniciar los workers.
+"""
+import threading
+from sqlalchemy import inspect
+from sqlalchemy.exc import NoSuchTableError
+from app.extensions import db
+
+ASSIGNMENTS_TABLE = 'incident_assignments'
+
+# Formato: {tabla: frozenset(columnas)}
+_columns = {}
+_lock = threading.Lock()
+
+def columns(table):
+    """Columnas existentes de la tabla (conjunto vacío si la tabla no existe)"""
+    with _lock:
+        cached = _columns.get(table)
+    if cached is not None:
+        return cached
+    try:
+        found = frozenset(col['name'] for col in inspect(db.engine).get_columns(table))
+    except NoSuchTableError:
+        found = frozenset()
+    with _lock:
+        _columns[table] = found
+    return found
+
+def has_column(table, column):
+    return column in columns(table)
+
+def assignment_columns():
+    """Columnas de incident_assignments, consultadas por las rutas de asignaciones"""
+    return columns(ASSIGNMENTS_TABLE)
+
+def refresh():
+    """Descarta las columnas leídas; se vuelven a inspeccionar en el siguiente uso"""
+    with _lock:
+        _columns.clear()
+
+def load():
+    """Inspecciona de nuevo las tablas con columnas opcionales (al arrancar o tras migrar)"""
+    refresh()
+    assignment_columns()
@@ -0,0 +1,100 @@
+"""
+Cola de mensajes entre procesos para Socket.IO.
+
+Con varios workers (gunicorn -w N) o varios nodos, cada proceso solo conoce a sus propios
+clientes: un emit(..., room=...) hecho en un worker no llega a los clientes conectados a otro.
+Flask-SocketIO resuelve esto con un gestor pub/sub compartido (Redis, Kafka, AMQP vía Kombu...).
+
+SOCKETIO_MESSAGE_QUEUE acepta cualquiera de esas URLs y, además, 'sqlite-pubsub://<ruta>',
+un sustituto local sin servicios externos pensado para un único servidor: los procesos
+publican en una tabla SQLite compartida y cada uno la sondea periódicamente. Sirve para probar
+el reparto entre servidores (tests/test_socket_queue.py); socketio.test_client no admite
+ninguna cola de mensajes, así que las pruebas de los manejadores van sin ella.
+"""
+import pickle
+import sqlite3
+import threading
+import time
+
+import socketio
+
+SQLITE_PUBSUB_SCHEME = 'sqlite-pubsub://'
+
+class SQLitePubSubManager(socketio.PubSubManager):
+    """Gestor pub/sub de Socket.IO respaldado por un fichero SQLite compartido entre procesos"""
+    name = 'sqlite-pubsub'
+
+    def __init__(self, url=SQLITE_PUBSUB_SCHEME + '/socketio_queue.db', channel='socketio',
+                 write_only=False, logger=None, poll_interval=0.05, retention=60):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        # Mismo convenio que SQLAlchemy: sqlite-pubsub:///relativa.db o sqlite-pubsub:////ruta/absoluta.db
+        self.path = url[len(SQLITE_PUBSUB_SCHEME):]
+        if self.path.startswith('/'):
+            self.path = self.path[1:]
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._local = threading.local()
+        self._last_purge = 0
+        self._create_table()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _connection(self):
+        # Las conexiones sqlite3 no se comparten entre hilos: una por hilo publicador
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def _create_table(self):
+        conn = self._connect()
+        try:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS socketio_pubsub ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'channel TEXT NOT NULL, '
+                'payload BLOB NOT NULL, '
+                'created_at REAL NOT NULL)'
+            )
+        finally:
+            conn.close()
+
+    def _publish(self, data):
+        conn = self._connection()
+        now = time.time()
+        conn.execute(
+            'INSERT INTO socketio_pubsub (channel, payload, created_at) VALUES (?, ?, ?)',
+            (self.channel, pickle.dumps(data), now)
+        )
+        # Purgar de vez en cuando los mensajes que todos los procesos ya han tenido tiempo de leer
+        if now - self._last_purge > self.retention:
+            self._last_purge = now
+            conn.execute('DELETE FROM socketio_pubsub WHERE created_at < ?', (now - self.retention,))
+
+    def _listen(self):
+        conn = self._connect()
+        # Solo interesan los mensajes publicados a partir del arranque de este proceso
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM socketio_pubsub').fetchone()[0]
+        while True:
+            rows = conn.execute(
+                'SELECT id, payload FROM socketio_pubsub WHERE channel = ? AND id > ? ORDER BY id',
+                (self.channel, last_id)
+            ).fetchall()
+            for row_id, payload in rows:
+                last_id = row_id
+                yield payload
+            self.server.sleep(self.poll_interval)
+
+def socketio_queue_options(config):
+    """Argumentos para socketio.init_app según SOCKETIO_MESSAGE_QUEUE (vacío = sin cola, un solo proceso)"""
+    url = config.get('SOCKETIO_MESSAGE_QUEUE')
+    if not url:
+        return {}
+    channel = config.get('SOCKETIO_CHANNEL', 'flask-socketio')
+    if url.startswith(SQLITE_PUBSUB_SCHEME):
+        return {'client_manager': SQLitePubSubManager(url, channel=channel)}
+    return {'message_queue': url, 'channel': channel}
@@ -0,0 +1,149 @@
+"""Utilidades geográficas compartidas por los servicios de posiciones y geocodificación"""
+import bisect
+import math
+
+EARTH_RADIUS_M = 6371000.0
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Distancia en metros entre dos coordenadas (fórmula del semiverseno)"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+METERS_PER_DEGREE = math.pi * EARTH_RADIUS_M / 180.0
+
+def point_segment_distance_m(lat, lng, lat1, lng1, lat2, lng2):
+    """
+    Distancia en metros de un punto a un segmento. Proyección equirrectangular centrada en el
+    punto: suficiente para segmentos de calle (cientos de metros como mucho).
+    """
+    scale_x = METERS_PER_DEGREE * math.cos(math.radians(lat))
+    ax, ay = (lng1 - lng) * scale_x, (lat1 - lat) * METERS_PER_DEGREE
+    bx, by = (lng2 - lng) * scale_x, (lat2 - lat) * METERS_PER_DEGREE
+    dx, dy = bx - ax, by - ay
+    length2 = dx * dx + dy * dy
+    t = 0.0 if length2 == 0 else max(0.0, min(1.0, -(ax * dx + ay * dy) / length2))
+    return math.hypot(ax + t * dx, ay + t * dy)
+
+class GridIndex:
+    """
+    Índice espacial en rejilla regular de celdas de `cell_meters` metros (aprox.). Cada elemento
+    se guarda en las celdas que toca su caja envolvente; nearest() recorre anillos de celdas
+    alrededor del punto hasta que ningún elemento sin visitar puede estar más cerca que el mejor.
+    """
+
+    def __init__(self, cell_meters=100.0, reference_lat=0.0):
+        self.cell_meters = float(cell_meters)
+        self.cell_lat = self.cell_meters / METERS_PER_DEGREE
+        # Las celdas se dimensionan en longitud a la latitud de referencia (la zona del evento)
+        self.cell_lng = self.cell_lat / max(math.cos(math.radians(reference_lat)), 0.01)
+        self._cells = {}
+        self.size = 0
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_lat)), int(math.floor(lng / self.cell_lng))
+
+    def insert(self, item, min_lat, min_lng, max_lat=None, max_lng=None):
+        """Añade un elemento con su caja envolvente (o un punto si no se dan max_lat/max_lng)"""
+        for cell in self._covered(min_lat, min_lng, max_lat, max_lng):
+            self._cells.setdefault(cell, []).append(item)
+        self.size += 1
+
+    def remove(self, item, min_lat, min_lng, max_lat=None, max_lng=None):
+        """Quita un elemento (el mismo objeto, con la misma caja con la que se insertó)"""
+        found = False
+        for cell in self._covered(min_lat, min_lng, max_lat, max_lng):
+            items = self._cells.get(cell)
+            if not items:
+                continue
+            for i, other in enumerate(items):
+                if other is item:
+                    del items[i]
+                    found = True
+                    break
+            if not items:
+                del self._cells[cell]
+        if found:
+            self.size -= 1
+        return found
+
+    def _covered(self, min_lat, min_lng, max_lat=None, max_lng=None):
+        if max_lat is None:
+            max_lat, max_lng = min_lat, min_lng
+        row0, col0 = self._cell(min_lat, min_lng)
+        row1, col1 = self._cell(max_lat, max_lng)
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                yield row, col
+
+    def _ring(self, row, col, radius):
+        if radius == 0:
+            yield row, col
+            return
+        for c in range(col - radius, col + radius + 1):
+            yield row - radius, c
+            yield row + radius, c
+        for r in range(row - radius + 1, row + radius):
+            yield r, col - radius
+            yield r, col + radius
+
+    def nearest(self, lat, lng, distance, max_distance=None):
+        """
+        Elemento más cercano a (lat, lng) según `distance(item) -> metros` y su distancia, o
+        (None, None) si no hay ninguno (a menos de max_distance metros, si se indica).
+        """
+        found = self.k_nearest(lat, lng, 1, distance, max_distance)
+        return found[0] if found else (None, None)
+
+    def k_nearest(self, lat, lng, k, distance, max_distance=None, accept=None):
+        """
+        Los `k` elementos más cercanos a (lat, lng) como [(elemento, metros)] de menor a mayor
+        distancia, solo los que cumplen `accept(item)` si se indica. Cuando los anillos ya
+        recorren más celdas de las que hay ocupadas (elementos muy dispersos), termina
+        recorriendo directamente las celdas ocupadas.
+        """
+        if not self._cells or k <= 0:
+            return []
+        row, col = self._cell(lat, lng)
+        # Distancia mínima garantizada hasta las celdas del anillo r: (r - 1) celdas completas
+        cell_min_m = min(self.cell_lat, self.cell_lng * math.cos(math.radians(lat))) * METERS_PER_DEGREE
+        max_radius = int(max_distance / cell_min_m) + 1 if max_distance is not None else None
+        found = []  # [(distancia, orden, elemento)] de los k mejores, ordenada
+        seen = set()
+        cells_visited = 0
+
+        def visit(items):
+            for item in items:
+                if id(item) in seen:
+                    continue
+                seen.add(id(item))
+                if accept is not None and not accept(item):
+                    continue
+                d = distance(item)
+                if max_distance is not None and d > max_distance:
+                    continue
+                if len(found) < k or d < found[-1][0]:
+                    bisect.insort(found, (d, len(seen), item))
+                    del found[k:]
+
+        radius = 0
+        while True:
+            for cell in self._ring(row, col, radius):
+                cells_visited += 1
+                items = self._cells.get(cell)
+                if items:
+                    visit(items)
+            if len(found) == k and found[-1][0] <= radius * cell_min_m:
+                break
+            if max_radius is not None and radius >= max_radius:
+                break
+            if len(seen) >= self.size:
+                break
+            if cells_visited > len(self._cells):
+                for items in list(self._cells.values()):
+                    visit(items)
+                break
+            radius += 1
+        return [(item, d) for d, _, item in found]
@@ -0,0 +1,158 @@
+"""
+Codificación de los mensajes de chat enviados por Socket.IO.
+
+JSON es la codificación por defecto. Con SOCKETIO_COMPACT_ENCODING activo, un cliente puede
+anunciar en join_event `accept_encodings: ['msgpack']` y recibir message_history,
+older_messages y new_message en MessagePack: marcas de tiempo como epoch en segundos, el
+historial en columnas (una lista por campo en lugar de un dict por mensaje) y los datos de
+cada emisor una sola vez en 'senders'.
+
+Como cada cliente recibe una sola codificación, el chat usa salas propias por codificación
+(chat_<event_id>_<codificación> y la sala privada de cada indicativo con sufijo); la sala
+event_<event_id> queda para el resto de avisos del evento. La codificación de cada sesión se
+guarda con su presencia, y los mensajes solo se codifican y emiten en las que usa alguna
+sesión en línea del evento.
+"""
+import calendar
+import threading
+from datetime import datetime
+from flask import current_app
+
+try:
+    import msgpack
+except ImportError:  # Dependencia opcional: sin ella solo se ofrece JSON
+    msgpack = None
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+COMPACT_VERSION = 1
+MESSAGE_COLUMNS = ('id', 'indicativo_id', 'to_indicativo_id', 'timestamp', 'content')
+
+# Codificación negociada por cada cliente conectado: {sid: codificación}
+_client_encodings = {}
+_lock = threading.Lock()
+
+def compact_enabled():
+    return msgpack is not None and current_app.config['SOCKETIO_COMPACT_ENCODING']
+
+def negotiate(accept_encodings):
+    """Codificación a usar con un cliente según lo que anuncia (JSON si no pide otra o no está disponible)"""
+    if accept_encodings and MSGPACK in accept_encodings and compact_enabled():
+        return MSGPACK
+    return JSON
+
+def set_client_encoding(sid, encoding):
+    with _lock:
+        _client_encodings[sid] = encoding
+
+def client_encoding(sid):
+    with _lock:
+        return _client_encodings.get(sid, JSON)
+
+def forget_client(sid):
+    with _lock:
+        _client_encodings.pop(sid, None)
+
+def chat_room(event_id, encoding=JSON):
+    """Sala de los mensajes públicos del evento para una codificación"""
+    return f'chat_{event_id}_{encoding}'
+
+def private_room(indicativo_id, event_id, encoding=JSON):
+    """Sala de los mensajes privados de un indicativo para una codificación"""
+    room = f'indicativo_{indicativo_id}_event_{event_id}'
+    return room if encoding == JSON else f'{room}_{encoding}'
+
+def event_encodings(event_id):
+    """Codificaciones con algún cliente en línea en el evento (solo JSON si la compacta no está activa)"""
+    if not compact_enabled():
+        return (JSON,)
+    from app.services import presence
+    encodings = presence.get_encodings(event_id)
+    return tuple(encoding for encoding in (JSON, MSGPACK) if encoding in encodings)
+
+def _epoch(timestamp):
+    if not timestamp:
+        return None
+    return calendar.timegm(datetime.strptime(timestamp, '%Y-%m-%d %H:%M:%S').timetuple())
+
+def compact_messages(messages, **extra):
+    """Convierte una lista de Message.to_dict() al formato compacto en columnas (sin serializar)"""
+    columns = [[] for _ in MESSAGE_COLUMNS]
+    senders = {}
+    event_id = None
+    for msg in messages:
+        event_id = msg['event_id']
+        row = (msg['id'], msg['indicativo_id'], msg['to_indicativo_id'], _epoch(msg['timestamp']), msg['content'])
+        for column, value in zip(columns, row):
+            column.append(value)
+        if msg['indicativo_id'] not in senders:
+            senders[msg['indicativo_id']] = [msg['indicativo'], msg['nombre'], msg['indicativo_color']]
+    data = {
+        'v': COMPACT_VERSION,
+        'event_id': event_id,
+        'columns': list(MESSAGE_COLUMNS),
+        'data': columns,
+        'senders': senders
+    }
+    data.update(extra)
+    return data
+
+def encode_messages(messages, encoding, **extra):
+    """
+    Payload de una lista de mensajes para la codificación dada. En JSON se mantiene el formato
+    de siempre ({'messages': [...], **extra}); en MessagePack, el compacto en columnas.
+    """
+    if encoding == MSGPACK:
+        return msgpack.packb(compact_messages(messages, **extra))
+    payload = {'messages': messages}
+    payload.update(extra)
+    return payload
+
+def message_rooms(msg_dict, encoding=JSON):
+    """Salas que reciben un mensaje: la pública del evento, o las privadas del emisor y del destinatario"""
+    event_id = msg_dict['event_id']
+    if not msg_dict['to_indicativo_id']:
+        return [chat_room(event_id, encoding)]
+    rooms = [private_room(msg_dict['indicativo_id'], event_id, encoding)]
+    if str(msg_dict['to_indicativo_id']) != str(msg_dict['indicativo_id']):
+        rooms.append(private_room(msg_dict['to_indicativo_id'], event_id, encoding))
+    return rooms
+
+def emit_new_message(msg_dict, emitter=None):
+    """
+    Emite new_message a las salas de chat que correspondan en las codificaciones en uso en el
+    evento: la sala pública del evento, o las salas privadas del emisor y del destinatario.
+    """
+    if emitter is None:
+        from app.socket import socketio
+        emitter = socketio
+    for encoding in event_encodings(msg_dict['event_id']):
+        payload = msg_dict if encoding == JSON else encode_messages([msg_dict], encoding)
+        for room in message_rooms(msg_dict, encoding):
+            emitter.emit('new_message', payload, room=room)
+
+def emit_new_messages(msg_dicts, emitter=None):
+    """
+    Emite varios mensajes agrupados por sala: en MessagePack, un solo new_message por sala con
+    todos sus mensajes (el formato en columnas admite varios); en JSON, cuyo new_message lleva
+    un único mensaje, uno por mensaje en el orden de la lista.
+    """
+    if not msg_dicts:
+        return
+    if emitter is None:
+        from app.socket import socketio
+        emitter = socketio
+    encodings = {event_id: event_encodings(event_id) for event_id in {msg_dict['event_id'] for msg_dict in msg_dicts}}
+    for encoding in (JSON, MSGPACK):
+        by_room = {}
+        for msg_dict in msg_dicts:
+            if encoding not in encodings[msg_dict['event_id']]:
+                continue
+            for room in message_rooms(msg_dict, encoding):
+                by_room.setdefault(room, []).append(msg_dict)
+        for room, messages in by_room.items():
+            if encoding == JSON:
+                for msg_dict in messages:
+                    emitter.emit('new_message', msg_dict, room=room)
+            else:
+                emitter.emit('new_message', encode_messages(messages, encoding), room=room)
@@ -1,18 +1,108 @@
+from flask import current_app, request
 from flask_socketio import SocketIO, emit, join_room, leave_room
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload
 from app.models.message import Message
-from app.models.event import Event
-from app.models.indicativo import Indicativo
-from datetime import datetime
+from datetime import datetime, timedelta
 from app.extensions import db
+from app.services import model_cache, positions, presence, wire
+from app.services.message_writer import MessageBacklogFull, message_writer
 
 socketio = SocketIO()
 
+def visible_messages_query(event_id, indicativo_id):
+    """Mensajes del evento visibles para un indicativo: públicos, enviados por él o dirigidos a él"""
+    return Message.query.filter(
+        Message.event_id == event_id,
+        or_(
+            Message.to_indicativo_id.is_(None),
+            Message.indicativo_id == indicativo_id,
+            Message.to_indicativo_id == indicativo_id
+        )
+    )
+
+def load_message_window(event_id, indicativo_id, before_id=None, limit=None):
+    """
+    Devuelve (mensajes, has_more) con la ventana de historial visible para el indicativo.
+    Sin before_id se usa la ventana configurada (últimos N mensajes y/o últimos T minutos);
+    con before_id se pagina hacia atrás desde ese mensaje (cursor por id).
+    """
+    max_limit = current_app.config['MESSAGE_HISTORY_LIMIT']
+    # Lo pide el cliente: entre 1 y el máximo configurado (un LIMIT negativo en SQLite no limita)
+    limit = max(1, min(int(limit), max_limit)) if limit else max_limit
+    minutes = current_app.config['MESSAGE_HISTORY_MINUTES']
+
+    base_query = visible_messages_query(event_id, indicativo_id)
+    query = base_query
+    cutoff = None
+    if before_id:
+        query = query.filter(Message.id < before_id)
+    elif minutes:
+        cutoff = datetime.utcnow() - timedelta(minutes=minutes)
+        query = query.filter(Message.timestamp >= cutoff)
+
+    # Pedimos uno de más para saber si quedan mensajes anteriores sin otra consulta.
+    # El emisor se carga en la misma consulta: to_dict() lo usa y con carga perezosa sería una consulta por mensaje
+    messages = query.options(joinedload(Message.indicativo)).order_by(Message.id.desc()).limit(limit + 1).all()
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    messages.reverse()
+
+    if not has_more and cutoff is not None:
+        # La ventana temporal puede haber dejado fuera mensajes más antiguos
+        older = base_query.filter(Message.id < messages[0].id) if messages else base_query.filter(Message.timestamp < cutoff)
+        has_more = db.session.query(older.exists()).scalar()
+    return messages, has_more
+
+def load_messages_since(event_id, indicativo_id, since_id):
+    """
+    Mensajes visibles para el indicativo posteriores a since_id (resincronización tras reconectar).
+    Devuelve None si hay más de MESSAGE_HISTORY_LIMIT: en ese caso compensa enviar la ventana completa.
+
+    Con escritura agrupada cada worker reparte ids de su propio bloque, así que un mensaje puede
+    llegar después de since_id con un id menor. Se incluyen también los de id menor guardados
+    desde el instante de since_id; el cliente descarta los que ya tiene.
+    """
+    limit = current_app.config['MESSAGE_HISTORY_LIMIT']
+    query = visible_messages_query(event_id, indicativo_id)
+    since_timestamp = None
+    if current_app.config['MESSAGE_BATCH_ENABLED']:
+        since_timestamp = db.session.query(Message.timestamp).filter(Message.id == since_id).scalar()
+    if since_timestamp is not None:
+        query = query.filter(or_(
+            Message.id > since_id,
+            and_(Message.id < since_id, Message.timestamp >= since_timestamp)
+        ))
+    else:
+        query = query.filter(Message.id > since_id)
+    messages = (query
+                .options(joinedload(Message.indicativo))
+                .order_by(Message.id.asc())
+                .limit(limit + 1)
+                .all())
+    if len(messages) > limit:
+        return None
+    return messages
+
 @socketio.on('connect')
 def handle_connect():
     print('Cliente conectado')
 
+def notify_user_left(event_id, indicativo_id):
+    """Avisa a la sala del evento de que un indicativo ha dejado de estar conectado"""
+    indicativo = model_cache.get_indicativo(event_id, indicativo_id)
+    if indicativo:
+        socketio.emit('user_left', {
+            'message': f'Indicativo {indicativo["indicativo"]} dejó el chat',
+            'indicativo': indicativo
+        }, room=f'event_{event_id}')
+
 @socketio.on('disconnect')
 def handle_disconnect():
+    wire.forget_client(request.sid)
+    left = presence.leave(request.sid)
+    if left:
+        notify_user_left(*left)
     print('Cliente desconectado')
 
 @socketio.on('join_event')
@@ -24,35 +114,88 @@ def handle_join_event(data):
         emit('error', {'message': 'Se requiere event_id e indicativo_id'})
         return
     # Verificar que el evento existe y está activo
-    event = Event.query.get(event_id)
+    event = model_cache.get_event(event_id)
     if not event:
         emit('error', {'message': 'Evento no encontrado'})
         return
-    if not event.activo:
+    if not event['activo']:
         emit('error', {'message': 'El evento está inactivo'})
         return
     # Verificar que el indicativo existe y pertenece al evento
-    indicativo = Indicativo.query.filter_by(id=indicativo_id, event_id=event_id).first()
+    indicativo = model_cache.get_indicativo(event_id, indicativo_id)
     if not indicativo:
         emit('error', {'message': 'Indicativo no encontrado o no pertenece al evento'})
         return
-    # Unirse a la sala del evento y a la sala privada del indicativo
+    # Codificación del chat para este cliente (JSON salvo que anuncie y se permita la compacta)
+    encoding = wire.negotiate(data.get('accept_encodings'))
+    wire.set_client_encoding(request.sid, encoding)
+    # Unirse a la sala del evento y a las salas de chat (pública y privada) de su codificación
     room = f'event_{event_id}'
     join_room(room)
-    join_room(f'indicativo_{indicativo_id}_event_{event_id}')
-    # Enviar historial de mensajes filtrado
-    messages = Message.query.filter_by(event_id=event_id).order_by(Message.timestamp.asc()).all()
-    filtered_messages = [
-        msg for msg in messages
-        if not msg.to_indicativo_id or str(msg.indicativo_id) == str(indicativo_id) or str(msg.to_indicativo_id) == str(indicativo_id)
-    ]
-    emit('message_history', {'messages': [msg.to_dict() for msg in filtered_messages]})
+    for other in (wire.JSON, wire.MSGPACK):
+        if other != encoding:
+            leave_room(wire.chat_room(event['id'], other))
+            leave_room(wire.private_room(indicativo['id'], event['id'], other))
+    join_room(wire.chat_room(event['id'], encoding))
+    join_room(wire.private_room(indicativo['id'], event['id'], encoding))
+    emit('encoding_selected', {'encoding': encoding})
+    presence.join(request.sid, event['id'], indicativo['id'], encoding)
+    if message_writer.enabled():
+        # Que el historial incluya los mensajes de este proceso aún pendientes de guardar
+        message_writer.flush()
+    # Al reconectar, el cliente indica el último mensaje que tiene y solo se le envían los nuevos
+    delta = None
+    since_message_id = data.get('since_message_id')
+    if since_message_id:
+        try:
+            delta = load_messages_since(event_id, indicativo['id'], int(since_message_id))
+        except (TypeError, ValueError):
+            delta = None
+    if delta is not None:
+        emit('message_history', wire.encode_messages(
+            [msg.to_dict() for msg in delta], encoding, delta=True
+        ))
+    else:
+        # Enviar la ventana reciente del historial visible para este indicativo
+        messages, has_more = load_message_window(event_id, indicativo['id'])
+        emit('message_history', wire.encode_messages(
+            [msg.to_dict() for msg in messages], encoding, has_more=has_more, delta=False
+        ))
+    # Enviar la última posición conocida de cada indicativo para pintar el mapa
+    emit('positions_snapshot', {'positions': positions.get_event_positions(event_id)})
     # Notificar a otros usuarios
     emit('user_joined', {
-        'message': f'Indicativo {indicativo.indicativo} se unió al chat',
-        'indicativo': indicativo.to_dict()
+        'message': f'Indicativo {indicativo["indicativo"]} se unió al chat',
+        'indicativo': indicativo
     }, room=room, include_self=False)
 
+@socketio.on('load_older_messages')
+def handle_load_older_messages(data):
+    event_id = data.get('event_id')
+    indicativo_id = data.get('indicativo_id')
+    before_id = data.get('before_id')
+    limit = data.get('limit')
+
+    if not event_id or not indicativo_id or not before_id:
+        emit('error', {'message': 'Se requiere event_id, indicativo_id y before_id'})
+        return
+    # Verificar que el indicativo existe y pertenece al evento
+    indicativo = model_cache.get_indicativo(event_id, indicativo_id)
+    if not indicativo:
+        emit('error', {'message': 'Indicativo no encontrado o no pertenece al evento'})
+        return
+    try:
+        before_id = int(before_id)
+        limit = int(limit) if limit else None
+    except (TypeError, ValueError):
+        emit('error', {'message': 'before_id y limit deben ser numéricos'})
+        return
+    messages, has_more = load_message_window(event_id, indicativo['id'], before_id=before_id, limit=limit)
+    emit('older_messages', wire.encode_messages(
+        [msg.to_dict() for msg in messages], wire.client_encoding(request.sid),
+        has_more=has_more, before_id=before_id
+    ))
+
 @socketio.on('leave_event')
 def handle_leave_event(data):
     event_id = data.get('event_id')
@@ -60,13 +203,28 @@ def handle_leave_event(data):
     
     if event_id and indicativo_id:
         room = f'event_{event_id}'
-        indicativo = Indicativo.query.get(indicativo_id)
         leave_room(room)
-        if indicativo:
-            emit('user_left', {
-                'message': f'Indicativo {indicativo.indicativo} dejó el chat',
-                'indicativo': indicativo.to_dict()
-            }, room=room)
+        # Salir también de las salas de chat (pública y privada) de todas las codificaciones
+        for encoding in (wire.JSON, wire.MSGPACK):
+            leave_room(wire.chat_room(event_id, encoding))
+            leave_room(wire.private_room(indicativo_id, event_id, encoding))
+        session = presence.session(request.sid)
+        if session and str(session[0]) == str(event_id):
+            left = presence.leave(request.sid)
+            # Solo se avisa cuando el indicativo no conserva otra sesión abierta en el evento
+            if left:
+                notify_user_left(*left)
+
+@socketio.on('get_online')
+def handle_get_online(data):
+    event_id = data.get('event_id')
+    if not event_id:
+        emit('error', {'message': 'Se requiere event_id'})
+        return
+    if not model_cache.get_event(event_id):
+        emit('error', {'message': 'Evento no encontrado'})
+        return
+    emit('online_indicativos', {'event_id': int(event_id), 'indicativos': presence.describe_online(event_id)})
 
 @socketio.on('send_message')
 def handle_send_message(data):
@@ -86,45 +244,56 @@ def handle_send_message(data):
         emit('error', {'message': 'El campo content debe contener la clave "type"'})
         return
     # Verificar que el evento existe y está activo
-    event = Event.query.get(event_id)
+    event = model_cache.get_event(event_id)
     if not event:
         emit('error', {'message': 'Evento no encontrado'})
         return
-    if not event.activo:
+    if not event['activo']:
         emit('error', {'message': 'El evento está inactivo'})
         return
     # Verificar que el indicativo existe y pertenece al evento
-    indicativo = Indicativo.query.filter_by(id=indicativo_id, event_id=event_id).first()
+    indicativo = model_cache.get_indicativo(event_id, indicativo_id)
     if not indicativo:
         emit('error', {'message': 'Indicativo no encontrado o no pertenece al evento'})
         return
     # Si es privado, verificar que el destinatario existe y pertenece al evento
     to_indicativo = None
     if to_indicativo_id:
-        to_indicativo = Indicativo.query.filter_by(id=to_indicativo_id, event_id=event_id).first()
+        to_indicativo = model_cache.get_indicativo(event_id, to_indicativo_id)
         if not to_indicativo:
             emit('error', {'message': 'Indicativo destinatario no encontrado o no pertenece al evento'})
             return
-    # Crear y guardar el mensaje
-    message = Message(
-        event_id=event_id,
-        indicativo_id=indicativo_id,
-        to_indicativo_id=to_indicativo_id,
-        content=content
-    )
-    db.session.add(message)
-    db.session.commit()
-    # Preparar el mensaje para emitir
-    msg_dict = message.to_dict()
-    # Emitir el mensaje
-    if to_indicativo_id:
-        # Mensaje privado: solo al emisor y destinatario
-        room_emisor = f'indicativo_{indicativo_id}_event_{event_id}'
-        room_dest = f'indicativo_{to_indicativo_id}_event_{event_id}'
-        emit('new_message', msg_dict, room=room_emisor)
-        if to_indicativo_id != str(indicativo_id):
-            emit('new_message', msg_dict, room=room_dest)
+    if content.get('type') == 'location' and not to_indicativo_id:
+        coords = positions.parse_coords(content)
+        if coords and positions.should_coalesce(event_id, indicativo['id'], *coords):
+            # Dentro del umbral: refrescar la última posición sin guardar mensaje ni difundirlo a la
+            # sala (la tabla, que ven los demás workers, se actualiza en la siguiente pasada de fondo)
+            position = positions.save_position(event_id, indicativo, *coords)
+            emit('location_ack', {'coalesced': True, 'position': position})
+            return
+    if message_writer.enabled():
+        # Escritura agrupada: el mensaje recibe id ya y se guarda en el siguiente lote
+        try:
+            msg_dict = message_writer.submit(event_id, indicativo, content, to_indicativo_id=to_indicativo_id, sid=request.sid)
+        except MessageBacklogFull as e:
+            current_app.logger.error(f"[MESSAGES] Mensaje de {indicativo['indicativo']} rechazado: {e}")
+            emit('error', {'message': 'No se pueden guardar mensajes ahora mismo, inténtalo de nuevo'})
+            return
     else:
-        # Mensaje público: a toda la sala del evento
-        room = f'event_{event_id}'
-        emit('new_message', msg_dict, room=room) 
\ No newline at end of file
+        # Crear y guardar el mensaje
+        message = Message(
+            event_id=event_id,
+            indicativo_id=indicativo_id,
+            to_indicativo_id=to_indicativo_id,
+            content=content
+        )
+        db.session.add(message)
+        if content.get('type') == 'location' and not to_indicativo_id:
+            # Las localizaciones públicas actualizan el índice de últimas posiciones en la misma transacción
+            db.session.flush()
+            positions.record_position(message, indicativo)
+        db.session.commit()
+        # Preparar el mensaje para emitir
+        msg_dict = message.to_dict(sender=indicativo)
+    # Emitir el mensaje: si es privado solo al emisor y al destinatario, si es público a todo el chat del evento
+    wire.emit_new_message(msg_dict) 
\ No newline at end of file
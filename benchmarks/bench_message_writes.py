@@ -0,0 +1,77 @@
+"""
+Benchmark de escritura de mensajes: commit por mensaje frente a escritura agrupada.
+
+Envía N mensajes de localización por el socket (test client de Flask-SocketIO) contra una base
+de datos SQLite en fichero y mide mensajes por segundo hasta que todos están guardados.
+
+Uso:
+    python benchmarks/bench_message_writes.py [num_mensajes] [num_indicativos]
+"""
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+tmp_dir = tempfile.mkdtemp(prefix='rcq_bench_')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+
+from app import create_app, db
+from app.socket import socketio
+from app.models import User, Event, Indicativo, Message
+from app.services.message_writer import message_writer
+
+def prepare(num_indicativos):
+    user = User(email='bench@rcq', password_hash='-', name='bench')
+    db.session.add(user)
+    db.session.commit()
+    event = Event(nombre='Benchmark', fecha=datetime.utcnow(), user_id=user.id)
+    db.session.add(event)
+    db.session.commit()
+    indicativos = [Indicativo(indicativo=f'U{i}', event_id=event.id) for i in range(num_indicativos)]
+    db.session.add_all(indicativos)
+    db.session.commit()
+    return event.id, [ind.id for ind in indicativos]
+
+def run(app, event_id, indicativo_ids, num_messages, batched):
+    app.config['MESSAGE_BATCH_ENABLED'] = batched
+    client = socketio.test_client(app)
+    client.emit('join_event', {'event_id': event_id, 'indicativo_id': indicativo_ids[0]})
+    client.get_received()
+    before = Message.query.count()
+    start = time.perf_counter()
+    for i in range(num_messages):
+        client.emit('send_message', {
+            'event_id': event_id,
+            'indicativo_id': indicativo_ids[i % len(indicativo_ids)],
+            'content': {'type': 'location', 'lat': 41.38 + i * 1e-5, 'lng': 2.17}
+        })
+        if i % 500 == 0:
+            client.get_received()
+    if batched:
+        message_writer.flush()
+    elapsed = time.perf_counter() - start
+    client.disconnect()
+    stored = Message.query.count() - before
+    assert stored == num_messages, f'Se esperaban {num_messages} mensajes guardados y hay {stored}'
+    return num_messages / elapsed
+
+def main():
+    num_messages = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    num_indicativos = int(sys.argv[2]) if len(sys.argv) > 2 else 150
+    app = create_app('production')
+    logging.disable(logging.INFO)
+    with app.app_context():
+        event_id, indicativo_ids = prepare(num_indicativos)
+        per_message = run(app, event_id, indicativo_ids, num_messages, batched=False)
+        batched = run(app, event_id, indicativo_ids, num_messages, batched=True)
+    print(f"Mensajes: {num_messages}  Indicativos: {num_indicativos}  BD: {os.environ['DATABASE_URL']}")
+    print(f"Commit por mensaje: {per_message:10.1f} mensajes/s")
+    print(f"Escritura agrupada: {batched:10.1f} mensajes/s  (x{batched / per_message:.1f})")
+
+if __name__ == '__main__':
+    main()
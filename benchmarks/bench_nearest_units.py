@@ -0,0 +1,77 @@
+"""
+Benchmark de la consulta de unidades más cercanas (positions.nearest, GET /events/<id>/nearest_units).
+
+Sitúa U indicativos al azar en una zona de unos 5 km (más unos pocos muy lejos, como quien dejó
+el GPS encendido al volver a casa), los mueve para ejercitar la actualización incremental de la
+rejilla y mide el tiempo por consulta de las k unidades más cercanas. Comprueba además contra
+una ordenación lineal que el resultado es el mismo.
+
+Uso:
+    python benchmarks/bench_nearest_units.py [unidades] [consultas] [k]
+"""
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+tmp_dir = tempfile.mkdtemp(prefix='rcq_bench_')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+os.environ['POSITIONS_RELOAD_SECONDS'] = '0'  # Posiciones solo en memoria: sin recargar de la tabla
+
+from app import create_app
+from app.services import positions
+from app.services.spatial import haversine_m
+
+LAT0, LNG0 = 41.38, 2.17
+SPREAD = 0.045  # ≈ 5 km
+EVENT_ID = 1
+
+def random_point():
+    return LAT0 + random.uniform(0, SPREAD), LNG0 + random.uniform(0, SPREAD)
+
+def main():
+    num_units = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    k = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    random.seed(1)
+    app = create_app('production')
+    logging.disable(logging.INFO)
+    with app.app_context():
+        indicativos = [{'id': i + 1, 'indicativo': f'U{i}', 'nombre': None, 'color': None} for i in range(num_units)]
+        for indicativo in indicativos:
+            positions.update_position(EVENT_ID, indicativo, *random_point())
+        for indicativo in indicativos[:5]:
+            positions.update_position(EVENT_ID, indicativo, LAT0 + random.uniform(1, 2), LNG0 + random.uniform(1, 2))
+
+        start = time.perf_counter()
+        moves = num_units * 10
+        for _ in range(moves):
+            positions.update_position(EVENT_ID, random.choice(indicativos[5:]), *random_point())
+        move_us = (time.perf_counter() - start) / moves * 1e6
+
+        points = [random_point() for _ in range(num_queries)]
+        start = time.perf_counter()
+        for lat, lng in points:
+            positions.nearest(EVENT_ID, lat, lng, k)
+        query_us = (time.perf_counter() - start) / num_queries * 1e6
+
+        mismatches = 0
+        everything = positions.get_event_positions(EVENT_ID)
+        for lat, lng in points[:200]:
+            found = [p['indicativo_id'] for p, _ in positions.nearest(EVENT_ID, lat, lng, k)]
+            linear = sorted(everything, key=lambda p: haversine_m(lat, lng, p['lat'], p['lng']))[:k]
+            if found != [p['indicativo_id'] for p in linear]:
+                mismatches += 1
+
+    print(f"Unidades: {num_units}  k: {k}")
+    print(f"Actualización de posición: {move_us:8.1f} µs")
+    print(f"Consulta de las {k} más cercanas: {query_us:8.1f} µs")
+    print(f"Diferencias con la ordenación lineal (200 consultas): {mismatches}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Benchmark del geocodificador inverso local (app/services/offline_geocoder.py).
+
+Genera una zona sintética en cuadrícula (calles cada 100 m y portales cada 20 m a lo largo de
+ellas), la carga como si fuera un extracto GeoJSON y mide el tiempo por consulta con el índice
+en rejilla. Comprueba además contra una búsqueda lineal que el resultado es el mismo.
+
+Uso:
+    python benchmarks/bench_offline_geocoder.py [calles_por_lado] [consultas]
+"""
+import os
+import random
+import sys
+import time
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+from app.services.offline_geocoder import OfflineGeocoder
+from app.services.spatial import METERS_PER_DEGREE, haversine_m
+
+LAT0, LNG0 = 41.38, 2.17
+STREET_SPACING_M = 100
+HOUSE_SPACING_M = 20
+
+def build_features(streets):
+    dlat = STREET_SPACING_M / METERS_PER_DEGREE
+    dlng = dlat / 0.75  # cos(41.4º) ≈ 0.75
+    size = streets - 1
+    features = []
+    for i in range(streets):
+        # Calle horizontal i y vertical i, y portales a lo largo de la horizontal
+        features.append({'type': 'Feature', 'properties': {'name': f'Carrer {i}', 'highway': 'residential'},
+                         'geometry': {'type': 'LineString', 'coordinates': [[LNG0 + j * dlng, LAT0 + i * dlat] for j in range(streets)]}})
+        features.append({'type': 'Feature', 'properties': {'name': f'Avinguda {i}', 'highway': 'residential'},
+                         'geometry': {'type': 'LineString', 'coordinates': [[LNG0 + i * dlng, LAT0 + j * dlat] for j in range(streets)]}})
+        houses = size * STREET_SPACING_M // HOUSE_SPACING_M
+        for h in range(houses):
+            features.append({'type': 'Feature', 'properties': {'addr:street': f'Carrer {i}', 'addr:housenumber': str(h + 1)},
+                             'geometry': {'type': 'Point', 'coordinates': [LNG0 + h * dlng * HOUSE_SPACING_M / STREET_SPACING_M, LAT0 + i * dlat + dlat * 0.05]}})
+    return features, (LAT0, LAT0 + size * dlat, LNG0, LNG0 + size * dlng)
+
+def main():
+    streets = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    queries = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    features, (lat_min, lat_max, lng_min, lng_max) = build_features(streets)
+    start = time.perf_counter()
+    geocoder = OfflineGeocoder(features)
+    print(f"Carga: {geocoder.addresses.size} portales, {geocoder.roads.size} tramos en {time.perf_counter() - start:.2f} s")
+
+    random.seed(1)
+    points = [(random.uniform(lat_min, lat_max), random.uniform(lng_min, lng_max)) for _ in range(queries)]
+    start = time.perf_counter()
+    results = [geocoder.reverse(lat, lng, 75) for lat, lng in points]
+    elapsed = time.perf_counter() - start
+    print(f"{queries} consultas: {elapsed * 1e6 / queries:.1f} µs por consulta ({sum(r is not None for r in results)} con dirección)")
+
+    # Verificación contra búsqueda lineal de portales en una muestra
+    addresses = [item for cell in geocoder.addresses._cells.values() for item in cell]
+    mismatches = 0
+    for (lat, lng), result in list(zip(points, results))[:50]:
+        best = min(addresses, key=lambda a: haversine_m(lat, lng, a[0], a[1]))
+        if haversine_m(lat, lng, best[0], best[1]) <= 75 and best[2] != result:
+            mismatches += 1
+    print(f"Diferencias con la búsqueda lineal (50 consultas): {mismatches}")
+
+if __name__ == '__main__':
+    main()
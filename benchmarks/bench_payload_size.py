@@ -0,0 +1,76 @@
+"""
+Benchmark de tamaño de payload del historial: JSON frente a la codificación compacta (MessagePack).
+
+Genera el historial de un evento realista (por defecto 150 indicativos durante 10 horas,
+con una localización por indicativo cada 2 minutos y algún mensaje de texto) y compara el
+tamaño del message_history serializado como lo envía Socket.IO en JSON y en formato compacto.
+
+Uso:
+    python benchmarks/bench_payload_size.py [num_indicativos] [horas] [intervalo_localizacion_s]
+"""
+import json
+import os
+import random
+import sys
+import time
+import zlib
+from datetime import datetime, timedelta
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+from app.services import wire
+
+def build_history(num_indicativos, hours, location_interval):
+    random.seed(1)
+    start = datetime(2025, 6, 1, 8, 0, 0)
+    indicativos = [
+        {'id': i + 1, 'indicativo': f'MOTO-{i + 1:03d}', 'nombre': f'Voluntario {i + 1}', 'color': f'#{random.randrange(0xffffff):06x}'}
+        for i in range(num_indicativos)
+    ]
+    messages = []
+    message_id = 0
+    for second in range(0, hours * 3600, location_interval):
+        for ind in indicativos:
+            message_id += 1
+            if random.random() < 0.05:
+                content = {'type': 'text', 'text': random.choice(['Recibido', 'En posición', 'Sin novedad en el punto', 'Corredor atendido, todo bien'])}
+            else:
+                content = {'type': 'location', 'lat': round(41.38 + random.uniform(-0.05, 0.05), 6), 'lng': round(2.17 + random.uniform(-0.05, 0.05), 6)}
+            messages.append({
+                'id': message_id,
+                'event_id': 1,
+                'indicativo_id': ind['id'],
+                'to_indicativo_id': None,
+                'indicativo': ind['indicativo'],
+                'nombre': ind['nombre'],
+                'indicativo_color': ind['color'],
+                'content': content,
+                'timestamp': (start + timedelta(seconds=second)).strftime('%Y-%m-%d %H:%M:%S')
+            })
+    return messages
+
+def measure(label, encode):
+    start = time.perf_counter()
+    payload = encode()
+    elapsed = (time.perf_counter() - start) * 1000
+    size = len(payload)
+    print(f"{label:<22} {size / 1024:10.1f} KiB  {len(zlib.compress(payload)) / 1024:10.1f} KiB (deflate)  {elapsed:8.1f} ms")
+    return size
+
+def main():
+    if wire.msgpack is None:
+        sys.exit('Se necesita msgpack instalado (pip install msgpack)')
+    num_indicativos = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    hours = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    location_interval = int(sys.argv[3]) if len(sys.argv) > 3 else 120
+    messages = build_history(num_indicativos, hours, location_interval)
+    print(f"Historial: {len(messages)} mensajes ({num_indicativos} indicativos, {hours} h)")
+    json_size = measure('JSON (por defecto)', lambda: json.dumps(
+        {'messages': messages, 'has_more': False, 'delta': False}, separators=(',', ':')).encode('utf-8'))
+    compact_size = measure('MessagePack compacto', lambda: wire.msgpack.packb(
+        wire.compact_messages(messages, has_more=False, delta=False)))
+    print(f"Reducción: {100 * (1 - compact_size / json_size):.1f}%")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""
+Prueba de carga de la numeración de incidentes: varias consolas creando incidentes a la vez.
+
+Lanza H hilos que crean N incidentes en total con POST /events/<id>/incidents (cliente de pruebas
+de Flask) contra una base de datos en fichero (SQLite temporal, o DATABASE_URL si se define) y
+comprueba que los incident_number del evento son exactamente 1..N: sin huecos ni repetidos.
+El evento arranca con unos incidentes ya numerados para ejercitar la siembra del contador.
+La misma comprobación, a pequeña escala, está en tests/test_incident_numbers.py; este script
+sirve para medir el ritmo de altas y para repetirla contra PostgreSQL.
+
+Uso:
+    python benchmarks/stress_incident_numbers.py [num_incidentes] [num_hilos]
+"""
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(root_dir)
+
+if 'DATABASE_URL' not in os.environ:
+    tmp_dir = tempfile.mkdtemp(prefix='rcq_stress_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tmp_dir, 'stress.db')}"
+
+from app import create_app, db
+from app.models import User, Event, Incident
+
+PRESEEDED = 3
+
+def prepare():
+    user = User(email=f'stress-{time.time()}@rcq', password_hash='-', name='stress')
+    db.session.add(user)
+    db.session.commit()
+    event = Event(nombre='Stress', fecha=datetime.utcnow(), user_id=user.id)
+    db.session.add(event)
+    db.session.commit()
+    # Incidentes anteriores al contador (como los de una base de datos ya en uso)
+    db.session.add_all([
+        Incident(event_id=event.id, incident_number=n, estado='activo', tipo='previo', fecha_creacion=datetime.utcnow())
+        for n in range(1, PRESEEDED + 1)
+    ])
+    db.session.commit()
+    return event.id
+
+def worker(app, event_id, count, errors):
+    client = app.test_client()
+    for i in range(count):
+        response = client.post(f'/events/{event_id}/incidents', json={'tipo': 'stress', 'descripcion': str(i)})
+        if response.status_code != 200:
+            errors.append(response.status_code)
+
+def main():
+    num_incidents = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    num_threads = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    app = create_app('production')
+    app.config['GEOCODING_ASYNC'] = False
+    logging.disable(logging.WARNING)
+    with app.app_context():
+        event_id = prepare()
+    errors = []
+    per_thread = [num_incidents // num_threads + (1 if i < num_incidents % num_threads else 0) for i in range(num_threads)]
+    threads = [threading.Thread(target=worker, args=(app, event_id, count, errors)) for count in per_thread]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    with app.app_context():
+        numbers = [n for (n,) in db.session.query(Incident.incident_number).filter_by(event_id=event_id)]
+    expected = list(range(1, PRESEEDED + num_incidents + 1))
+    print(f"Incidentes: {num_incidents}  Hilos: {num_threads}  BD: {os.environ['DATABASE_URL']}")
+    print(f"Altas: {num_incidents / elapsed:10.1f} incidentes/s  Errores HTTP: {len(errors)}")
+    assert not errors, f'Altas fallidas: {errors[:10]}'
+    assert len(numbers) == len(set(numbers)), 'Hay números de incidente repetidos'
+    assert sorted(numbers) == expected, 'La numeración tiene huecos'
+    print('Numeración correcta: sin huecos ni repetidos')
+
+if __name__ == '__main__':
+    main()
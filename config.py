@@ -20,6 +20,77 @@ class Config:
     # CORS
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', 'http://localhost:3000').split(',')
     
+    # Historial de chat enviado al unirse a un evento
+    MESSAGE_HISTORY_LIMIT = int(os.getenv('MESSAGE_HISTORY_LIMIT', 500))  # Máximo de mensajes por página
+    MESSAGE_HISTORY_MINUTES = int(os.getenv('MESSAGE_HISTORY_MINUTES', 0))  # Ventana en minutos (0 = sin límite temporal)
+    
+    # Agregación de localizaciones por indicativo: una localización que llega antes del intervalo
+    # mínimo o que se ha movido menos de la distancia mínima solo refresca la última posición
+    # (sin mensaje ni difusión a la sala). 0 desactiva cada criterio
+    LOCATION_MIN_INTERVAL_SECONDS = float(os.getenv('LOCATION_MIN_INTERVAL_SECONDS', 0))
+    LOCATION_MIN_DISTANCE_METERS = float(os.getenv('LOCATION_MIN_DISTANCE_METERS', 0))
+    # Segundos tras los que cada proceso recarga de la tabla las últimas posiciones de un evento
+    # (para ver las que han recibido otros workers). 0 = no recargar nunca (un solo proceso)
+    POSITIONS_RELOAD_SECONDS = float(os.getenv('POSITIONS_RELOAD_SECONDS', 5))
+    
+    # Escritura agrupada de mensajes (group commit): se emiten al momento y se guardan en lotes
+    MESSAGE_BATCH_ENABLED = os.getenv('MESSAGE_BATCH_ENABLED', 'false').lower() == 'true'
+    MESSAGE_BATCH_MAX_DELAY_MS = int(os.getenv('MESSAGE_BATCH_MAX_DELAY_MS', 20))  # Espera máxima antes de guardar un lote
+    MESSAGE_BATCH_MAX_SIZE = int(os.getenv('MESSAGE_BATCH_MAX_SIZE', 200))  # Mensajes por lote
+    MESSAGE_BATCH_MAX_PENDING = int(os.getenv('MESSAGE_BATCH_MAX_PENDING', 2000))  # Máximo de mensajes emitidos sin guardar
+    MESSAGE_BATCH_MAX_ATTEMPTS = int(os.getenv('MESSAGE_BATCH_MAX_ATTEMPTS', 5))  # Intentos de guardar un mensaje antes de descartarlo
+    MESSAGE_ID_BLOCK_SIZE = int(os.getenv('MESSAGE_ID_BLOCK_SIZE', 100))  # Ids reservados de una vez por worker
+    MESSAGE_ID_BLOCK_TTL = float(os.getenv('MESSAGE_ID_BLOCK_TTL', 1.0))  # Segundos que vale un bloque de ids
+    
+    # Segundos que la caché por proceso de eventos/indicativos da por buenas sus entradas
+    # (las rutas de escritura invalidan al momento; el TTL acota lo que tarda en verse desde otro worker)
+    MODEL_CACHE_TTL = int(os.getenv('MODEL_CACHE_TTL', 30))
+    # Respuestas de listados (incidentes/indicativos) guardadas por (evento, versión) en cada proceso
+    LIST_RESPONSE_CACHE_SIZE = int(os.getenv('LIST_RESPONSE_CACHE_SIZE', 64))
+    
+    # Socket.IO entre varios workers/nodos: redis://..., amqp://..., kafka://... o
+    # sqlite-pubsub:///ruta.db (sustituto local para un solo servidor). Vacío = un solo proceso.
+    # sqlite-pubsub solo cubre el reparto entre servidores (tests/test_socket_queue.py): con
+    # cualquier cola, socketio.test_client no funciona, así que las pruebas de la app van sin ella
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', '')
+    SOCKETIO_CHANNEL = os.getenv('SOCKETIO_CHANNEL', 'rcqevents')
+    # Presencia compartida por los workers: cada uno refresca sus sesiones cada HEARTBEAT segundos y
+    # una sesión sin refrescar en TIMEOUT segundos (worker caído) deja de estar en línea
+    PRESENCE_HEARTBEAT_SECONDS = float(os.getenv('PRESENCE_HEARTBEAT_SECONDS', 15))
+    PRESENCE_TIMEOUT_SECONDS = float(os.getenv('PRESENCE_TIMEOUT_SECONDS', 45))
+    # Permitir que los clientes negocien en join_event la codificación compacta (MessagePack) del chat
+    SOCKETIO_COMPACT_ENCODING = os.getenv('SOCKETIO_COMPACT_ENCODING', 'false').lower() == 'true'
+    
+    # Geocodificación inversa de incidentes en segundo plano (false = en la propia petición, como antes)
+    GEOCODING_ASYNC = os.getenv('GEOCODING_ASYNC', 'true').lower() == 'true'
+    GEOCODING_WORKERS = int(os.getenv('GEOCODING_WORKERS', 2))  # Tareas de fondo por proceso
+    GEOCODING_QUEUE_SIZE = int(os.getenv('GEOCODING_QUEUE_SIZE', 500))  # Máximo de incidentes en espera
+    GEOCODING_MAX_ATTEMPTS = int(os.getenv('GEOCODING_MAX_ATTEMPTS', 5))  # Intentos por incidente si falla el servicio
+    GEOCODING_RETRY_BASE_SECONDS = float(os.getenv('GEOCODING_RETRY_BASE_SECONDS', 5))  # Espera del primer reintento (se duplica)
+    GEOCODING_USER_AGENT = os.getenv('GEOCODING_USER_AGENT', 'RCQEventsServer/1.0 (contacto@tuemail.com)')
+    GEOCODING_CACHE_PRECISION = int(os.getenv('GEOCODING_CACHE_PRECISION', 4))  # Decimales de la clave de caché (4 ≈ 11 m)
+    GEOCODING_CACHE_SIZE = int(os.getenv('GEOCODING_CACHE_SIZE', 2048))  # Entradas de la caché en memoria por proceso
+    # Límite de consultas al servicio compartido por todos los workers (Nominatim pide como mucho 1/s)
+    GEOCODING_RATE_PER_SECOND = float(os.getenv('GEOCODING_RATE_PER_SECOND', 1.0))
+    GEOCODING_RATE_BURST = int(os.getenv('GEOCODING_RATE_BURST', 1))
+    # Extracto GeoJSON de OpenStreetMap de la zona (portales y calles) para geocodificar sin conexión
+    GEOCODING_OFFLINE_FILE = os.getenv('GEOCODING_OFFLINE_FILE', '')
+    GEOCODING_OFFLINE_MAX_DISTANCE_METERS = float(os.getenv('GEOCODING_OFFLINE_MAX_DISTANCE_METERS', 75))
+    # Búsqueda de direcciones de las consolas: 'nominatim' o 'local' (sobre el extracto GEOCODING_OFFLINE_FILE)
+    GEOCODING_SEARCH_PROVIDER = os.getenv('GEOCODING_SEARCH_PROVIDER', 'nominatim').lower()
+    GEOCODING_SEARCH_MAX_RESULTS = int(os.getenv('GEOCODING_SEARCH_MAX_RESULTS', 10))
+    
+    # Outbox de efectos secundarios (mensajes automáticos de asignación) entregados en segundo plano
+    OUTBOX_POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', 1.0))  # Espera entre consultas sin avisos locales
+    OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 50))  # Entradas reservadas por consulta
+    OUTBOX_LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', 60))  # Reserva de una entrada por un worker
+    OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+    OUTBOX_RETRY_BASE_SECONDS = float(os.getenv('OUTBOX_RETRY_BASE_SECONDS', 2))  # Espera del primer reintento (se duplica)
+    
+    # Arrancar con el servidor (run.py o gunicorn.conf.py, no los comandos de la CLI) las tareas de fondo
+    # que entregan lo pendiente (outbox, geocodificación). Si no, cada una arranca con su primer uso en el worker
+    BACKGROUND_TASKS_ON_STARTUP = os.getenv('BACKGROUND_TASKS_ON_STARTUP', 'true').lower() == 'true'
+    
     # Server
     HOST = os.getenv('HOST', '0.0.0.0')
     PORT = int(os.getenv('PORT', 5000))
@@ -35,6 +106,7 @@ class ProductionConfig(Config):
 class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    BACKGROUND_TASKS_ON_STARTUP = False
 
 # Configuración por entorno
 config = {
@@ -0,0 +1,6 @@
+"""Configuración de Gunicorn (se carga sola al lanzarlo desde la raíz del proyecto)"""
+
+def post_worker_init(worker):
+    # Tareas de fondo de cada worker, una vez cargada la app
+    from app import start_background_tasks
+    start_background_tasks(worker.wsgi)
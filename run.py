@@ -1,7 +1,12 @@
-from app import create_app
+import os
+
+from app import create_app, start_background_tasks
 from app.socket import socketio
 
 app = create_app()
 
 if __name__ == '__main__':
-    socketio.run(app, host='0.0.0.0', port=5000) 
\ No newline at end of file
+    # Con el recargador de depuración, solo en el proceso que sirve (no en el que vigila los ficheros)
+    if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_tasks(app)
+    socketio.run(app, host='0.0.0.0', port=5000)
@@ -0,0 +1,76 @@
+"""
+Fixtures comunes: una app de pruebas con SQLite en memoria por test y un evento con indicativos.
+
+Las cachés por proceso (eventos/indicativos, posiciones, respuestas de listados) se vacían en
+cada test, porque los ids se repiten de una base de datos a la siguiente.
+"""
+import os
+import sys
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event as sa_event
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root_dir)
+
+from app import create_app
+from config import config
+from app.extensions import db
+from app.models import Event, Indicativo, User
+from app.services import event_versions, model_cache, positions
+
+def _clear_process_caches():
+    for cache in (model_cache._events, model_cache._indicativos, model_cache._name_indexes,
+                  positions._positions, positions._grids, positions._loaded_at, positions._unsaved,
+                  event_versions._responses):
+        cache.clear()
+
+@pytest.fixture
+def app():
+    _clear_process_caches()
+    app = create_app('testing')
+    with app.app_context():
+        yield app
+        db.session.remove()
+    _clear_process_caches()
+
+@pytest.fixture
+def file_app(tmp_path, monkeypatch):
+    """Como `app`, pero sobre una base de datos SQLite en fichero (varios hilos con conexiones propias)"""
+    monkeypatch.setattr(config['testing'], 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'test.db'}")
+    _clear_process_caches()
+    app = create_app('testing')
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+    _clear_process_caches()
+
+@pytest.fixture
+def event(app):
+    """Evento activo con tres indicativos (U0, U1, U2)"""
+    user = User(email='test@example.com', password_hash='x', name='Test')
+    db.session.add(user)
+    db.session.commit()
+    ev = Event(nombre='Evento de prueba', fecha=datetime.utcnow(), user_id=user.id)
+    db.session.add(ev)
+    db.session.commit()
+    db.session.add_all([Indicativo(indicativo=f'U{i}', nombre=f'Unidad {i}', event_id=ev.id) for i in range(3)])
+    db.session.commit()
+    return ev
+
+@contextmanager
+def count_queries():
+    """Cuenta las sentencias SQL ejecutadas dentro del bloque: `with count_queries() as statements:`"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    sa_event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        sa_event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
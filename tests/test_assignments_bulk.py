@@ -0,0 +1,56 @@
+"""Asignación de varios recursos a la vez (POST /events/<id>/incidents/<id>/assignments/bulk)"""
+import json
+
+from app.models import IncidentAssignment, Indicativo, Message
+from app.models.outbox import OutboxEntry
+from app.routes import events as events_routes
+from app.services.outbox import outbox_dispatcher
+
+def test_bulk_assignment_notifies_once_and_queues_one_message_per_unit(app, event, monkeypatch):
+    emitted = []
+    monkeypatch.setattr(events_routes, 'emit_incident_event', lambda event_id, name, payload: emitted.append((name, payload)))
+    # Las entradas se entregan abajo, no en la tarea de fondo
+    monkeypatch.setattr(outbox_dispatcher, 'notify', lambda *args: None)
+    client = app.test_client()
+    url = f'/events/{event.id}/incidents'
+    incident = client.post(url, json={'tipo': 'sanitario'}).get_json()['incident']
+    emitted.clear()
+
+    response = client.post(f"{url}/{incident['id']}/assignments/bulk", json={
+        'targets': ['U0', 'U1', {'indicativo_id': 'U2', 'estado_asignacion': 'en_camino'}, 'CME']
+    })
+    assert response.status_code == 201
+    assignments = response.get_json()['assignments']
+    assert len(assignments) == 4
+    # Los ids devueltos son los de las filas insertadas
+    assert sorted(a['id'] for a in assignments) == sorted(a.id for a in IncidentAssignment.query.all())
+
+    [(name, payload)] = emitted
+    assert name == 'assignment_changed'
+    assert payload['assignment_ids'] == [a['id'] for a in assignments]
+    assert payload['assignment_id'] is None
+    assert len(payload['incident']['assignments']) == 4
+
+    units = {i.indicativo: i.id for i in Indicativo.query.filter_by(event_id=event.id)}
+    entries = OutboxEntry.query.order_by(OutboxEntry.id).all()
+    assert [json.loads(e.payload)['to_indicativo_ids'] for e in entries] == [[units['U0']], [units['U1']], [units['U2']]]
+    assert outbox_dispatcher.dispatch_pending() == 3
+    assert sorted(m.to_indicativo_id for m in Message.query.all()) == sorted(units.values())
+    assert OutboxEntry.query.count() == 0
+
+def test_service_messages_are_saved_with_the_outbox_delivery_in_batch_mode(app, event, monkeypatch):
+    app.config['MESSAGE_BATCH_ENABLED'] = True
+    monkeypatch.setattr(outbox_dispatcher, 'notify', lambda *args: None)
+    client = app.test_client()
+    url = f'/events/{event.id}/incidents'
+    incident = client.post(url, json={'tipo': 'sanitario', 'descripcion': 'caída'}).get_json()['incident']
+    client.post(f"{url}/{incident['id']}/assignments", json={'indicativo_id': 'U1'})
+    # El mensaje describe el incidente tal como estaba al asignarlo
+    client.put(f"{url}/{incident['id']}", json={'descripcion': 'otra cosa'})
+
+    assert outbox_dispatcher.dispatch_pending() == 1
+    # Guardado en la transacción de la entrega, sin esperar al lote del writer
+    [message] = Message.query.all()
+    assert message.content['type'] == 'assign_service'
+    assert 'caída' in message.content['text']
+    assert OutboxEntry.query.count() == 0
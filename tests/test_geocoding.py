@@ -0,0 +1,21 @@
+"""Caché, agrupación y límite de ritmo de la geocodificación (app/services/geocoding.py)"""
+from app.services import geocoding
+
+def _fail(*args, **kwargs):
+    raise AssertionError('no debería consultarse el servicio')
+
+def test_lookup_rechecks_cache_after_rate_slot(app, monkeypatch):
+    key = geocoding.cache_key(41.40362, 2.17445)
+    # Otro worker la guarda mientras este espera su turno
+    monkeypatch.setattr(geocoding, '_acquire_rate_slot', lambda: geocoding._store_cached(key, 'Carrer de Mallorca, 401'))
+    monkeypatch.setattr(geocoding, 'reverse_geocode', _fail)
+    assert geocoding.lookup(41.40362, 2.17445) == 'Carrer de Mallorca, 401'
+
+def test_search_rechecks_cache_after_rate_slot(app, monkeypatch):
+    results = [{'lat': 41.40362, 'lng': 2.17445, 'display_name': 'Carrer de Mallorca, 401'}]
+    key = geocoding.search_cache_key('Mallorca 401', 'Barcelona', 5)
+    monkeypatch.setattr(
+        geocoding, '_acquire_rate_slot', lambda: geocoding._store_search_cached(key, 'Mallorca 401', results)
+    )
+    monkeypatch.setattr(geocoding, 'forward_geocode', _fail)
+    assert geocoding.search('Mallorca 401', 'Barcelona', 5) == results
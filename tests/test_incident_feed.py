@@ -0,0 +1,84 @@
+"""Listado incremental (GET /events/<id>/incidents?since=) y avisos de cambios por Socket.IO"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.routes import events as events_routes
+
+@pytest.fixture
+def emitted(monkeypatch):
+    """Avisos emitidos a la sala del evento: [(nombre, payload)]"""
+    calls = []
+    monkeypatch.setattr(events_routes, 'emit_incident_event', lambda event_id, name, payload: calls.append((name, payload)))
+    return calls
+
+def _feed(client, event_id, since, **params):
+    response = client.get(f'/events/{event_id}/incidents', query_string={'since': since, **params})
+    assert response.status_code == 200
+    return response.get_json()
+
+def test_since_returns_only_changed_incidents(app, event, emitted):
+    client = app.test_client()
+    url = f'/events/{event.id}/incidents'
+    first = client.post(url, json={'tipo': 'sanitario'}).get_json()['incident']
+    second = client.post(url, json={'tipo': 'logistico'}).get_json()['incident']
+    version = client.get(url).get_json()['version']
+
+    feed = _feed(client, event.id, version)
+    assert (feed['incidents'], feed['tombstones'], feed['version']) == ([], [], version)
+
+    client.put(f"{url}/{second['id']}", json={'descripcion': 'caída'})
+    feed = _feed(client, event.id, version)
+    assert [i['id'] for i in feed['incidents']] == [second['id']]
+    assert feed['incidents'][0]['descripcion'] == 'caída'
+    assert feed['version'] > version
+    # Con una fecha anterior a todo, los dos
+    since_date = (datetime.utcnow() - timedelta(minutes=1)).strftime('%Y-%m-%d %H:%M:%S')
+    assert {i['id'] for i in _feed(client, event.id, since_date)['incidents']} == {first['id'], second['id']}
+    assert client.get(url, query_string={'since': 'ayer'}).status_code == 400
+    assert [name for name, _ in emitted] == ['incident_created', 'incident_created', 'incident_updated']
+
+def test_deleted_incidents_come_back_as_tombstones(app, event, emitted):
+    client = app.test_client()
+    url = f'/events/{event.id}/incidents'
+    incident = client.post(url, json={'tipo': 'sanitario'}).get_json()['incident']
+    client.post(f"{url}/{incident['id']}/assignments", json={'indicativo_id': 'U1'})
+    assert sum(events_routes.open_assignment_counts(event.id).values()) == 1
+    version = client.get(url).get_json()['version']
+    client.delete(f"{url}/{incident['id']}")
+
+    feed = _feed(client, event.id, version)
+    assert feed['incidents'] == []
+    assert [(t['id'], t['is_deleted']) for t in feed['tombstones']] == [(incident['id'], True)]
+    assert feed['tombstones'][0]['change_seq'] == feed['version']
+    # Con include_deleted=true va entre los incidentes
+    feed = _feed(client, event.id, version, include_deleted='true')
+    assert [i['id'] for i in feed['incidents']] == [incident['id']]
+    assert feed['tombstones'] == []
+    name, payload = emitted[-1]
+    assert name == 'incident_deleted' and payload['incident']['id'] == incident['id']
+    # Las asignaciones de un incidente eliminado dejan de contar como abiertas
+    assert events_routes.open_assignment_counts(event.id) == {}
+
+def test_assignment_changes_and_status_cascade_are_in_the_feed(app, event, emitted):
+    client = app.test_client()
+    url = f'/events/{event.id}/incidents'
+    incident = client.post(url, json={'tipo': 'sanitario'}).get_json()['incident']
+    assignments_url = f"{url}/{incident['id']}/assignments"
+    client.post(f'{assignments_url}/bulk', json={'targets': ['U1', 'U2']})
+    assert sum(events_routes.open_assignment_counts(event.id).values()) == 2
+    version = client.get(url).get_json()['version']
+
+    # solucionado finaliza en cascada las asignaciones abiertas, con la misma versión que el incidente
+    response = client.put(f"{url}/{incident['id']}", json={'estado': 'solucionado'}).get_json()
+    assert len(response['cascaded_assignments']) == 2
+    feed = _feed(client, event.id, version)
+    [changed] = feed['incidents']
+    assert changed['estado'] == 'solucionado'
+    assert [a['estado_asignacion'] for a in changed['assignments']] == ['finalizado', 'finalizado']
+    assert events_routes.open_assignment_counts(event.id) == {}
+    # Un único incident_updated con las asignaciones ya cambiadas
+    name, payload = emitted[-1]
+    assert name == 'incident_updated'
+    assert payload['version'] == feed['version']
+    assert [a['estado_asignacion'] for a in payload['incident']['assignments']] == ['finalizado', 'finalizado']
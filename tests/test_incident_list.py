@@ -0,0 +1,41 @@
+"""Listado de incidentes con sus asignaciones (GET /events/<id>/incidents)"""
+from app.extensions import db
+from app.models import Incident, IncidentAssignment, Indicativo
+from conftest import count_queries
+
+def _add_incidents(event_id, count):
+    """`count` incidentes, cada uno con dos asignaciones: un indicativo propio y un servicio"""
+    indicativos = [Indicativo(indicativo=f'I{count}-{i}', event_id=event_id) for i in range(count)]
+    incidents = [Incident(event_id=event_id, incident_number=i + 1, tipo='sanitario', descripcion=str(i))
+                 for i in range(count)]
+    db.session.add_all(indicativos + incidents)
+    db.session.flush()
+    for incident, indicativo in zip(incidents, indicativos):
+        db.session.add(IncidentAssignment(incident_id=incident.id, indicativo_id=indicativo.id))
+        db.session.add(IncidentAssignment(incident_id=incident.id, indicativo_id=-1, servicio_nombre='CME'))
+    db.session.commit()
+    db.session.remove()
+
+def _list_statements(app, event_id, count):
+    _add_incidents(event_id, count)
+    # Lo que se carga una vez por proceso (textos libres de asignaciones) no cuenta
+    app.test_client().get(f'/events/{event_id}/incidents')
+    with count_queries() as statements:
+        response = app.test_client().get(f'/events/{event_id}/incidents')
+    incidents = response.get_json()['incidents']
+    assert len(incidents) == count
+    assert all(len(incident['assignments']) == 2 for incident in incidents)
+    return len(statements)
+
+def test_incident_list_queries_do_not_grow_with_incidents(app, event):
+    # Sin la caché de respuestas: cada petición construye el listado
+    app.config['LIST_RESPONSE_CACHE_SIZE'] = 0
+    event_id = event.id
+    small = _list_statements(app, event_id, 10)
+    IncidentAssignment.query.delete()
+    Incident.query.delete()
+    db.session.commit()
+    large = _list_statements(app, event_id, 100)
+    assert small == large
+    # Versión del evento, incidentes, asignaciones e indicativos
+    assert large == 4
@@ -0,0 +1,48 @@
+"""Numeración de incidentes con varias consolas creando incidentes a la vez (POST /events/<id>/incidents)"""
+import threading
+from datetime import datetime
+
+from app.extensions import db
+from app.models import Event, Incident, User
+
+NUM_INCIDENTS = 50
+NUM_THREADS = 5
+PRESEEDED = 3
+
+def _prepare():
+    user = User(email='numeros@example.com', password_hash='x', name='Números')
+    db.session.add(user)
+    db.session.commit()
+    event = Event(nombre='Numeración', fecha=datetime.utcnow(), user_id=user.id)
+    db.session.add(event)
+    db.session.commit()
+    # Incidentes anteriores al contador (como los de una base de datos ya en uso)
+    db.session.add_all([
+        Incident(event_id=event.id, incident_number=n, estado='activo', tipo='previo', fecha_creacion=datetime.utcnow())
+        for n in range(1, PRESEEDED + 1)
+    ])
+    db.session.commit()
+    event_id = event.id
+    db.session.remove()
+    return event_id
+
+def test_concurrent_creation_has_no_gaps_or_duplicates(file_app):
+    file_app.config['GEOCODING_ASYNC'] = False
+    event_id = _prepare()
+    errors = []
+
+    def worker(count):
+        client = file_app.test_client()
+        for i in range(count):
+            response = client.post(f'/events/{event_id}/incidents', json={'tipo': 'stress', 'descripcion': str(i)})
+            if response.status_code != 200:
+                errors.append(response.status_code)
+
+    threads = [threading.Thread(target=worker, args=(NUM_INCIDENTS // NUM_THREADS,)) for _ in range(NUM_THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    numbers = [n for (n,) in db.session.query(Incident.incident_number).filter_by(event_id=event_id)]
+    assert sorted(numbers) == list(range(1, PRESEEDED + NUM_INCIDENTS + 1))
@@ -0,0 +1,80 @@
+"""ETag por versión del evento y caché de respuestas de los listados (app/services/event_versions.py)"""
+from app.services import event_versions
+from conftest import count_queries
+
+def _get(client, url, etag=None):
+    headers = {'If-None-Match': etag} if etag else {}
+    return client.get(url, headers=headers)
+
+def _assert_changed(client, url, etag):
+    """El listado ya no responde 304 con el ETag anterior: devuelve 200 con otro ETag"""
+    response = _get(client, url, etag)
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    return response.headers['ETag']
+
+def test_unchanged_list_answers_304_without_querying_tables(app, event):
+    client = app.test_client()
+    url = f'/events/{event.id}/incidents'
+    first = _get(client, url)
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    with count_queries() as statements:
+        response = _get(client, url, etag)
+    assert response.status_code == 304
+    assert not response.data
+    assert not [s for s in statements if 'incidents' in s or 'incident_assignments' in s]
+
+def test_responses_are_cached_per_event_version_and_variant(app, event):
+    client = app.test_client()
+    client.get(f'/events/{event.id}/incidents')
+    client.get(f'/events/{event.id}/incidents?include_deleted=true')
+    version = event_versions.current(event.id)
+    assert event_versions.get_response(event.id, version, 'incidents') is not None
+    assert event_versions.get_response(event.id, version, 'incidents-all') is not None
+
+def test_incident_writes_change_the_etag(app, event):
+    client = app.test_client()
+    url = f'/events/{event.id}/incidents'
+    etag = _get(client, url).headers['ETag']
+    incident = client.post(url, json={'tipo': 'sanitario'}).get_json()['incident']
+    etag = _assert_changed(client, url, etag)
+    assert [i['id'] for i in _get(client, url).get_json()['incidents']] == [incident['id']]
+    client.put(f"{url}/{incident['id']}", json={'descripcion': 'caída'})
+    etag = _assert_changed(client, url, etag)
+    assert _get(client, url).get_json()['incidents'][0]['descripcion'] == 'caída'
+    client.delete(f"{url}/{incident['id']}")
+    etag = _assert_changed(client, url, etag)
+    assert _get(client, url).get_json()['incidents'] == []
+    assert _get(client, url, etag).status_code == 304
+
+def test_assignment_writes_change_the_etag(app, event):
+    client = app.test_client()
+    url = f'/events/{event.id}/incidents'
+    incident = client.post(url, json={'tipo': 'sanitario'}).get_json()['incident']
+    assignments_url = f"{url}/{incident['id']}/assignments"
+    etag = _get(client, url).headers['ETag']
+    assignment = client.post(assignments_url, json={'indicativo_id': 'U1'}).get_json()['assignment']
+    etag = _assert_changed(client, url, etag)
+    client.put(f"{assignments_url}/{assignment['id']}", json={'estado_asignacion': 'en_camino'})
+    etag = _assert_changed(client, url, etag)
+    client.post(f'{assignments_url}/bulk', json={'targets': ['U2', 'CME']})
+    etag = _assert_changed(client, url, etag)
+    client.delete(f"{assignments_url}/{assignment['id']}")
+    etag = _assert_changed(client, url, etag)
+    assert len(_get(client, url).get_json()['incidents'][0]['assignments']) == 2
+
+def test_indicativo_writes_change_the_etag(app, event):
+    client = app.test_client()
+    url = f'/events/{event.id}/indicativos/api'
+    response = _get(client, url)
+    etag = response.headers['ETag']
+    assert len(response.get_json()['indicativos']) == 3
+    assert _get(client, url, etag).status_code == 304
+    indicativo = client.post(url, json={'indicativo': 'U3'}).get_json()['indicativo']
+    etag = _assert_changed(client, url, etag)
+    client.put(f"{url}/{indicativo['id']}", json={'nombre': 'Unidad 3'})
+    etag = _assert_changed(client, url, etag)
+    client.delete(f"{url}/{indicativo['id']}")
+    _assert_changed(client, url, etag)
+    assert len(_get(client, url).get_json()['indicativos']) == 3
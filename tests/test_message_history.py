@@ -0,0 +1,48 @@
+"""Historial del chat al unirse a un evento (socket.load_message_window)"""
+from app.extensions import db
+from app.models import Indicativo, Message
+from app.socket import load_message_window
+from conftest import count_queries
+
+def _add_messages(event_id, count):
+    """`count` mensajes, cada uno de un emisor distinto. Devuelve el id de uno de ellos."""
+    # Si el emisor se cargase mensaje a mensaje, la cuenta de consultas crecería con el historial
+    senders = [Indicativo(indicativo=f'M{count}-{i}', event_id=event_id) for i in range(count)]
+    db.session.add_all(senders)
+    db.session.flush()
+    db.session.add_all([
+        Message(event_id=event_id, indicativo_id=sender.id, content={'type': 'text', 'text': str(i)})
+        for i, sender in enumerate(senders)
+    ])
+    db.session.commit()
+    reader_id = senders[0].id
+    # Sesión vacía: nada de lo recién creado se sirve desde el mapa de identidad
+    db.session.remove()
+    return reader_id
+
+def _window_statements(event_id, count):
+    reader_id = _add_messages(event_id, count)
+    with count_queries() as statements:
+        messages, has_more = load_message_window(event_id, reader_id)
+        payload = [msg.to_dict() for msg in messages]
+    assert len(payload) == count
+    assert not has_more
+    return len(statements)
+
+def test_window_queries_do_not_grow_with_history(app, event):
+    event_id = event.id
+    small = _window_statements(event_id, 10)
+    Message.query.delete()
+    db.session.commit()
+    large = _window_statements(event_id, 500)
+    assert small == large
+
+def test_requested_limit_is_clamped(app, event):
+    app.config['MESSAGE_HISTORY_LIMIT'] = 3
+    event_id = event.id
+    reader_id = _add_messages(event_id, 10)
+    last_id = Message.query.order_by(Message.id.desc()).first().id
+    for requested, expected in ((-2, 1), (0, 3), ('2', 2), (50, 3)):
+        messages, has_more = load_message_window(event_id, reader_id, before_id=last_id + 1, limit=requested)
+        assert len(messages) == expected
+        assert has_more
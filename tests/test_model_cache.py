@@ -0,0 +1,23 @@
+"""Caché por proceso de eventos e indicativos (app/services/model_cache.py)"""
+from datetime import datetime
+
+from app.extensions import db
+from app.models import Event
+from app.services import model_cache
+
+def test_missing_event_is_not_cached(app, event):
+    missing_id = event.id + 1
+    assert model_cache.get_event(missing_id) is None
+    # Creado por otro worker (sin invalidar la caché de este proceso)
+    db.session.add(Event(id=missing_id, nombre='Otro', fecha=datetime.utcnow(), user_id=event.user_id))
+    db.session.commit()
+    assert model_cache.get_event(missing_id)['nombre'] == 'Otro'
+
+def test_created_event_is_visible_to_the_socket(app, event):
+    client = app.test_client()
+    assert model_cache.get_event(event.id + 1) is None
+    response = client.post('/events/api', json={'nombre': 'Nuevo', 'fecha': '2025-06-12 10:00:00'})
+    assert response.status_code == 201
+    created = response.get_json()['event']
+    assert created['id'] == event.id + 1
+    assert model_cache.get_event(created['id'])['nombre'] == 'Nuevo'
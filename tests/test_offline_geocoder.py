@@ -0,0 +1,80 @@
+"""Geocodificador local sobre el extracto de prueba tests/fixtures/offline_geocoder.geojson"""
+import os
+
+import pytest
+
+from app.services import offline_geocoder
+from app.services.offline_geocoder import OfflineGeocoder
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'offline_geocoder.geojson')
+MAX_DISTANCE = 75
+
+@pytest.fixture(scope='module')
+def geocoder():
+    return OfflineGeocoder.from_file(FIXTURE)
+
+def test_loads_addresses_and_road_segments(geocoder):
+    # Tres portales (uno de ellos un edificio), un tramo de la Diagonal y dos de Passeig de Gràcia
+    assert geocoder.addresses.size == 3
+    assert geocoder.roads.size == 3
+
+def test_reverse_returns_nearest_address(geocoder):
+    assert geocoder.reverse(41.40362, 2.17445, MAX_DISTANCE) == 'Carrer de Mallorca, 401'
+    assert geocoder.reverse(41.40398, 2.17495, MAX_DISTANCE) == 'Carrer de Mallorca, 403'
+
+def test_reverse_uses_building_centroid(geocoder):
+    assert geocoder.reverse(41.3950, 2.1600, MAX_DISTANCE) == 'Carrer de Provença, 250'
+
+def test_reverse_falls_back_to_road_without_nearby_address(geocoder):
+    # Sobre la Diagonal, lejos de cualquier portal
+    assert geocoder.reverse(41.3911, 2.1525, MAX_DISTANCE) == 'Avinguda Diagonal'
+    # Junto al segundo tramo de Passeig de Gràcia
+    assert geocoder.reverse(41.3950, 2.1626, MAX_DISTANCE) == 'Passeig de Gràcia'
+
+def test_reverse_out_of_range_returns_none(geocoder):
+    assert geocoder.reverse(41.5000, 2.3000, MAX_DISTANCE) is None
+    # A unos 80 m del portal más cercano (Mallorca, 403) y sin calles cerca: fuera del radio de 75 m
+    assert geocoder.reverse(41.4046, 2.1744, MAX_DISTANCE) is None
+
+def test_search_matches_all_words_ignoring_accents_and_case(geocoder):
+    results = geocoder.search('MALLORCA', 10)
+    assert [r['display_name'] for r in results] == ['Carrer de Mallorca, 401', 'Carrer de Mallorca, 403']
+    assert results[0]['lat'] == pytest.approx(41.4036)
+    assert results[0]['lng'] == pytest.approx(2.1744)
+    assert [r['display_name'] for r in geocoder.search('passeig gracia', 10)] == ['Passeig de Gràcia']
+    assert [r['display_name'] for r in geocoder.search('provença 250', 10)] == ['Carrer de Provença, 250']
+
+def test_search_ranks_prefix_matches_first_and_applies_limit(geocoder):
+    results = geocoder.search('carrer de mallorca, 403', 10)
+    assert results[0]['display_name'] == 'Carrer de Mallorca, 403'
+    assert len(geocoder.search('carrer', 1)) == 1
+
+def test_search_without_matches_or_words(geocoder):
+    assert geocoder.search('rambla', 10) == []
+    assert geocoder.search('  ', 10) == []
+
+def test_module_helpers_use_configured_file(app):
+    app.config['GEOCODING_OFFLINE_FILE'] = FIXTURE
+    assert offline_geocoder.reverse_geocode_offline('41.40362', '2.17445') == 'Carrer de Mallorca, 401'
+    assert [r['display_name'] for r in offline_geocoder.search_offline('diagonal', 5)] == ['Avinguda Diagonal']
+    app.config['GEOCODING_OFFLINE_FILE'] = ''
+    assert offline_geocoder.reverse_geocode_offline(41.40362, 2.17445) is None
+    assert offline_geocoder.search_offline('diagonal', 5) == []
+
+def test_search_endpoint_with_local_provider(app, event):
+    app.config['GEOCODING_OFFLINE_FILE'] = FIXTURE
+    app.config['GEOCODING_SEARCH_PROVIDER'] = 'local'
+    client = app.test_client()
+
+    def names(**params):
+        response = client.get(f'/events/{event.id}/geocode/search', query_string=params)
+        assert response.status_code == 200
+        return [r['display_name'] for r in response.get_json()['results']]
+
+    assert names(q='carrer de mallorca, 403')[0] == 'Carrer de Mallorca, 403'
+    assert len(names(q='carrer')) == 3
+    assert len(names(q='carrer', limit=2)) == 2
+    # limit no pasa de GEOCODING_SEARCH_MAX_RESULTS
+    app.config['GEOCODING_SEARCH_MAX_RESULTS'] = 1
+    assert len(names(q='carrer', limit=10)) == 1
+    assert client.get(f'/events/{event.id}/geocode/search').status_code == 400
@@ -0,0 +1,44 @@
+"""Índice de últimas posiciones y su tabla indicativo_positions (app/services/positions.py)"""
+from datetime import datetime, timedelta
+
+from app.extensions import db
+from app.models import IndicativoPosition, Indicativo, Message
+from app.services import model_cache, positions
+from conftest import count_queries
+
+def _indicativo(event_id):
+    indicativo = Indicativo.query.filter_by(event_id=event_id).order_by(Indicativo.id).first()
+    return model_cache.get_indicativo(event_id, indicativo.id)
+
+def test_coalesced_positions_are_saved_together(app, event):
+    event_id = event.id
+    indicativo = _indicativo(event_id)
+    with count_queries() as statements:
+        for i in range(20):
+            positions.save_position(event_id, indicativo, 41.0 + i / 1000, 2.0)
+    # Solo memoria: ni escrituras ni commits por ping
+    assert not [s for s in statements if not s.lstrip().upper().startswith('SELECT')]
+    assert positions.get_position(event_id, indicativo['id'])['lat'] == 41.019
+    assert positions.save_unsaved() == 1
+    row = IndicativoPosition.query.filter_by(event_id=event_id, indicativo_id=indicativo['id']).one()
+    assert row.lat == 41.019
+    assert positions.save_unsaved() == 0
+
+def test_insert_conflict_keeps_the_transaction_and_the_newer_row(app, event):
+    event_id = event.id
+    indicativo = _indicativo(event_id)
+    now = datetime.utcnow()
+    db.session.add(IndicativoPosition(event_id=event_id, indicativo_id=indicativo['id'], lat=1.0, lng=1.0, timestamp=now))
+    db.session.commit()
+    # Un mensaje con una posición más antigua (p. ej. de otro worker que la insertaba a la vez)
+    message = Message(event_id=event_id, indicativo_id=indicativo['id'], content={'type': 'location', 'lat': 2.0, 'lng': 2.0})
+    db.session.add(message)
+    positions.persist_position(event_id, indicativo['id'], 2.0, 2.0, None, now - timedelta(seconds=30))
+    db.session.commit()
+    assert Message.query.count() == 1
+    row = IndicativoPosition.query.filter_by(event_id=event_id, indicativo_id=indicativo['id']).one()
+    assert (row.lat, row.lng) == (1.0, 1.0)
+    # Una más reciente sí la sustituye
+    positions.persist_position(event_id, indicativo['id'], 3.0, 3.0, None, now + timedelta(seconds=30))
+    db.session.commit()
+    assert IndicativoPosition.query.filter_by(event_id=event_id, indicativo_id=indicativo['id']).one().lat == 3.0
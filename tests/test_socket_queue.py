@@ -0,0 +1,65 @@
+"""Sustituto local de la cola de Socket.IO entre procesos (socket_queue.SQLitePubSubManager)"""
+import pickle
+import queue
+import sqlite3
+import threading
+import time
+
+import socketio
+
+from app.services.socket_queue import SQLITE_PUBSUB_SCHEME, SQLitePubSubManager
+
+def _manager(path, channel='rcqevents', retention=60):
+    # write_only: sin la tarea de fondo que reparte a clientes conectados; el test lee con _listen()
+    manager = SQLitePubSubManager(SQLITE_PUBSUB_SCHEME + '/' + str(path), channel=channel,
+                                  write_only=True, poll_interval=0.01, retention=retention)
+    socketio.Server(client_manager=manager, async_mode='threading')
+    return manager
+
+def _start_listening(manager):
+    """Recoge en una cola lo que `manager` lee de la tabla, desde un hilo como el del servidor"""
+    received = queue.Queue()
+    started = threading.Event()
+
+    def consume():
+        listener = manager._listen()
+        started.set()
+        for payload in listener:
+            received.put(pickle.loads(payload))
+
+    threading.Thread(target=consume, daemon=True).start()
+    started.wait(1)
+    # La primera lectura fija el punto de partida: lo publicado antes no se entrega
+    time.sleep(0.1)
+    return received
+
+def test_publish_reaches_listen_on_another_manager(tmp_path):
+    db_path = tmp_path / 'queue.db'
+    publisher = _manager(db_path)
+    subscriber = _manager(db_path)
+    other_channel = _manager(db_path, channel='otro')
+    publisher.emit('new_message', {'id': 1}, namespace='/', room='chat_1_json')
+    received = _start_listening(subscriber)
+
+    other_channel.emit('new_message', {'id': 2}, namespace='/', room='chat_1_json')
+    publisher.emit('new_message', {'id': 3}, namespace='/', room='chat_1_json')
+    message = received.get(timeout=2)
+    assert message['method'] == 'emit'
+    assert message['event'] == 'new_message'
+    assert message['data'] == {'id': 3}
+    assert message['room'] == 'chat_1_json'
+    assert received.empty()
+
+def test_old_rows_are_purged(tmp_path):
+    db_path = tmp_path / 'queue.db'
+    publisher = _manager(db_path, retention=0.2)
+    publisher.emit('a', 1, namespace='/')
+    publisher.emit('b', 2, namespace='/')
+    time.sleep(0.3)
+    publisher.emit('c', 3, namespace='/')
+    conn = sqlite3.connect(str(db_path))
+    try:
+        rows = conn.execute('SELECT payload FROM socketio_pubsub').fetchall()
+    finally:
+        conn.close()
+    assert [pickle.loads(payload)['event'] for payload, in rows] == ['c']
@@ -0,0 +1,19 @@
+"""Arranque de las tareas de fondo (app.start_background_tasks)"""
+from app import create_app, start_background_tasks
+from app.services.geocoding import geocoding_queue
+from app.services.outbox import outbox_dispatcher
+from config import config
+
+def test_background_tasks_start_only_from_the_server_entrypoint(monkeypatch):
+    started = []
+    monkeypatch.setattr(config['testing'], 'BACKGROUND_TASKS_ON_STARTUP', True)
+    monkeypatch.setattr(outbox_dispatcher, 'start', lambda: started.append('outbox'))
+    monkeypatch.setattr(geocoding_queue, 'start', lambda: started.append('geocoding'))
+    # create_app también lo usa la CLI (flask db upgrade): no arranca nada
+    app = create_app('testing')
+    assert started == []
+    start_background_tasks(app)
+    assert started == ['outbox', 'geocoding']
+    app.config['BACKGROUND_TASKS_ON_STARTUP'] = False
+    start_background_tasks(app)
+    assert started == ['outbox', 'geocoding']
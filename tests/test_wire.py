@@ -0,0 +1,50 @@
+"""Emisión del chat por codificación (app/services/wire.py)"""
+import pytest
+
+from app.services import presence, wire
+
+class RecordingEmitter:
+    def __init__(self):
+        self.rooms = []
+
+    def emit(self, name, payload, room=None):
+        self.rooms.append(room)
+
+def _message(event_id, message_id, to_indicativo_id=None):
+    return {
+        'id': message_id, 'event_id': event_id, 'indicativo_id': 1, 'to_indicativo_id': to_indicativo_id,
+        'timestamp': '2025-06-12 10:00:00', 'content': {'type': 'text', 'text': 'hola'},
+        'indicativo': 'U0', 'nombre': 'Unidad 0', 'indicativo_color': None
+    }
+
+@pytest.fixture(autouse=True)
+def forget_sessions():
+    yield
+    presence._sessions.clear()
+
+def test_only_encodings_in_use_are_emitted(app, event):
+    app.config['SOCKETIO_COMPACT_ENCODING'] = True
+    emitter = RecordingEmitter()
+    wire.emit_new_messages([_message(event.id, 1), _message(event.id, 2, to_indicativo_id=2)], emitter)
+    assert emitter.rooms == []
+
+    presence.join('sid-json', event.id, 1, wire.JSON)
+    wire.emit_new_messages([_message(event.id, 1), _message(event.id, 2, to_indicativo_id=2)], emitter)
+    assert emitter.rooms == [wire.chat_room(event.id), wire.private_room(1, event.id), wire.private_room(2, event.id)]
+
+    emitter.rooms.clear()
+    presence.join('sid-msgpack', event.id, 2, wire.MSGPACK)
+    wire.emit_new_message(_message(event.id, 3), emitter)
+    assert emitter.rooms == [wire.chat_room(event.id), wire.chat_room(event.id, wire.MSGPACK)]
+
+    # La misma sesión vuelve a unirse pidiendo JSON: ya nadie usa MessagePack
+    emitter.rooms.clear()
+    presence.join('sid-msgpack', event.id, 2, wire.JSON)
+    wire.emit_new_message(_message(event.id, 4), emitter)
+    assert emitter.rooms == [wire.chat_room(event.id)]
+
+def test_json_only_without_compact_encoding(app, event):
+    app.config['SOCKETIO_COMPACT_ENCODING'] = False
+    emitter = RecordingEmitter()
+    wire.emit_new_message(_message(event.id, 1), emitter)
+    assert emitter.rooms == [wire.chat_room(event.id)]